@@ -3,6 +3,7 @@ from langchain_core.messages import HumanMessage, SystemMessage
 import fitz # PyMuPDF
 import os
 from dotenv import load_dotenv
+from app.tracing import span
 
 load_dotenv()
 
@@ -26,7 +27,8 @@ def chat_with_pdf(pdf_path: str, user_query: str) -> str:
     if not api_key:
         return "Error: GROQ_API_KEY not found in backend .env file."
         
-    pdf_text = extract_text_from_pdf(pdf_path)
+    with span("chat.extract_text"):
+        pdf_text = extract_text_from_pdf(pdf_path)
     
     if not pdf_text.strip():
         return "Could not extract readable text from this PDF. It might be scanned pages (requires OCR)."
@@ -49,7 +51,8 @@ def chat_with_pdf(pdf_path: str, user_query: str) -> str:
             HumanMessage(content=user_query),
         ]
         
-        response = chat.invoke(messages)
+        with span("chat.llm"):
+            response = chat.invoke(messages)
         return response.content
         
     except Exception as e:
@@ -0,0 +1,349 @@
+import os
+import time
+import shutil
+import fitz  # PyMuPDF
+import numpy as np
+from collections import namedtuple
+from multiprocessing.connection import wait
+from app.pdf_agent import run_iterative_pdf_compression, compress_pdf_bilevel, linearize_pdf, _compression_tier, _apply_recompressed
+from app.tracing import span, run_traced, current_trace
+
+# Compression Strategy Engine: the repo grew several compressors (the XREF recompressor,
+# the per-page get_images variant from ultra_aggressive_agent.py, the full-page
+# rasterisation "extreme mode" from early_pdf_agent_v0.py, the bilevel scan mode).
+# Each is registered here as a plugin fn(input_path, quality_slider, progress=None) -> path.
+#
+# strategy="auto" copies a few evenly spaced pages into a sample PDF and races every
+# plugin on it, one process each, under PDF_STRATEGY_BUDGET_S. At most the job's share
+# of the cores (executor.cpu_share) run at once, and each candidate gets that share
+# divided among them for its own fan-out; stragglers are killed. Each candidate's
+# sample pages are rendered next to the originals; the smallest output whose worst page
+# SSIM meets the slider's quality floor wins and is run on the whole document, unless
+# the sample already was the whole document, in which case its output is kept.
+# Strategies that drop the text layer are only eligible at slider <=
+# STRATEGY_RASTER_MAX_SLIDER. If nothing qualifies, the production XREF compressor runs.
+
+STRATEGY_SAMPLE_PAGES = int(os.getenv("PDF_STRATEGY_SAMPLE_PAGES", "4"))
+STRATEGY_TIME_BUDGET = float(os.getenv("PDF_STRATEGY_BUDGET_S", "20"))
+STRATEGY_RASTER_MAX_SLIDER = 30
+STRATEGY_RENDER_DPI = 72
+DEFAULT_STRATEGY = "xref"
+
+Strategy = namedtuple("Strategy", "name fn keeps_text")
+STRATEGIES = {}
+
+
+def register(name: str, keeps_text: bool = True):
+    """
+    Decorator: registers fn as a compression strategy. keeps_text=False marks
+    strategies whose output loses the searchable text layer.
+    """
+    def decorator(fn):
+        STRATEGIES[name] = Strategy(name, fn, keeps_text)
+        return fn
+    return decorator
+
+
+register("xref")(run_iterative_pdf_compression)
+register("bilevel")(compress_pdf_bilevel)
+
+
+@register("page_images")
+def compress_page_images(input_path: str, quality_slider: int, progress=None) -> str:
+    """
+    Per-page variant (ultra_aggressive_agent.py): every image is scaled to the width
+    of the page it sits on at the tier DPI and kept in colour.
+    """
+    out_path = input_path + "_pages.pdf"
+    if quality_slider <= 20: target_dpi, jpg_quality = 72, 25
+    elif quality_slider <= 50: target_dpi, jpg_quality = 120, 50
+    elif quality_slider <= 80: target_dpi, jpg_quality = 150, 70
+    else: target_dpi, jpg_quality = 200, 85
+
+    doc = fitz.open(input_path)
+    try:
+        done = set()
+        for number, page in enumerate(doc):
+            if progress:
+                progress(number, len(doc))
+            for item in page.get_images():
+                xref = item[0]
+                if xref in done:
+                    continue
+                done.add(xref)
+                try:
+                    pix = fitz.Pixmap(doc, xref)
+                    target_width = int(page.rect.width * target_dpi / 72)
+                    if pix.width > target_width:
+                        scale = target_width / pix.width
+                        pix = fitz.Pixmap(pix, int(pix.width * scale), int(pix.height * scale))
+                    if pix.n >= 4 or pix.alpha or pix.colorspace.name in ("DeviceCMYK", "Indexed"):
+                        pix = fitz.Pixmap(fitz.csRGB, pix, 0)
+                    with span("page_images.jpeg_encode"):
+                        img_bytes = pix.tobytes("jpeg", jpg_quality=jpg_quality)
+                    if len(img_bytes) < len(doc.xref_stream_raw(xref) or b""):
+                        _apply_recompressed(doc, xref, img_bytes)
+                except Exception as e:
+                    print(f"Skipping page image {xref}: {e}")
+        with span("page_images.save"):
+            doc.save(out_path, garbage=4, deflate=True, clean=True)
+    finally:
+        doc.close()
+    return linearize_pdf(out_path)
+
+
+@register("rasterize", keeps_text=False)
+def compress_rasterize(input_path: str, quality_slider: int, progress=None) -> str:
+    """
+    Extreme mode (early_pdf_agent_v0.py): every page becomes one JPEG plate at a DPI
+    scaled from the slider, grayscale below 30. Text is no longer selectable.
+    """
+    out_path = input_path + "_raster.pdf"
+    target_dpi = 72 + int(quality_slider / 100.0 * (300 - 72))
+    jpg_quality = _compression_tier(quality_slider)[1]
+    colorspace = fitz.csGRAY if quality_slider < 30 else fitz.csRGB
+    doc = fitz.open(input_path)
+    out = fitz.open()
+    try:
+        for number, page in enumerate(doc):
+            if progress:
+                progress(number, len(doc))
+            with span("rasterize.render"):
+                pix = page.get_pixmap(dpi=target_dpi, colorspace=colorspace)
+            with span("rasterize.jpeg_encode"):
+                img_bytes = pix.tobytes("jpeg", jpg_quality=jpg_quality)
+            plate = out.new_page(width=page.rect.width, height=page.rect.height)
+            plate.insert_image(plate.rect, stream=img_bytes)
+        with span("rasterize.save"):
+            out.save(out_path, garbage=4, deflate=True)
+    finally:
+        out.close()
+        doc.close()
+    return linearize_pdf(out_path)
+
+
+def _quality_floor(quality_slider: int) -> float:
+    # Worst-page SSIM (72 DPI grayscale render) a candidate must reach
+    return 0.55 + quality_slider * 0.004
+
+
+def _render(page):
+    pix = page.get_pixmap(dpi=STRATEGY_RENDER_DPI, colorspace=fitz.csGRAY)
+    return np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.height, pix.stride)[:, :pix.width]
+
+
+def _ssim(x: np.ndarray, y: np.ndarray, block: int = 8) -> float:
+    # Mean SSIM over non-overlapping 8x8 blocks. Unlike PSNR it barely moves when
+    # grey paper turns white (bilevel), but drops when edges blur or blocks appear.
+    h, w = (x.shape[0] // block) * block, (x.shape[1] // block) * block
+    if not h or not w:
+        return 1.0
+    shape = (h // block, block, w // block, block)
+    a = x[:h, :w].astype(np.float64).reshape(shape)
+    b = y[:h, :w].astype(np.float64).reshape(shape)
+    mu_a, mu_b = a.mean(axis=(1, 3)), b.mean(axis=(1, 3))
+    var_a, var_b = a.var(axis=(1, 3)), b.var(axis=(1, 3))
+    cov = (a * b).mean(axis=(1, 3)) - mu_a * mu_b
+    c1, c2 = (0.01 * 255) ** 2, (0.03 * 255) ** 2
+    ssim = ((2 * mu_a * mu_b + c1) * (2 * cov + c2)) / ((mu_a ** 2 + mu_b ** 2 + c1) * (var_a + var_b + c2))
+    return float(ssim.mean())
+
+
+def _worst_ssim(reference_path: str, candidate_path: str) -> float:
+    ref, cand = fitz.open(reference_path), fitz.open(candidate_path)
+    try:
+        if len(ref) != len(cand):
+            return 0.0
+        worst = 1.0
+        for a, b in zip(ref, cand):
+            x, y = _render(a), _render(b)
+            if x.shape != y.shape:
+                return 0.0
+            worst = min(worst, _ssim(x, y))
+        return worst
+    finally:
+        ref.close()
+        cand.close()
+
+
+def _sample_pages(input_path: str, sample_path: str) -> tuple:
+    # -> (sampled page count, total page count, sample has text)
+    src = fitz.open(input_path)
+    sample = fitz.open()
+    try:
+        total = len(src)
+        count = min(STRATEGY_SAMPLE_PAGES, total)
+        picks = sorted({round(i * (total - 1) / max(1, count - 1)) for i in range(count)})
+        has_text = any(src[number].get_text("text").strip() for number in picks)
+        if len(picks) == total:
+            # The whole document: race on an exact copy (outline, metadata, forms
+            # included) so the winner's output can be used as is
+            shutil.copyfile(input_path, sample_path)
+            return total, total, has_text
+        for number in picks:
+            sample.insert_pdf(src, from_page=number, to_page=number)
+        sample.save(sample_path, garbage=3)
+        return len(picks), total, has_text
+    finally:
+        sample.close()
+        src.close()
+
+
+def _run_candidate(name: str, sample_path: str, quality_slider: int, conn, share: int = 1):
+    # Child process: compress a private copy of the sample, score it, send the row back.
+    # A fresh process starts with the full CPU_COUNT share: cap it to the candidate's slice.
+    from app.executor import set_cpu_share, cpu_share
+    set_cpu_share(share)
+    try:
+        work_path = f"{sample_path}.{name}.pdf"
+        shutil.copyfile(sample_path, work_path)
+        started = time.perf_counter()
+        (out_path, stages) = run_traced(STRATEGIES[name].fn, (work_path, quality_slider), {})
+        seconds = time.perf_counter() - started
+        row = {
+            "status": "ok",
+            "path": out_path,
+            "bytes": os.path.getsize(out_path),
+            "seconds": seconds,
+            "ssim": round(_worst_ssim(sample_path, out_path), 4),
+            "cpu_share": cpu_share(),
+        }
+        conn.send((row, stages))
+    except Exception as e:
+        conn.send(({"status": "error", "error": str(e)}, {}))
+    finally:
+        conn.close()
+
+
+def race_strategies(input_path: str, quality_slider: int, names=None, budget: float = STRATEGY_TIME_BUDGET,
+                    keep_path: str = None) -> dict:
+    """
+    Races the registered strategies on sampled pages and picks a winner.
+    Returns the report: {"winner", "quality_floor_ssim", "sample_pages", "candidates": [...]}.
+    If the sample is the whole document and keep_path is given, the winner's output is
+    moved there instead of deleted and report["output_kept"] is True.
+    """
+    from app.executor import _get_context, cpu_share
+
+    names = list(names or STRATEGIES)
+    sample_path = input_path + ".sample.pdf"
+    ctx = _get_context()
+    concurrency = max(1, min(cpu_share(), len(names)))
+    share = max(1, cpu_share() // concurrency)
+    pending = list(names)
+    running = {}
+    rows = {}
+    kept = False
+    trace = current_trace()
+    started = time.perf_counter()
+    try:
+        with span("strategy.sample"):
+            sampled, total, has_text = _sample_pages(input_path, sample_path)
+        sample_bytes = os.path.getsize(sample_path)
+        input_bytes = os.path.getsize(input_path)
+
+        with span("strategy.race"):
+            deadline = started + budget
+            while pending or running:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                while pending and len(running) < concurrency:
+                    name = pending.pop(0)
+                    receiver, sender = ctx.Pipe(duplex=False)
+                    process = ctx.Process(target=_run_candidate, args=(name, sample_path, quality_slider, sender, share), daemon=True)
+                    process.start()
+                    sender.close()
+                    running[receiver] = (name, process)
+                for receiver in wait(list(running), timeout=remaining):
+                    name, process = running.pop(receiver)
+                    try:
+                        row, stages = receiver.recv()
+                    except EOFError:
+                        row, stages = {"status": "error", "error": "worker exited"}, {}
+                    if trace is not None:
+                        trace.merge(stages)
+                    rows[name] = row
+                    process.join(timeout=1)
+            for receiver, (name, process) in running.items():
+                process.terminate()
+                rows[name] = {"status": "timeout"}
+            # Never started before the budget ran out
+            for name in pending:
+                rows[name] = {"status": "timeout"}
+
+        floor = _quality_floor(quality_slider)
+        candidates = []
+        for name in names:
+            row = {"strategy": name, "keeps_text": STRATEGIES[name].keeps_text, **rows.get(name, {"status": "timeout"})}
+            row.pop("path", None)
+            candidates.append(row)
+        winner = _pick_winner(candidates, floor, quality_slider, has_text, sample_bytes, input_bytes, sampled, total)
+        if keep_path and sampled == total and rows.get(winner, {}).get("status") == "ok":
+            os.replace(rows[winner]["path"], keep_path)
+            kept = True
+    finally:
+        for receiver, (name, process) in list(running.items()):
+            process.join(timeout=1)
+        leftovers = [sample_path]
+        for name in names:
+            work_path = f"{sample_path}.{name}.pdf"
+            leftovers += [work_path] + _outputs(work_path)
+        for path in leftovers:
+            try: os.remove(path)
+            except OSError: pass
+
+    report = {
+        "winner": winner,
+        "quality_floor_ssim": round(floor, 3),
+        "sample_pages": sampled,
+        "total_pages": total,
+        "concurrency": concurrency,
+        "race_seconds": round(time.perf_counter() - started, 2),
+        "output_kept": kept,
+        "candidates": candidates,
+    }
+    print(f"🏁 Strategy race ({sampled}/{total} pages, {concurrency} at a time): winner {winner} | " + ", ".join(
+        f"{row['strategy']}={row.get('projected_bytes', 0) // 1024}KB/ssim {row.get('ssim', '-')}/{row['status']}"
+        for row in candidates
+    ))
+    return report
+
+
+def _pick_winner(candidates: list, floor: float, quality_slider: int, has_text: bool,
+                 sample_bytes: int, input_bytes: int, sampled: int, total: int) -> str:
+    # Fills in projections and eligibility per candidate row, returns the winning strategy
+    for row in candidates:
+        if row["status"] == "ok":
+            ratio = row["bytes"] / max(1, sample_bytes)
+            row["projected_bytes"] = int(ratio * input_bytes)
+            row["projected_seconds"] = round(row["seconds"] * total / max(1, sampled), 2)
+            row["seconds"] = round(row["seconds"], 3)
+            text_ok = row["keeps_text"] or not has_text or quality_slider <= STRATEGY_RASTER_MAX_SLIDER
+            row["eligible"] = text_ok and row["ssim"] >= floor
+        else:
+            row["eligible"] = False
+    eligible = [row for row in candidates if row["eligible"]]
+    return min(eligible, key=lambda row: row["projected_bytes"])["strategy"] if eligible else DEFAULT_STRATEGY
+
+
+def _outputs(work_path: str) -> list:
+    # Output files the strategies derive from their input path
+    return [work_path + suffix for suffix in ("_compressed.pdf", "_pages.pdf", "_raster.pdf")]
+
+
+def compress_pdf_auto(input_path: str, quality_slider: int, progress=None):
+    """
+    Races the strategies on a sample, runs the winner on the whole file (or keeps its
+    race output when the sample was the whole file).
+    Returns (output path, race report).
+    """
+    out_path = input_path + "_auto.pdf"
+    report = race_strategies(input_path, quality_slider, keep_path=out_path)
+    if not report["output_kept"]:
+        with span("strategy.apply"):
+            out_path = STRATEGIES[report["winner"]].fn(input_path, quality_slider, progress=progress)
+    elif progress:
+        progress(1, 1)
+    report["output_bytes"] = os.path.getsize(out_path)
+    return out_path, report
@@ -0,0 +1,294 @@
+import os
+import time
+import queue
+import asyncio
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from app.metrics import agent_runs, agent_latency
+from app.tracing import run_traced, current_trace
+
+# Execution Engine: CPU-bound agents (PyMuPDF rendering, Pillow encoding, OCR word metrics)
+# run in pre-forked worker processes instead of the shared anyio threadpool, so two
+# concurrent compressions land on two cores instead of interleaving under one GIL.
+#
+# Each job class gets its own pool so a 1000-page OCR run cannot starve thumbnails.
+# Pool sizes are configurable per class: EXECUTOR_POOL_PDF=4, EXECUTOR_POOL_OCR=1, ...
+# EXECUTOR_BACKEND=thread switches every class back to threads (local Windows debugging).
+# uvicorn --workers WEB_CONCURRENCY runs one engine per worker process, so each engine
+# sizes its pools from its share of the cores rather than all of them.
+
+WEB_CONCURRENCY = max(1, int(os.getenv("WEB_CONCURRENCY", "1") or 1))
+CPU_COUNT = max(1, (os.cpu_count() or 1) // WEB_CONCURRENCY)
+
+DEFAULT_POOL_SIZES = {
+    "pdf": CPU_COUNT,
+    "image": CPU_COUNT,
+    # Tesseract + 144 DPI page images are memory heavy, keep OCR narrow by default
+    "ocr": 1,
+}
+
+# Modules the forkserver imports once so every forked worker starts warm
+PRELOAD_MODULES = ["app.pdf_agent", "app.compress_strategies", "app.image_agent", "app.ocr_pdf_agent"]
+
+
+def _pool_size(job_class: str) -> int:
+    raw = os.getenv(f"EXECUTOR_POOL_{job_class.upper()}")
+    if raw:
+        try:
+            return max(1, int(raw))
+        except ValueError:
+            print(f"Invalid EXECUTOR_POOL_{job_class.upper()}={raw!r}, using default")
+    return DEFAULT_POOL_SIZES.get(job_class, 1)
+
+
+def _warmup():
+    return os.getpid()
+
+
+# Progress channel: agents call a ProgressReporter, which pushes (job_id, done, total)
+# onto a queue shared with the parent. A listener thread in the parent fans it out.
+_progress_queue = None
+
+# Cores a job may fan out over. A pool worker gets CPU_COUNT // pool size: the pool
+# already runs one job per core, so an agent that opens its own processes on top of
+# that (parallel XREF recompression, strategy races) would oversubscribe the machine.
+_cpu_share = CPU_COUNT
+
+
+def _init_worker(progress_queue, cpu_share=None):
+    global _progress_queue, _cpu_share
+    _progress_queue = progress_queue
+    if cpu_share is not None:
+        _cpu_share = cpu_share
+
+
+def cpu_share() -> int:
+    """
+    Processes the current job may use for its own fan-out (CPU_COUNT outside a pool).
+    """
+    return _cpu_share
+
+
+def set_cpu_share(share: int):
+    """
+    Sets cpu_share() for this process: a child an agent started itself (strategy race
+    candidates) inherits none of the pool worker's share.
+    """
+    global _cpu_share
+    _cpu_share = max(1, share)
+
+
+class ProgressReporter:
+    """
+    Picklable progress callback handed to agents: progress(done, total).
+    Safe to call from a pool worker process or thread, never blocks the agent.
+    """
+    def __init__(self, job_id: str):
+        self.job_id = job_id
+
+    def __call__(self, done: int, total: int):
+        if _progress_queue is None:
+            return
+        try:
+            _progress_queue.put_nowait((self.job_id, done, total))
+        except Exception:
+            pass
+
+
+def _get_context():
+    methods = multiprocessing.get_all_start_methods()
+    if "forkserver" in methods:
+        ctx = multiprocessing.get_context("forkserver")
+        ctx.set_forkserver_preload(PRELOAD_MODULES)
+        return ctx
+    return multiprocessing.get_context("spawn")
+
+
+class ProcessPoolBackend:
+    """
+    Pre-forked process pool. Workers are spawned at startup (not on first request)
+    so the first heavy upload doesn't pay the fork + import cost.
+    """
+    kind = "process"
+
+    def __init__(self, job_class: str, size: int):
+        self.job_class = job_class
+        self.size = size
+        self.pool = None
+
+    @staticmethod
+    def make_progress_queue():
+        return _get_context().Queue()
+
+    def start(self, progress_queue):
+        self.pool = ProcessPoolExecutor(
+            max_workers=self.size,
+            mp_context=_get_context(),
+            initializer=_init_worker,
+            initargs=(progress_queue, max(1, CPU_COUNT // self.size)),
+        )
+        # Force every worker to exist now
+        futures = [self.pool.submit(_warmup) for _ in range(self.size)]
+        pids = {f.result() for f in futures}
+        print(f"⚙️ Executor [{self.job_class}]: {len(pids)}/{self.size} worker processes ready")
+
+    def submit(self, fn, *args, **kwargs):
+        return self.pool.submit(fn, *args, **kwargs)
+
+    def shutdown(self):
+        if self.pool is not None:
+            self.pool.shutdown(wait=False, cancel_futures=True)
+            self.pool = None
+
+
+class ThreadPoolBackend:
+    """
+    In-process fallback. Same interface as ProcessPoolBackend, no pickling required.
+    """
+    kind = "thread"
+
+    def __init__(self, job_class: str, size: int):
+        self.job_class = job_class
+        self.size = size
+        self.pool = None
+
+    @staticmethod
+    def make_progress_queue():
+        return queue.Queue()
+
+    def start(self, progress_queue):
+        _init_worker(progress_queue)
+        self.pool = ThreadPoolExecutor(max_workers=self.size, thread_name_prefix=f"exec-{self.job_class}")
+
+    def submit(self, fn, *args, **kwargs):
+        return self.pool.submit(fn, *args, **kwargs)
+
+    def shutdown(self):
+        if self.pool is not None:
+            self.pool.shutdown(wait=False, cancel_futures=True)
+            self.pool = None
+
+
+BACKENDS = {
+    "process": ProcessPoolBackend,
+    "thread": ThreadPoolBackend,
+}
+
+
+class ExecutionEngine:
+    def __init__(self):
+        self.backend_name = os.getenv("EXECUTOR_BACKEND", "process").lower()
+        if self.backend_name not in BACKENDS:
+            print(f"Unknown EXECUTOR_BACKEND={self.backend_name!r}, falling back to 'process'")
+            self.backend_name = "process"
+        self.pools = {}
+        self.in_flight = {}
+        # agent function name -> calls currently queued or running
+        self.agents_in_flight = {}
+        self.progress_handlers = []
+        self.progress_queue = None
+        self._listener = None
+        self._lock = threading.Lock()
+
+    def register_backend(self, name: str, backend_cls):
+        BACKENDS[name] = backend_cls
+
+    def add_progress_handler(self, handler):
+        """
+        Registers handler(job_id, done, total), called from the listener thread.
+        """
+        self.progress_handlers.append(handler)
+
+    def _listen_progress(self, progress_queue):
+        while True:
+            item = progress_queue.get()
+            if item is None:
+                break
+            for handler in list(self.progress_handlers):
+                try:
+                    handler(*item)
+                except Exception as e:
+                    print(f"Progress handler error: {e}")
+
+    def _ensure_progress_channel(self):
+        if self.progress_queue is None:
+            self.progress_queue = BACKENDS[self.backend_name].make_progress_queue()
+            self._listener = threading.Thread(
+                target=self._listen_progress, args=(self.progress_queue,), daemon=True, name="exec-progress"
+            )
+            self._listener.start()
+        return self.progress_queue
+
+    def _get_pool(self, job_class: str):
+        with self._lock:
+            pool = self.pools.get(job_class)
+            if pool is None:
+                pool = BACKENDS[self.backend_name](job_class, _pool_size(job_class))
+                pool.start(self._ensure_progress_channel())
+                self.pools[job_class] = pool
+                self.in_flight.setdefault(job_class, 0)
+            return pool
+
+    def start(self, job_classes=None):
+        for job_class in job_classes or DEFAULT_POOL_SIZES:
+            self._get_pool(job_class)
+
+    def shutdown(self):
+        with self._lock:
+            for pool in self.pools.values():
+                pool.shutdown()
+            self.pools.clear()
+            if self.progress_queue is not None:
+                self.progress_queue.put(None)
+                self.progress_queue = None
+
+    async def run(self, job_class: str, fn, *args, **kwargs):
+        """
+        Runs fn(*args, **kwargs) on the pool for job_class and awaits the result
+        without blocking the event loop. fn and its arguments must be picklable.
+        Stage spans recorded inside fn are merged into the caller's trace.
+        """
+        pool = self._get_pool(job_class)
+        agent = getattr(fn, "__name__", "unknown")
+        with self._lock:
+            self.in_flight[job_class] += 1
+            self.agents_in_flight[agent] = self.agents_in_flight.get(agent, 0) + 1
+        outcome = "error"
+        start = time.perf_counter()
+        try:
+            future = pool.submit(run_traced, fn, args, kwargs)
+            result, stages = await asyncio.wrap_future(future)
+            trace = current_trace()
+            if trace is not None:
+                trace.merge(stages)
+            outcome = "ok"
+            return result
+        finally:
+            with self._lock:
+                self.in_flight[job_class] -= 1
+                self.agents_in_flight[agent] -= 1
+            agent_runs.inc(job_class, agent, outcome)
+            agent_latency.observe(time.perf_counter() - start, job_class, agent)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                job_class: {
+                    "backend": pool.kind,
+                    "size": pool.size,
+                    "in_flight": self.in_flight.get(job_class, 0),
+                }
+                for job_class, pool in self.pools.items()
+            }
+
+    def agent_stats(self) -> dict:
+        with self._lock:
+            return dict(self.agents_in_flight)
+
+
+engine = ExecutionEngine()
+
+
+async def run_in_pool(job_class: str, fn, *args, **kwargs):
+    return await engine.run(job_class, fn, *args, **kwargs)
@@ -4,6 +4,7 @@ from PIL import Image
 import numpy as np
 import tempfile
 import uuid
+from app.tracing import span
 
 def calculate_blur(image_path):
     """
@@ -55,7 +56,8 @@ def run_iterative_image_compression(input_path: str, target_kb: int) -> str:
             if new_w < 300 and target_kb > 10:
                 continue
 
-            temp_img = img.resize((new_w, new_h), Image.Resampling.LANCZOS).convert('RGB')
+            with span("image.resize"):
+                temp_img = img.resize((new_w, new_h), Image.Resampling.LANCZOS).convert('RGB')
             
             # Binary search for the best JPEG quality at this scale
             low = min_quality
@@ -67,7 +69,8 @@ def run_iterative_image_compression(input_path: str, target_kb: int) -> str:
                 test_name = f"scale_{scale}_q_{mid}.jpg"
                 temp_test_path = os.path.join(work_dir, test_name)
                 
-                temp_img.save(temp_test_path, "JPEG", quality=mid)
+                with span("image.jpeg_search"):
+                    temp_img.save(temp_test_path, "JPEG", quality=mid)
                 size = os.path.getsize(temp_test_path)
                 
                 if size <= target_bytes:
@@ -82,7 +85,8 @@ def run_iterative_image_compression(input_path: str, target_kb: int) -> str:
             eval_size = os.path.getsize(eval_path)
             
             if eval_size <= target_bytes:
-                score = calculate_blur(eval_path)
+                with span("image.blur_score"):
+                    score = calculate_blur(eval_path)
                 if score > best_blur_score:
                     best_blur_score = score
                     # Copy the new winner to a stable path outside the work_dir
@@ -0,0 +1,44 @@
+import os
+import hashlib
+import tempfile
+from fastapi import UploadFile
+from fastapi.concurrency import run_in_threadpool
+
+# Upload Ingestion: copies the spooled multipart upload to its own temp file in 1 MB
+# chunks on a worker thread, so a 100 MB PDF never blocks the event loop (and the
+# /ws/drop relay with it). SHA-256 and size are computed in the same pass, which is
+# what the result cache and admission checks consume — no second read of the file.
+
+INGEST_CHUNK = 1024 * 1024
+
+
+class IngestedFile:
+    def __init__(self, path: str, size: int, sha256: str, filename: str):
+        self.path = path
+        self.size = size
+        self.sha256 = sha256
+        self.filename = filename
+
+
+def _stream_to_disk(src, suffix: str, dir: str = None):
+    h = hashlib.sha256()
+    size = 0
+    src.seek(0)
+    with tempfile.NamedTemporaryFile(delete=False, suffix=suffix, dir=dir) as tmp:
+        while True:
+            chunk = src.read(INGEST_CHUNK)
+            if not chunk:
+                break
+            h.update(chunk)
+            tmp.write(chunk)
+            size += len(chunk)
+        return tmp.name, size, h.hexdigest()
+
+
+async def ingest_upload(file: UploadFile, suffix: str = "", dir: str = None) -> IngestedFile:
+    """
+    Streams an UploadFile to a NamedTemporaryFile off the event loop.
+    Returns the temp path together with its byte size and SHA-256.
+    """
+    path, size, digest = await run_in_threadpool(_stream_to_disk, file.file, suffix, dir)
+    return IngestedFile(path, size, digest, file.filename or os.path.basename(path))
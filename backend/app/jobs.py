@@ -0,0 +1,259 @@
+import os
+import re
+import json
+import time
+import uuid
+import asyncio
+import tempfile
+import threading
+
+from app.executor import engine, ProgressReporter
+from app.workspace import workspaces
+from app.tracing import start_trace, end_trace
+from app.metrics import record_trace
+
+# Async Job Subsystem: long conversions (1000-page books) are submitted, the POST returns
+# a job id immediately, and the client polls status/result instead of holding the socket
+# open past the proxy timeout. Finished results are kept for JOB_RESULT_TTL seconds.
+#
+# With uvicorn --workers the poll can land on any worker, so the owning worker mirrors
+# each job's state to JOB_STATE_DIR/<id>.json and the others answer from that file.
+
+JOB_RESULT_TTL = int(os.getenv("JOB_RESULT_TTL", "3600"))
+JOB_SWEEP_INTERVAL = 60
+JOB_STATE_DIR = os.getenv("JOB_STATE_DIR", os.path.join(tempfile.gettempdir(), "pdfninja-jobs"))
+# Per-page progress is written at most this often
+JOB_STATE_FLUSH_INTERVAL = 0.5
+
+_JOB_ID = re.compile(r"[0-9a-f]{32}")
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+
+
+class Job:
+    def __init__(self, kind: str, filename: str):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.filename = filename
+        self.status = QUEUED
+        self.done = 0
+        self.total = 0
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.error = None
+        # File results: {"path", "media_type", "filename"[, "report"]}; JSON results: {"data"}
+        self.result = None
+        # Request workspace holding the upload and output, released when the job expires
+        self.workspace = None
+        # Stage timings from the agent's spans, filled in when the job finishes
+        self.timings = None
+        self.flushed_at = 0.0
+
+    def state(self) -> dict:
+        return {
+            "id": self.id, "kind": self.kind, "filename": self.filename, "status": self.status,
+            "done": self.done, "total": self.total, "created_at": self.created_at,
+            "started_at": self.started_at, "finished_at": self.finished_at, "error": self.error,
+            "result": self.result, "timings": self.timings,
+        }
+
+    @classmethod
+    def from_state(cls, state: dict) -> "Job":
+        """
+        Read-only copy of a job owned by another worker (no workspace, never swept here).
+        """
+        job = cls(state["kind"], state["filename"])
+        for name, value in state.items():
+            setattr(job, name, value)
+        return job
+
+    def to_dict(self) -> dict:
+        percent = round(100.0 * self.done / self.total, 1) if self.total else (100.0 if self.status == DONE else 0.0)
+        info = {
+            "job_id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "progress": {"done": self.done, "total": self.total, "percent": percent},
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+        if self.status == FAILED:
+            info["error"] = self.error
+        if self.finished_at:
+            info["expires_at"] = self.finished_at + JOB_RESULT_TTL
+        if self.timings:
+            info["timings"] = self.timings
+        if self.status == DONE and (self.result or {}).get("report"):
+            info["report"] = self.result["report"]
+        return info
+
+
+class JobManager:
+    def __init__(self, state_dir: str = JOB_STATE_DIR):
+        self.jobs: dict[str, Job] = {}
+        self.state_dir = state_dir
+        self._sweeper = None
+        # Running job tasks: the event loop only keeps weak references to tasks
+        self._tasks: set[asyncio.Task] = set()
+        self._lock = threading.Lock()
+        os.makedirs(self.state_dir, exist_ok=True)
+        engine.add_progress_handler(self._on_progress)
+
+    def _state_path(self, job_id: str) -> str:
+        return os.path.join(self.state_dir, job_id + ".json")
+
+    def _flush(self, job: Job):
+        """
+        Atomically rewrites the job's state file. Blocking, but the file is tiny.
+        """
+        with self._lock:
+            state = json.dumps(job.state(), default=str)
+            job.flushed_at = time.time()
+        fd, tmp_path = tempfile.mkstemp(dir=self.state_dir, prefix=".incoming-")
+        try:
+            with os.fdopen(fd, "w") as f:
+                f.write(state)
+            os.replace(tmp_path, self._state_path(job.id))
+        except OSError as e:
+            print(f"Job state write error ({job.id}): {e}")
+            try: os.remove(tmp_path)
+            except OSError: pass
+
+    def _load(self, job_id: str):
+        try:
+            with open(self._state_path(job_id)) as f:
+                return Job.from_state(json.load(f))
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def _hold(self, job: Job, until: float):
+        if job.workspace is not None:
+            try:
+                workspaces.hold(job.workspace, until)
+            except OSError as e:
+                print(f"Job workspace hold error ({job.id}): {e}")
+
+    def _on_progress(self, job_id: str, done: int, total: int):
+        job = self.jobs.get(job_id)
+        if job is not None and job.status == RUNNING:
+            job.done, job.total = done, total
+            # Runs on the executor's listener thread, so the write stays off the event loop
+            if time.time() - job.flushed_at >= JOB_STATE_FLUSH_INTERVAL:
+                self._flush(job)
+
+    async def submit(self, kind: str, filename: str, job_class: str, fn, args: tuple, make_result, workspace=None) -> Job:
+        """
+        Schedules fn(*args, progress=...) on the job_class pool and returns as soon as
+        the job's state is on disk, without waiting for the run.
+        make_result(return_value) turns the agent's return value into Job.result;
+        it runs in a worker thread so it may do blocking I/O (e.g. result caching).
+        """
+        job = Job(kind, filename)
+        job.workspace = workspace
+        self.jobs[job.id] = job
+        # On disk before the 202 goes out, whichever worker gets the first poll.
+        # The hold covers the run; it is extended to the result's expiry when it finishes.
+        await asyncio.to_thread(self._hold, job, job.created_at + JOB_RESULT_TTL)
+        await asyncio.to_thread(self._flush, job)
+        task = asyncio.create_task(self._run(job, job_class, fn, args, make_result))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return job
+
+    async def _run(self, job: Job, job_class: str, fn, args: tuple, make_result):
+        job.status = RUNNING
+        job.started_at = time.time()
+        # The job outlives the POST that created it, so it gets its own trace
+        trace, token = start_trace()
+        await asyncio.to_thread(self._flush, job)
+        try:
+            value = await engine.run(job_class, fn, *args, progress=ProgressReporter(job.id))
+            job.result = await asyncio.to_thread(make_result, value)
+            job.status = DONE
+            if job.total:
+                job.done = job.total
+        except Exception as e:
+            print(f"Job {job.id} ({job.kind}) failed: {e}")
+            job.error = str(e)
+            job.status = FAILED
+        finally:
+            end_trace(token)
+            record_trace(trace)
+            job.timings = trace.to_list()
+            job.finished_at = time.time()
+            await asyncio.to_thread(self._hold, job, job.finished_at + JOB_RESULT_TTL)
+            await asyncio.to_thread(self._flush, job)
+
+    def complete(self, kind: str, filename: str, result: dict, workspace=None) -> Job:
+        """
+        Registers an already-finished job (e.g. served from the result cache).
+        A file result must live in workspace, which the job then owns. Blocking.
+        """
+        job = Job(kind, filename)
+        job.status = DONE
+        job.started_at = job.finished_at = time.time()
+        job.result = result
+        job.workspace = workspace
+        self.jobs[job.id] = job
+        self._hold(job, job.finished_at + JOB_RESULT_TTL)
+        self._flush(job)
+        return job
+
+    def get(self, job_id: str):
+        """
+        Local jobs first, then jobs other workers have written to the state dir.
+        Blocking on a local miss: call from a threadpool.
+        """
+        job = self.jobs.get(job_id)
+        if job is not None or not _JOB_ID.fullmatch(job_id):
+            return job
+        job = self._load(job_id)
+        if job is not None and job.finished_at and time.time() - job.finished_at > JOB_RESULT_TTL:
+            return None
+        return job
+
+    def sweep(self):
+        now = time.time()
+        expired = [
+            job for job in list(self.jobs.values())
+            if job.finished_at and now - job.finished_at > JOB_RESULT_TTL
+        ]
+        for job in expired:
+            self.jobs.pop(job.id, None)
+            try: os.remove(self._state_path(job.id))
+            except OSError: pass
+            path = (job.result or {}).get("path")
+            if path and os.path.exists(path):
+                try: os.remove(path)
+                except OSError: pass
+            if job.workspace is not None:
+                workspaces.release(job.workspace)
+        if expired:
+            print(f"🧹 Job sweep: expired {len(expired)} finished jobs")
+        # State files left behind by workers that died before expiring their jobs
+        for name in os.listdir(self.state_dir):
+            path = os.path.join(self.state_dir, name)
+            try:
+                if now - os.path.getmtime(path) > 2 * JOB_RESULT_TTL:
+                    os.remove(path)
+            except OSError:
+                continue
+
+    async def _sweep_forever(self):
+        while True:
+            await asyncio.sleep(JOB_SWEEP_INTERVAL)
+            await asyncio.to_thread(self.sweep)
+
+    def start(self):
+        if self._sweeper is None:
+            self._sweeper = asyncio.create_task(self._sweep_forever())
+
+    def stop(self):
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+            self._sweeper = None
+
+
+jobs = JobManager()
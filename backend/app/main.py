@@ -2,19 +2,18 @@
 from fastapi import FastAPI, UploadFile, File, Form, HTTPException, WebSocket, WebSocketDisconnect, Request
 from starlette.websockets import WebSocketState
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse, JSONResponse
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse
 import stripe
-import tempfile
 import os
-import shutil
 import json
 import asyncio
 
-from app.pdf_agent import run_iterative_pdf_compression, organize_pdf, extract_pdf_thumbnails, images_to_pdf, split_pdf, pdf_to_word, office_to_pdf, unlock_pdf, repair_pdf
+from app.pdf_agent import run_iterative_pdf_compression, compress_pdf_bilevel, compress_pdf_within_deadline, compress_pdf_variants, parse_variants, compress_pdf_to_target, estimate_pdf_compression, organize_pdf, extract_pdf_thumbnails, images_to_pdf, split_pdf, pdf_to_word, office_to_pdf, unlock_pdf, repair_pdf
 from app.ocr_agent import extract_text_from_image
 from app.ocr_pdf_agent import process_ocr_pdf, extract_edited_pdf
 from app.chat_agent import chat_with_pdf
 from app.image_agent import run_iterative_image_compression
+from app.compress_strategies import STRATEGIES, compress_pdf_auto
 import hashlib
 from datetime import datetime
 import httpx
@@ -22,13 +21,22 @@ import uvicorn
 import functools
 import sys
 from fastapi.concurrency import run_in_threadpool
-
-# ENTERPRISE SCALING HACK — DISABLED
-# WebSocket rooms use in-memory state (manager.rooms).
-# Multiple workers each have ISOLATED memory — sender on worker 1 and receiver on worker 2
-# can NEVER find each other in the rooms dict. This causes 75% of transfers to fail silently.
-# For WebSocket-based room communication, a SINGLE worker is required.
-# To scale, use Redis pub/sub for cross-worker room sharing (future improvement).
+from app.executor import engine, run_in_pool
+from app.jobs import jobs, DONE, FAILED
+from app.result_cache import result_cache, normalize_ranges, normalize_order
+from app.ingest import ingest_upload
+from app.workspace import workspaces
+from app.usage_store import UsageStore
+from app.room_broker import create_broker
+from app.relay import CreditSignal, OutboundQueue, RelayCredit, RoomStats, RELAY_STALL_TIMEOUT
+from app.metrics import registry, MetricsMiddleware
+import anyio
+
+# ENTERPRISE SCALING — ROOM BROKER
+# manager.rooms only holds the sockets owned by THIS worker. Every relayed frame goes
+# through a room broker (app/room_broker.py), so a sender on worker 1 and a receiver on
+# worker 2 still find each other. The default in-process broker keeps the old
+# single-worker behaviour; set ROOM_BROKER=redis (or loopback) before raising --workers.
 # ==========================================
 
 # Force unbuffered output globally for Render live logs visibility
@@ -36,6 +44,23 @@ print = functools.partial(print, flush=True)
 
 app = FastAPI(title="PDF Ninja Intelligent Backend")
 
+@app.on_event("startup")
+async def start_execution_engine():
+    # Pre-fork the agent process pools before the first upload arrives
+    await run_in_threadpool(engine.start)
+    # The anyio limiter behind run_in_threadpool, read by the /metrics collector
+    app.state.threadpool_limiter = anyio.to_thread.current_default_thread_limiter()
+    jobs.start()
+    workspaces.start()
+    await manager.broker.start()
+
+@app.on_event("shutdown")
+async def stop_execution_engine():
+    jobs.stop()
+    workspaces.stop()
+    await manager.broker.stop()
+    engine.shutdown()
+
 @app.get("/")
 async def root_probe():
     return {"status": "online", "message": "PDF Ninja Intelligent Backend - Ready"}
@@ -45,6 +70,65 @@ async def root_probe():
 async def health_check():
     return {"status": "healthy", "version": "v02.2.49", "engine": "PDF Ninja Intelligent Backend"}
 
+# -----------------------------------------------------------------------
+# METRICS (Prometheus text format, scrape GET /metrics)
+# Request counters/latency are recorded by MetricsMiddleware; everything below is read
+# from the live objects at scrape time, so it costs nothing between scrapes.
+# -----------------------------------------------------------------------
+
+app.add_middleware(MetricsMiddleware)
+
+
+@registry.collect
+def _collect_pools():
+    for job_class, s in engine.stats().items():
+        labels = {"job_class": job_class, "backend": s["backend"]}
+        yield "pdfninja_pool_workers", "Workers per execution pool", labels, s["size"]
+        yield "pdfninja_pool_in_flight", "Agent calls queued or running per pool", labels, s["in_flight"]
+        yield "pdfninja_pool_utilization", "in_flight / workers, capped at 1", labels, min(1.0, s["in_flight"] / max(1, s["size"]))
+    for agent, n in engine.agent_stats().items():
+        yield "pdfninja_agent_in_flight", "Agent calls queued or running", {"agent": agent}, n
+    limiter = getattr(app.state, "threadpool_limiter", None)
+    if limiter is not None:
+        yield "pdfninja_threadpool_busy", "anyio threadpool tokens in use", None, limiter.borrowed_tokens
+        yield "pdfninja_threadpool_size", "anyio threadpool capacity", None, limiter.total_tokens
+
+
+@registry.collect
+def _collect_storage():
+    ws = workspaces.stats()
+    yield "pdfninja_workspace_bytes", "Bytes under the request workspace root", None, ws["bytes"]
+    yield "pdfninja_workspace_active", "Live request workspaces", None, ws["active"]
+    yield "pdfninja_disk_free_bytes", "Free bytes on the workspace volume", None, ws["disk_free_bytes"]
+    rc = result_cache.stats()
+    yield "pdfninja_result_cache_bytes", "Result cache size", None, rc["bytes"]
+    yield "pdfninja_result_cache_entries", "Result cache entries", None, rc["entries"]
+    yield "pdfninja_result_cache_hits", "Result cache hits since start", None, rc["hits"]
+    yield "pdfninja_result_cache_misses", "Result cache misses since start", None, rc["misses"]
+    yield "pdfninja_result_cache_hit_ratio", "Result cache hit rate since start", None, rc["hit_rate"]
+
+
+@registry.collect
+def _collect_realtime():
+    yield "pdfninja_ws_rooms", "/ws/drop rooms with a socket on this worker", None, len(manager.rooms)
+    yield "pdfninja_ws_sockets", "/ws/drop sockets on this worker", None, sum(len(r) for r in manager.rooms.values())
+    rooms = manager.relay_stats().values()
+    yield "pdfninja_relay_bytes_per_second", "Relay throughput into local sockets", None, sum(r["bytes_per_sec"] for r in rooms)
+    yield "pdfninja_relay_queue_bytes", "Bytes waiting in relay outbound queues", None, sum(r["queue_bytes"] for r in rooms)
+    by_status = {}
+    for job in list(jobs.jobs.values()):
+        by_status[job.status] = by_status.get(job.status, 0) + 1
+    for status, n in by_status.items():
+        yield "pdfninja_jobs", "Async jobs held by the job manager", {"status": status}, n
+
+
+@app.get("/metrics")
+async def metrics():
+    # Collectors walk the workspace dir, keep that off the event loop
+    body = await run_in_threadpool(registry.render)
+    return PlainTextResponse(body, media_type="text/plain; version=0.0.4")
+
+
 @app.post("/api/diagnostics/upload")
 async def upload_diagnostics(data: dict):
     room_id = data.get("room_id")
@@ -59,6 +143,12 @@ async def upload_diagnostics(data: dict):
     return {"status": "error", "message": "Missing room_id"}
 
 
+@app.get("/api/relay/stats")
+async def relay_stats():
+    # Per-room throughput and outbound queue depth for sockets on THIS worker
+    return {"broker": manager.broker.name, "rooms": manager.relay_stats()}
+
+
 @app.get("/api/diagnostics/{room_id}")
 async def fetch_diagnostics(room_id: str):
     # Returns { "send": [...], "receive": [...] } if available
@@ -77,6 +167,7 @@ app.add_middleware(
     allow_credentials=False,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing", "X-Compression-Report", "X-Compression-Coverage", "X-Compression-Images", "X-Deadline-Hit"],
 )
 
 # Paddle Configuration
@@ -86,42 +177,132 @@ FRONTEND_URL = os.getenv("FRONTEND_URL", "https://www.swap-pdf.com")
 
 class ConnectionManager:
     def __init__(self):
-        # Maps room_id -> {"sender": WebSocket, "receiver": WebSocket}
+        # Maps room_id -> {"sender": WebSocket, "receiver": WebSocket} (sockets on THIS worker)
         self.rooms: dict[str, dict[str, WebSocket]] = {}
         # v02.2.48: Forensic Diagnostic Storage (RoomID -> ClientType -> Logs)
         self.diagnostics: dict[str, dict[str, list[str]]] = {}
-
-
+        # Cross-worker frame routing (ROOM_BROKER=memory|redis|loopback)
+        self.broker = create_broker()
+        # (room_id, client_type) -> (websocket, deliver, OutboundQueue) for local sockets
+        self.deliveries = {}
+        # (room_id, client_type) -> RelayCredit gating the frames that local socket produces
+        self.credits: dict[tuple, RelayCredit] = {}
+        # (room_id, client_type) -> CreditSignal publishing that local socket's queue pressure
+        self.credit_signals: dict[tuple, CreditSignal] = {}
+        # room_id -> RoomStats (bytes relayed into this worker's sockets)
+        self.room_stats: dict[str, RoomStats] = {}
+
+    def _make_delivery(self, websocket: WebSocket, room_id: str, client_type: str):
+        stats = self.room_stats.setdefault(room_id, RoomStats())
+        other = "receiver" if client_type == "sender" else "sender"
+
+        def on_pressure(paused: bool, queued_bytes: int):
+            # Credit signal to the peer producing the frames. Published from the signal's
+            # task: it fires inside put()/put_nowait(), which must not wait on the broker.
+            credit = max(0, outbox.max_bytes - queued_bytes)
+            signal.update({"type": "relay-credit", "paused": paused, "credit": credit, "queued": queued_bytes})
+
+        signal = CreditSignal(lambda message: self.send_message(message, room_id, other))
+        outbox = OutboundQueue(websocket, stats, on_pressure)
+        credit = RelayCredit()
+
+        async def deliver(kind: str, payload):
+            if kind == "json" and isinstance(payload, dict) and payload.get("type") in ("relay-credit", "peer-disconnected"):
+                # The peer's queue state gates this socket's receive loop (see relay_credit)
+                credit.update(bool(payload.get("paused")))
+            if self.broker.blocking_delivery:
+                # In-process: waits while the outbound queue is full, which holds up the
+                # sender's receive loop (backpressure instead of drop-on-timeout)
+                queued = await outbox.put(kind, payload)
+            else:
+                # Shared broker read loop: never wait, the sender is paused by relay-credit
+                queued = outbox.put_nowait(kind, payload)
+            if not queued:
+                print(f"Delivery SKIPPED: {client_type} in {room_id} is closed (state={websocket.client_state})")
+        return deliver, outbox, credit, signal
 
     async def connect(self, websocket: WebSocket, room_id: str, client_type: str):
+        # Join the broker before accepting so the peer (possibly on another worker)
+        # can reach this socket as soon as the client sees the handshake complete.
+        # Frames arriving before accept() wait in the outbound queue.
+        deliver, outbox, credit, signal = self._make_delivery(websocket, room_id, client_type)
+        previous = self.deliveries.get((room_id, client_type))
+        if previous is not None:
+            previous[2].stop()
+            self.credit_signals[(room_id, client_type)].stop()
+        self.deliveries[(room_id, client_type)] = (websocket, deliver, outbox)
+        self.credits[(room_id, client_type)] = credit
+        self.credit_signals[(room_id, client_type)] = signal
+        await self.broker.join(room_id, client_type, deliver)
         await websocket.accept()
+        outbox.start()
         if room_id not in self.rooms:
             self.rooms[room_id] = {}
         self.rooms[room_id][client_type] = websocket
 
-    def disconnect(self, websocket: WebSocket, room_id: str, client_type: str):
+    async def disconnect(self, websocket: WebSocket, room_id: str, client_type: str):
         if room_id in self.rooms and client_type in self.rooms[room_id]:
             if self.rooms[room_id][client_type] == websocket:
                 del self.rooms[room_id][client_type]
             if not self.rooms[room_id]:
                 del self.rooms[room_id]
+        owner = self.deliveries.get((room_id, client_type))
+        if owner is not None and owner[0] == websocket:
+            del self.deliveries[(room_id, client_type)]
+            self.credits.pop((room_id, client_type), None)
+            owner[2].stop()
+            self.credit_signals.pop((room_id, client_type)).stop()
+            await self.broker.leave(room_id, client_type, owner[1])
+        if room_id not in self.rooms:
+            self.room_stats.pop(room_id, None)
 
     def is_connected(self, websocket: WebSocket):
         return websocket.client_state == WebSocketState.CONNECTED
 
+    def relay_stats(self) -> dict:
+        rooms = {}
+        for (room_id, client_type), (_, _, outbox) in list(self.deliveries.items()):
+            room = rooms.setdefault(room_id, {"clients": {}})
+            room["clients"][client_type] = outbox.stats()
+        for room_id, room in rooms.items():
+            stats = self.room_stats.get(room_id) or RoomStats()
+            room["bytes_per_sec"] = round(stats.bytes_per_sec(), 1)
+            room["bytes_relayed"] = stats.bytes
+            room["frames_relayed"] = stats.frames
+            room["queue_bytes"] = sum(c["queue_bytes"] for c in room["clients"].values())
+        return rooms
+
+    async def relay_credit(self, room_id: str, client_type: str):
+        """
+        Waits while the peer's outbound queue has paused this socket's frames. Holding
+        the receive loop here lets TCP push back on the client, whichever worker the
+        peer is on and whether or not the client handles relay-credit itself.
+        """
+        credit = self.credits.get((room_id, client_type))
+        if credit is not None and not await credit.wait():
+            print(f"Relay credit: {client_type} in {room_id} still paused after {RELAY_STALL_TIMEOUT}s, resuming")
+
+    async def relay(self, message: dict, room_id: str, to_client: str) -> int:
+        """
+        Forwards a raw websocket.receive() message to the peer, wherever it's connected.
+        Returns the number of sockets it reached (0 = peer not connected, dropped).
+        """
+        if "text" in message and message["text"]:
+            return await self.broker.publish(room_id, to_client, "text", message["text"])
+        if "bytes" in message and message["bytes"]:
+            return await self.broker.publish(room_id, to_client, "bytes", message["bytes"])
+        return 0
+
     async def send_message(self, message: dict, room_id: str, to_client: str):
-        if room_id in self.rooms and to_client in self.rooms[room_id]:
-            ws = self.rooms[room_id][to_client]
-            if self.is_connected(ws):
-                try:
-                    await asyncio.wait_for(ws.send_json(message), timeout=10.0)
-                    print(f"Sent {message.get('type')} to {to_client} in room {room_id}")
-                except Exception as e:
-                    print(f"send_message FAILED ({message.get('type')} -> {to_client} in {room_id}): {e}")
-            else:
-                print(f"send_message SKIPPED: {to_client} in {room_id} is not CONNECTED (state={ws.client_state})")
+        try:
+            delivered = await self.broker.publish(room_id, to_client, "json", message)
+        except Exception as e:
+            print(f"send_message FAILED ({message.get('type')} -> {to_client} in {room_id}): {e}")
+            return
+        if delivered:
+            print(f"Sent {message.get('type')} to {to_client} in room {room_id}")
         else:
-            print(f"send_message SKIPPED: {to_client} not in room {room_id} (rooms={list(self.rooms.keys())})")
+            print(f"send_message SKIPPED: {to_client} not in room {room_id} (local rooms={list(self.rooms.keys())})")
 
 manager = ConnectionManager()
 
@@ -147,8 +328,7 @@ async def get_turn_servers(
     usage_allowed = True
     if not is_pro:
         key = tracker.get_key(request, deviceId)
-        today = datetime.now().strftime("%Y-%m-%d")
-        count = tracker.data.get(today, {}).get(key, 0)
+        count = await run_in_threadpool(tracker.store.get_count, key)
         
         # Enforce exactly 5 free TURN accesses per day
         if count >= 5: 
@@ -210,10 +390,13 @@ class UsageTracker:
     def __init__(self):
         # Use absolute path to ensure reliability across CWD changes
         base_dir = os.path.dirname(os.path.abspath(__file__))
-        self.usage_file = os.path.join(base_dir, "usage_log.json")
+        self.usage_file = os.path.join(base_dir, "usage_log.json") # Legacy, migrated on startup
+        self.usage_db = os.getenv("USAGE_DB_PATH", os.path.join(base_dir, "usage.db"))
         self.pro_file = os.path.join(base_dir, "..", "pro_users.json") # One level up in backend/
         
-        self.data = self._load(self.usage_file)
+        # Daily counters live in SQLite (WAL) so they're shared across workers
+        self.store = UsageStore(self.usage_db)
+        self.store.import_json(self.usage_file)
         self.pro_users = self._load(self.pro_file)
         
         # Hardcoded Fail-safe Whitelist (matches pro-whitelist.ts)
@@ -245,7 +428,7 @@ class UsageTracker:
         # Hash IP + Device ID to create a unique tracker
         return hashlib.sha256(f"{ip}:{device_id}".encode()).hexdigest()
 
-    def check_and_record(self, key: str, device_id: str = "", email: str = ""):
+    async def check_and_record(self, key: str, device_id: str = "", email: str = ""):
         # Skip limits for Pro users (Check raw device ID or Email whitelist)
         email_norm = email.lower().strip() if email else ""
         if (device_id and device_id in self.pro_users) or \
@@ -253,19 +436,9 @@ class UsageTracker:
            (email_norm and email_norm in self.HARDCODED_PRO):
             return True, 0
             
-        today = datetime.now().strftime("%Y-%m-%d")
-        if today not in self.data:
-            self.data[today] = {}
-        
-        count = self.data[today].get(key, 0)
         limit = 5
-        
-        if count >= limit:
-            return False, count
-            
-        self.data[today][key] = count + 1
-        self._save(self.usage_file, self.data)
-        return True, count + 1
+        # Atomic "increment unless at limit", group-committed off the event loop
+        return await self.store.check_and_increment(key, limit)
 
     def make_pro(self, device_id: str):
         self.pro_users[device_id] = True
@@ -285,8 +458,7 @@ async def get_usage_status(request: Request, deviceId: str = "", email: str = ""
         return {"count": 0, "limit": 999, "remaining": 999, "is_pro": True}
         
     key = tracker.get_key(request, deviceId)
-    today = datetime.now().strftime("%Y-%m-%d")
-    count = tracker.data.get(today, {}).get(key, 0)
+    count = await run_in_threadpool(tracker.store.get_count, key)
     limit = 5
     remaining = max(0, limit - count)
     return {"count": count, "limit": limit, "remaining": remaining, "is_pro": False}
@@ -296,7 +468,7 @@ async def record_usage_endpoint(request: Request, data: dict):
     deviceId = data.get("deviceId", "")
     email = data.get("email", "")
     key = tracker.get_key(request, deviceId)
-    allowed, count = tracker.check_and_record(key, deviceId, email)
+    allowed, count = await tracker.check_and_record(key, deviceId, email)
     limit = 5
     remaining = max(0, limit - count)
     return {"allowed": count <= limit, "count": count, "remaining": remaining}
@@ -321,36 +493,27 @@ async def drop_websocket(websocket: WebSocket, room_id: str, client_type: str):
                 print(f"WS Disconnect Message: Room={room_id}, Type={client_type}")
                 break
 
-            # 2. Relay messages to the other client verbatim
-            if room_id in manager.rooms and other in manager.rooms[room_id]:
-                other_ws = manager.rooms[room_id][other]
-                if manager.is_connected(other_ws):
-                    # Debug logging for critical handshake steps
-                    if "text" in message and message["text"]:
-                        msg_text = message["text"]
-                        if '"type"' in msg_text:
-                            # Log the type of signal passing through
-                            try:
-                                msg_json = json.loads(msg_text)
-                                print(f"Relaying Signal: {msg_json.get('type')} from {client_type} to {other} in {room_id}")
-                            except: pass
-
-                        try:
-                            await asyncio.wait_for(other_ws.send_text(message["text"]), timeout=10.0)
-                        except Exception as e:
-                            print(f"Relay Error (text): {e}")
-                    elif "bytes" in message and message["bytes"]:
-                        try:
-                            await asyncio.wait_for(other_ws.send_bytes(message["bytes"]), timeout=5.0)
-                        except Exception as e:
-                            print(f"Relay Error (bytes): {e}")
-            else:
-                # Other peer not yet connected, message dropped
-                pass
+            # 2. Relay messages to the other client verbatim (through the room broker)
+            # Debug logging for critical handshake steps
+            if "text" in message and message["text"]:
+                msg_text = message["text"]
+                if '"type"' in msg_text:
+                    # Log the type of signal passing through
+                    try:
+                        msg_json = json.loads(msg_text)
+                        print(f"Relaying Signal: {msg_json.get('type')} from {client_type} to {other} in {room_id}")
+                    except: pass
+
+            try:
+                await manager.relay_credit(room_id, client_type)
+                # 0 receivers = other peer not yet connected, message dropped
+                await manager.relay(message, room_id, other)
+            except Exception as e:
+                print(f"Relay Error (broker): {e}")
     except (WebSocketDisconnect, RuntimeError) as e:
         print(f"WS Loop Exit: Room={room_id}, Type={client_type}, Reason={e}")
     finally:
-        manager.disconnect(websocket, room_id, client_type)
+        await manager.disconnect(websocket, room_id, client_type)
         print(f"Peer Disconnected Cleaned Up: Room={room_id}, Type={client_type}")
         await manager.send_message({"type": "peer-disconnected", "client_type": client_type}, room_id, other)
 
@@ -362,63 +525,205 @@ async def compress_image(
     deviceId: str = Form("")
 ):
     key = tracker.get_key(request, deviceId)
-    allowed, count = tracker.check_and_record(key, deviceId)
+    allowed, count = await tracker.check_and_record(key, deviceId)
     if not allowed:
         raise HTTPException(status_code=402, detail="Daily limit reached. Upgrade to Pro for unlimited use!")
-    
+    workspace = workspaces.create()
     try:
         # Save uploaded file to a temporary location with the CORRECT extension
         ext = os.path.splitext(file.filename)[1] or ".png"
         
         is_pro = deviceId in tracker.pro_users
-        
-        # If not Pro, we could enforce a 5MB limit here
-        if not is_pro and getattr(file, 'size', 0) > 5 * 1024 * 1024:
-             raise HTTPException(status_code=402, detail="File too large for free tier. Upgrade to Pro!")
 
-        with tempfile.NamedTemporaryFile(delete=False, suffix=ext) as tmp:
-            shutil.copyfileobj(file.file, tmp)
-            tmp_path = tmp.name
+        upload = await ingest_upload(file, ext, workspace.path)
+        tmp_path = upload.path
 
-        # Agentic iterative compression loop (offload to prevent blocking asyncio)
-        optimized_path = await run_in_threadpool(run_iterative_image_compression, tmp_path, target_kb)
+        # If not Pro, we could enforce a 5MB limit here (size measured during ingestion)
+        if not is_pro and upload.size > 5 * 1024 * 1024:
+             raise HTTPException(status_code=402, detail="File too large for free tier. Upgrade to Pro!")
+
+        input_hash = upload.sha256
+        params = {"target_kb": target_kb}
+        cached_path = await run_in_threadpool(result_cache.get_file, "compress-image", input_hash, params)
+        if cached_path:
+            optimized_path = await run_in_threadpool(workspaces.adopt, workspace, cached_path)
+        else:
+            # Agentic iterative compression loop (offload to prevent blocking asyncio)
+            optimized_path = await run_in_pool("image", run_iterative_image_compression, tmp_path, target_kb)
+            await run_in_threadpool(result_cache.put_file, "compress-image", input_hash, params, optimized_path)
         
         return FileResponse(
             optimized_path, 
             media_type="image/jpeg", 
-            filename=f"compressed-{file.filename}"
+            filename=f"compressed-{file.filename}",
+            background=workspaces.cleanup_task(workspace)
         )
     except Exception as e:
+        await workspaces.discard(workspace)
         raise HTTPException(status_code=500, detail=str(e))
 
+def _variant_sliders(variants: str, target_kb: int, bilevel: bool, strategy: str, deadline_ms: int) -> list:
+    # variants="low,medium,high" or "20,50,80": every slider in one pass, returned as a ZIP
+    if not variants:
+        return []
+    if target_kb > 0 or bilevel or strategy or deadline_ms > 0:
+        raise HTTPException(status_code=400, detail="variants cannot be combined with target_kb, bilevel, strategy or deadline_ms")
+    try:
+        return parse_variants(variants)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid variants: {e}")
+
+def _report_headers(report: dict, deadline_ms: int, full_report: bool) -> dict:
+    # Response headers for a compression report, fresh or from the result cache. A cached
+    # file stored without a report is a complete result: coverage 1, deadline not hit.
+    headers = {}
+    if deadline_ms > 0:
+        report = report or {}
+        headers["X-Compression-Coverage"] = str(report.get("coverage", 1.0))
+        if "images_total" in report:
+            headers["X-Compression-Images"] = f"{report.get('images_optimized', 0)}/{report['images_total']}"
+        headers["X-Deadline-Hit"] = "1" if report.get("deadline_hit") else "0"
+    elif report and full_report:
+        headers["X-Compression-Report"] = json.dumps(report, separators=(",", ":"))
+    return headers
+
+def _compress_pdf_sliders(quality: int, target_kb: int, bilevel: bool, strategy: str, deadline_ms: int, variants: str) -> list:
+    # Rejects option combinations before the request is counted; returns the variant sliders
+    if strategy and strategy != "auto" and strategy not in STRATEGIES:
+        raise HTTPException(status_code=400, detail=f"Unknown strategy. Use auto or one of: {', '.join(STRATEGIES)}")
+    if deadline_ms > 0 and (target_kb > 0 or strategy):
+        raise HTTPException(status_code=400, detail="deadline_ms only works with the quality slider")
+    return _variant_sliders(variants, target_kb, bilevel, strategy, deadline_ms)
+
+def _compress_pdf_plan(upload_name: str, tmp_path: str, input_hash: str, quality: int, target_kb: int,
+                       bilevel: bool, strategy: str, deadline_ms: int, sliders: list):
+    """
+    Turns a validated compress-pdf request into (params, fn, args, make_result, headers),
+    shared by /api/compress-pdf and /api/jobs/compress-pdf.
+    params: result cache params. fn(*args): the agent to run in the pdf pool.
+    make_result(value, cached=False): the agent's return value, or (cached path, cached
+    report), as {"path", "media_type", "filename", "report"}; fresh results are stored in
+    the result cache, so it blocks. headers(report): response headers for the report.
+    """
+    # target_kb > 0 switches from the quality slider to target-size mode;
+    # bilevel stores scanned text pages as 1-bit G4 (photos still use the slider)
+    params = {"target_kb": target_kb} if target_kb > 0 else {"quality": quality}
+    if bilevel and target_kb <= 0:
+        params["bilevel"] = True
+    # strategy: "auto" races the registered compressors on sample pages, a name forces one
+    if strategy and target_kb <= 0:
+        params["strategy"] = strategy
+    if sliders:
+        params = {"variants": sliders}
+        media_type, filename = "application/zip", f"compressed-{os.path.splitext(upload_name)[0]}.zip"
+    else:
+        media_type, filename = "application/pdf", f"compressed-{upload_name}"
+    full_report = bool(sliders) or strategy == "auto"
+
+    if sliders:
+        fn, args = compress_pdf_variants, (tmp_path, sliders)
+    elif target_kb > 0:
+        fn, args = compress_pdf_to_target, (tmp_path, target_kb)
+    elif strategy == "auto":
+        fn, args = compress_pdf_auto, (tmp_path, quality)
+    elif strategy:
+        fn, args = STRATEGIES[strategy].fn, (tmp_path, quality)
+    elif deadline_ms > 0:
+        fn, args = compress_pdf_within_deadline, (tmp_path, quality, deadline_ms, bilevel)
+    elif bilevel:
+        fn, args = compress_pdf_bilevel, (tmp_path, quality)
+    else:
+        fn, args = run_iterative_pdf_compression, (tmp_path, quality)
+
+    def make_result(value, cached=False):
+        # compress_pdf_auto, compress_pdf_within_deadline and compress_pdf_variants return (path, report)
+        path, report = value if isinstance(value, tuple) else (value, None)
+        # A best-so-far file must not be served to later requests without a deadline
+        if not cached and not (report or {}).get("deadline_hit"):
+            result_cache.put_file("compress-pdf", input_hash, params, path)
+            if report:
+                result_cache.put_json("compress-pdf-report", input_hash, params, report)
+        if deadline_ms > 0 and not report:
+            # Cached without a report: a complete result
+            report = {"coverage": 1.0, "deadline_hit": False}
+        if not (deadline_ms > 0 or full_report):
+            report = None
+        return {"path": path, "media_type": media_type, "filename": filename, "report": report}
+
+    def headers(report):
+        return _report_headers(report, deadline_ms, full_report)
+
+    return params, fn, args, make_result, headers
+
 @app.post("/api/compress-pdf")
 async def compress_pdf(
     request: Request,
     file: UploadFile = File(...), 
     quality: int = Form(50),
+    target_kb: int = Form(0),
+    bilevel: bool = Form(False),
+    strategy: str = Form(""),
+    deadline_ms: int = Form(0),
+    variants: str = Form(""),
     deviceId: str = Form("")
 ):
+    sliders = _compress_pdf_sliders(quality, target_kb, bilevel, strategy, deadline_ms, variants)
     key = tracker.get_key(request, deviceId)
-    allowed, count = tracker.check_and_record(key, deviceId)
+    allowed, count = await tracker.check_and_record(key, deviceId)
     if not allowed:
         raise HTTPException(status_code=402, detail="Daily limit reached. Upgrade to Pro for unlimited use!")
+    workspace = workspaces.create()
     try:
         ext = os.path.splitext(file.filename)[1] or ".pdf"
-        with tempfile.NamedTemporaryFile(delete=False, suffix=ext) as tmp:
-            shutil.copyfileobj(file.file, tmp)
-            tmp_path = tmp.name
-
-        # Offload sync PDF processing to threadpool
-        optimized_path = await run_in_threadpool(run_iterative_pdf_compression, tmp_path, quality)
-        
+        upload = await ingest_upload(file, ext, workspace.path)
+        input_hash = upload.sha256
+        params, fn, args, make_result, headers = _compress_pdf_plan(
+            file.filename, upload.path, input_hash, quality, target_kb, bilevel, strategy, deadline_ms, sliders
+        )
+        cached_path = await run_in_threadpool(result_cache.get_file, "compress-pdf", input_hash, params)
+        if cached_path:
+            # The report is cached next to the file so a hit answers with the same headers
+            report = await run_in_threadpool(result_cache.get_json, "compress-pdf-report", input_hash, params)
+            # Served from the workspace's own copy so a concurrent eviction can't pull the file mid-response
+            own_path = await run_in_threadpool(workspaces.adopt, workspace, cached_path)
+            result = make_result((own_path, report), cached=True)
+        else:
+            # Offload sync PDF processing to the pre-forked PDF process pool
+            value = await run_in_pool("pdf", fn, *args)
+            result = await run_in_threadpool(make_result, value)
         return FileResponse(
-            optimized_path, 
-            media_type="application/pdf", 
-            filename=f"compressed-{file.filename}"
+            result["path"],
+            media_type=result["media_type"],
+            filename=result["filename"],
+            headers=headers(result["report"]),
+            background=workspaces.cleanup_task(workspace)
         )
     except Exception as e:
+        await workspaces.discard(workspace)
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/api/compress-pdf/estimate")
+async def estimate_compress_pdf(
+    file: UploadFile = File(...),
+    deviceId: str = Form("")
+):
+    # Slider preview: predicted size/runtime per quality tier. Not counted against the
+    # daily limit, the real compression that follows is.
+    workspace = workspaces.create()
+    try:
+        ext = os.path.splitext(file.filename)[1] or ".pdf"
+        upload = await ingest_upload(file, ext, workspace.path)
+
+        estimate = await run_in_threadpool(result_cache.get_json, "compress-pdf-estimate", upload.sha256)
+        if estimate is None:
+            estimate = await run_in_pool("pdf", estimate_pdf_compression, upload.path)
+            await run_in_threadpool(result_cache.put_json, "compress-pdf-estimate", upload.sha256, {}, estimate)
+        return estimate
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        await workspaces.discard(workspace)
+
 @app.post("/api/ocr")
 async def ocr_scan(
     request: Request,
@@ -426,19 +731,21 @@ async def ocr_scan(
     deviceId: str = Form("")
 ):
     key = tracker.get_key(request, deviceId)
-    allowed, count = tracker.check_and_record(key, deviceId)
+    allowed, count = await tracker.check_and_record(key, deviceId)
     if not allowed:
         raise HTTPException(status_code=402, detail="Daily limit reached. Upgrade to Pro for unlimited use!")
+    workspace = workspaces.create()
     try:
         ext = os.path.splitext(file.filename)[1] or ".png"
-        with tempfile.NamedTemporaryFile(delete=False, suffix=ext) as tmp:
-            shutil.copyfileobj(file.file, tmp)
-            tmp_path = tmp.name
+        upload = await ingest_upload(file, ext, workspace.path)
+        tmp_path = upload.path
 
         text = await run_in_threadpool(extract_text_from_image, tmp_path)
         return {"filename": file.filename, "extracted_text": text}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        await workspaces.discard(workspace)
 
 @app.post("/api/chat-pdf")
 async def chat_pdf(
@@ -448,19 +755,21 @@ async def chat_pdf(
     deviceId: str = Form("")
 ):
     key = tracker.get_key(request, deviceId)
-    allowed, count = tracker.check_and_record(key, deviceId)
+    allowed, count = await tracker.check_and_record(key, deviceId)
     if not allowed:
         raise HTTPException(status_code=402, detail="Daily limit reached. Upgrade to Pro for unlimited use!")
+    workspace = workspaces.create()
     try:
         ext = os.path.splitext(file.filename)[1] or ".pdf"
-        with tempfile.NamedTemporaryFile(delete=False, suffix=ext) as tmp:
-            shutil.copyfileobj(file.file, tmp)
-            tmp_path = tmp.name
+        upload = await ingest_upload(file, ext, workspace.path)
+        tmp_path = upload.path
 
         response = await run_in_threadpool(chat_with_pdf, tmp_path, query)
         return {"filename": file.filename, "query": query, "response": response}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        await workspaces.discard(workspace)
 
 @app.post("/api/organize-pdf")
 async def organize_pdf_endpoint(
@@ -470,23 +779,32 @@ async def organize_pdf_endpoint(
     deviceId: str = Form("")
 ):
     key = tracker.get_key(request, deviceId)
-    allowed, count = tracker.check_and_record(key, deviceId)
+    allowed, count = await tracker.check_and_record(key, deviceId)
     if not allowed:
         raise HTTPException(status_code=402, detail="Daily limit reached. Upgrade to Pro for unlimited use!")
+    workspace = workspaces.create()
     try:
         ext = os.path.splitext(file.filename)[1] or ".pdf"
-        with tempfile.NamedTemporaryFile(delete=False, suffix=ext) as tmp:
-            shutil.copyfileobj(file.file, tmp)
-            tmp_path = tmp.name
-
-        optimized_path = await run_in_threadpool(organize_pdf, tmp_path, order)
+        upload = await ingest_upload(file, ext, workspace.path)
+        tmp_path = upload.path
+
+        input_hash = upload.sha256
+        params = {"order": normalize_order(order)}
+        cached_path = await run_in_threadpool(result_cache.get_file, "organize-pdf", input_hash, params)
+        if cached_path:
+            optimized_path = await run_in_threadpool(workspaces.adopt, workspace, cached_path)
+        else:
+            optimized_path = await run_in_pool("pdf", organize_pdf, tmp_path, order)
+            await run_in_threadpool(result_cache.put_file, "organize-pdf", input_hash, params, optimized_path)
         
         return FileResponse(
             optimized_path, 
             media_type="application/pdf", 
-            filename=f"organized-{file.filename}"
+            filename=f"organized-{file.filename}",
+            background=workspaces.cleanup_task(workspace)
         )
     except Exception as e:
+        await workspaces.discard(workspace)
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/api/extract-thumbnails")
@@ -496,19 +814,26 @@ async def extract_thumbnails_endpoint(
     deviceId: str = Form("")
 ):
     key = tracker.get_key(request, deviceId)
-    allowed, count = tracker.check_and_record(key, deviceId)
+    allowed, count = await tracker.check_and_record(key, deviceId)
     if not allowed:
         raise HTTPException(status_code=402, detail="Daily limit reached. Upgrade to Pro for unlimited use!")
+    workspace = workspaces.create()
     try:
         ext = os.path.splitext(file.filename)[1] or ".pdf"
-        with tempfile.NamedTemporaryFile(delete=False, suffix=ext) as tmp:
-            shutil.copyfileobj(file.file, tmp)
-            tmp_path = tmp.name
-
-        thumbnails = await run_in_threadpool(extract_pdf_thumbnails, tmp_path)
+        upload = await ingest_upload(file, ext, workspace.path)
+        tmp_path = upload.path
+
+        input_hash = upload.sha256
+        thumbnails = await run_in_threadpool(result_cache.get_json, "extract-thumbnails", input_hash)
+        if thumbnails is None:
+            thumbnails = await run_in_pool("pdf", extract_pdf_thumbnails, tmp_path)
+            if thumbnails:
+                await run_in_threadpool(result_cache.put_json, "extract-thumbnails", input_hash, {}, thumbnails)
         return {"thumbnails": thumbnails}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        await workspaces.discard(workspace)
 
 @app.post("/api/image-to-pdf")
 async def image_to_pdf_endpoint(
@@ -517,25 +842,34 @@ async def image_to_pdf_endpoint(
     deviceId: str = Form("")
 ):
     key = tracker.get_key(request, deviceId)
-    allowed, count = tracker.check_and_record(key, deviceId)
+    allowed, count = await tracker.check_and_record(key, deviceId)
     if not allowed:
         raise HTTPException(status_code=402, detail="Daily limit reached. Upgrade to Pro for unlimited use!")
+    workspace = workspaces.create()
     try:
-        temp_paths = []
+        uploads = []
         for file in files:
             ext = os.path.splitext(file.filename)[1] or ".png"
-            with tempfile.NamedTemporaryFile(delete=False, suffix=ext) as tmp:
-                shutil.copyfileobj(file.file, tmp)
-                temp_paths.append(tmp.name)
-                
-        compiled_pdf_path = await run_in_threadpool(images_to_pdf, temp_paths)
+            uploads.append(await ingest_upload(file, ext, workspace.path))
+        temp_paths = [upload.path for upload in uploads]
+
+        # Page order matters, so the combined key is the ordered list of image hashes
+        input_hash = ",".join(upload.sha256 for upload in uploads)
+        cached_path = await run_in_threadpool(result_cache.get_file, "image-to-pdf", input_hash)
+        if cached_path:
+            compiled_pdf_path = await run_in_threadpool(workspaces.adopt, workspace, cached_path)
+        else:
+            compiled_pdf_path = await run_in_pool("pdf", images_to_pdf, temp_paths)
+            await run_in_threadpool(result_cache.put_file, "image-to-pdf", input_hash, {}, compiled_pdf_path)
         
         return FileResponse(
             compiled_pdf_path, 
             media_type="application/pdf", 
-            filename="combined-images.pdf"
+            filename="combined-images.pdf",
+            background=workspaces.cleanup_task(workspace)
         )
     except Exception as e:
+        await workspaces.discard(workspace)
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/api/split-pdf")
@@ -546,16 +880,23 @@ async def split_pdf_endpoint(
     deviceId: str = Form("")
 ):
     key = tracker.get_key(request, deviceId)
-    allowed, count = tracker.check_and_record(key, deviceId)
+    allowed, count = await tracker.check_and_record(key, deviceId)
     if not allowed:
         raise HTTPException(status_code=402, detail="Daily limit reached. Upgrade to Pro for unlimited use!")
+    workspace = workspaces.create()
     try:
         ext = os.path.splitext(file.filename)[1] or ".pdf"
-        with tempfile.NamedTemporaryFile(delete=False, suffix=ext) as tmp:
-            shutil.copyfileobj(file.file, tmp)
-            tmp_path = tmp.name
+        upload = await ingest_upload(file, ext, workspace.path)
+        tmp_path = upload.path
             
-        output_path = await run_in_threadpool(split_pdf, tmp_path, ranges)
+        input_hash = upload.sha256
+        params = {"ranges": normalize_ranges(ranges)}
+        cached_path = await run_in_threadpool(result_cache.get_file, "split-pdf", input_hash, params)
+        if cached_path:
+            output_path = await run_in_threadpool(workspaces.adopt, workspace, cached_path)
+        else:
+            output_path = await run_in_pool("pdf", split_pdf, tmp_path, ranges)
+            await run_in_threadpool(result_cache.put_file, "split-pdf", input_hash, params, output_path)
         
         is_zip = output_path.endswith('.zip')
         media_type = "application/zip" if is_zip else "application/pdf"
@@ -566,9 +907,11 @@ async def split_pdf_endpoint(
         return FileResponse(
             output_path, 
             media_type=media_type, 
-            filename=filename
+            filename=filename,
+            background=workspaces.cleanup_task(workspace)
         )
     except Exception as e:
+        await workspaces.discard(workspace)
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/api/pdf-to-word")
@@ -578,23 +921,31 @@ async def pdf_to_word_endpoint(
     deviceId: str = Form("")
 ):
     key = tracker.get_key(request, deviceId)
-    allowed, count = tracker.check_and_record(key, deviceId)
+    allowed, count = await tracker.check_and_record(key, deviceId)
     if not allowed:
         raise HTTPException(status_code=402, detail="Daily limit reached. Upgrade to Pro for unlimited use!")
+    workspace = workspaces.create()
     try:
         ext = os.path.splitext(file.filename)[1] or ".pdf"
-        with tempfile.NamedTemporaryFile(delete=False, suffix=ext) as tmp:
-            shutil.copyfileobj(file.file, tmp)
-            tmp_path = tmp.name
+        upload = await ingest_upload(file, ext, workspace.path)
+        tmp_path = upload.path
             
-        output_path = await run_in_threadpool(pdf_to_word, tmp_path)
+        input_hash = upload.sha256
+        cached_path = await run_in_threadpool(result_cache.get_file, "pdf-to-word", input_hash)
+        if cached_path:
+            output_path = await run_in_threadpool(workspaces.adopt, workspace, cached_path)
+        else:
+            output_path = await run_in_pool("pdf", pdf_to_word, tmp_path)
+            await run_in_threadpool(result_cache.put_file, "pdf-to-word", input_hash, {}, output_path)
         
         return FileResponse(
             output_path, 
             media_type="application/vnd.openxmlformats-officedocument.wordprocessingml.document", 
-            filename=file.filename.replace(".pdf", "") + ".docx"
+            filename=file.filename.replace(".pdf", "") + ".docx",
+            background=workspaces.cleanup_task(workspace)
         )
     except Exception as e:
+        await workspaces.discard(workspace)
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/api/office-to-pdf")
@@ -604,23 +955,31 @@ async def office_to_pdf_endpoint(
     deviceId: str = Form("")
 ):
     key = tracker.get_key(request, deviceId)
-    allowed, count = tracker.check_and_record(key, deviceId)
+    allowed, count = await tracker.check_and_record(key, deviceId)
     if not allowed:
         raise HTTPException(status_code=402, detail="Daily limit reached. Upgrade to Pro for unlimited use!")
+    workspace = workspaces.create()
     try:
         ext = os.path.splitext(file.filename)[1].lower() or ".docx"
-        with tempfile.NamedTemporaryFile(delete=False, suffix=ext) as tmp:
-            shutil.copyfileobj(file.file, tmp)
-            tmp_path = tmp.name
+        upload = await ingest_upload(file, ext, workspace.path)
+        tmp_path = upload.path
             
-        output_path = await run_in_threadpool(office_to_pdf, tmp_path)
+        input_hash = upload.sha256
+        cached_path = await run_in_threadpool(result_cache.get_file, "office-to-pdf", input_hash)
+        if cached_path:
+            output_path = await run_in_threadpool(workspaces.adopt, workspace, cached_path)
+        else:
+            output_path = await run_in_threadpool(office_to_pdf, tmp_path)
+            await run_in_threadpool(result_cache.put_file, "office-to-pdf", input_hash, {}, output_path)
         
         return FileResponse(
             output_path, 
             media_type="application/pdf", 
-            filename=file.filename.replace(ext, ".pdf")
+            filename=file.filename.replace(ext, ".pdf"),
+            background=workspaces.cleanup_task(workspace)
         )
     except Exception as e:
+        await workspaces.discard(workspace)
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/api/unlock-pdf")
@@ -631,23 +990,25 @@ async def unlock_pdf_endpoint(
     deviceId: str = Form("")
 ):
     key = tracker.get_key(request, deviceId)
-    allowed, count = tracker.check_and_record(key, deviceId)
+    allowed, count = await tracker.check_and_record(key, deviceId)
     if not allowed:
         raise HTTPException(status_code=402, detail="Daily limit reached. Upgrade to Pro for unlimited use!")
+    workspace = workspaces.create()
     try:
         ext = os.path.splitext(file.filename)[1] or ".pdf"
-        with tempfile.NamedTemporaryFile(delete=False, suffix=ext) as tmp:
-            shutil.copyfileobj(file.file, tmp)
-            tmp_path = tmp.name
+        upload = await ingest_upload(file, ext, workspace.path)
+        tmp_path = upload.path
             
-        output_path = await run_in_threadpool(unlock_pdf, tmp_path, password)
+        output_path = await run_in_pool("pdf", unlock_pdf, tmp_path, password)
         
         return FileResponse(
             output_path, 
             media_type="application/pdf", 
-            filename=file.filename.replace(".pdf", "") + "_unlocked.pdf"
+            filename=file.filename.replace(".pdf", "") + "_unlocked.pdf",
+            background=workspaces.cleanup_task(workspace)
         )
     except Exception as e:
+        await workspaces.discard(workspace)
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/api/repair-pdf")
@@ -657,23 +1018,31 @@ async def repair_pdf_endpoint(
     deviceId: str = Form("")
 ):
     key = tracker.get_key(request, deviceId)
-    allowed, count = tracker.check_and_record(key, deviceId)
+    allowed, count = await tracker.check_and_record(key, deviceId)
     if not allowed:
         raise HTTPException(status_code=402, detail="Daily limit reached. Upgrade to Pro for unlimited use!")
+    workspace = workspaces.create()
     try:
         ext = os.path.splitext(file.filename)[1] or ".pdf"
-        with tempfile.NamedTemporaryFile(delete=False, suffix=ext) as tmp:
-            shutil.copyfileobj(file.file, tmp)
-            tmp_path = tmp.name
+        upload = await ingest_upload(file, ext, workspace.path)
+        tmp_path = upload.path
             
-        output_path = await run_in_threadpool(repair_pdf, tmp_path)
+        input_hash = upload.sha256
+        cached_path = await run_in_threadpool(result_cache.get_file, "repair-pdf", input_hash)
+        if cached_path:
+            output_path = await run_in_threadpool(workspaces.adopt, workspace, cached_path)
+        else:
+            output_path = await run_in_pool("pdf", repair_pdf, tmp_path)
+            await run_in_threadpool(result_cache.put_file, "repair-pdf", input_hash, {}, output_path)
         
         return FileResponse(
             output_path, 
             media_type="application/pdf", 
-            filename=file.filename.replace(".pdf", "") + "_repaired.pdf"
+            filename=file.filename.replace(".pdf", "") + "_repaired.pdf",
+            background=workspaces.cleanup_task(workspace)
         )
     except Exception as e:
+        await workspaces.discard(workspace)
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/api/ocr-pdf")
@@ -683,19 +1052,25 @@ async def ocr_pdf_scan(
     deviceId: str = Form("")
 ):
     key = tracker.get_key(request, deviceId)
-    allowed, count = tracker.check_and_record(key, deviceId)
+    allowed, count = await tracker.check_and_record(key, deviceId)
     if not allowed:
         raise HTTPException(status_code=402, detail="Daily limit reached. Upgrade to Pro for unlimited use!")
+    workspace = workspaces.create()
     try:
         ext = os.path.splitext(file.filename)[1] or ".pdf"
-        with tempfile.NamedTemporaryFile(delete=False, suffix=ext) as tmp:
-            shutil.copyfileobj(file.file, tmp)
-            tmp_path = tmp.name
-
-        results = await run_in_threadpool(process_ocr_pdf, tmp_path)
+        upload = await ingest_upload(file, ext, workspace.path)
+        tmp_path = upload.path
+
+        input_hash = upload.sha256
+        results = await run_in_threadpool(result_cache.get_json, "ocr-pdf", input_hash)
+        if results is None:
+            results = await run_in_pool("ocr", process_ocr_pdf, tmp_path)
+            await run_in_threadpool(result_cache.put_json, "ocr-pdf", input_hash, {}, results)
         return {"filename": file.filename, "ocr_data": results}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        await workspaces.discard(workspace)
 
 @app.post("/api/ocr-pdf/export")
 async def ocr_pdf_export(
@@ -706,27 +1081,169 @@ async def ocr_pdf_export(
     deviceId: str = Form("")
 ):
     key = tracker.get_key(request, deviceId)
-    allowed, count = tracker.check_and_record(key, deviceId)
+    allowed, count = await tracker.check_and_record(key, deviceId)
     if not allowed:
         raise HTTPException(status_code=402, detail="Daily limit reached. Upgrade to Pro for unlimited use!")
+    workspace = workspaces.create()
     try:
         ext = os.path.splitext(file.filename)[1] or ".pdf"
-        with tempfile.NamedTemporaryFile(delete=False, suffix=ext) as tmp:
-            shutil.copyfileobj(file.file, tmp)
-            tmp_path = tmp.name
+        upload = await ingest_upload(file, ext, workspace.path)
+        tmp_path = upload.path
 
         edits_data = json.loads(edits)
         full_ocr_data = json.loads(ocrData)
-        output_path = await run_in_threadpool(extract_edited_pdf, tmp_path, edits_data, full_ocr_data)
+        output_path = await run_in_pool("ocr", extract_edited_pdf, tmp_path, edits_data, full_ocr_data)
         
         return FileResponse(
             output_path, 
             media_type="application/pdf", 
-            filename=file.filename.replace(".pdf", "") + "_edited.pdf"
+            filename=file.filename.replace(".pdf", "") + "_edited.pdf",
+            background=workspaces.cleanup_task(workspace)
+        )
+    except Exception as e:
+        await workspaces.discard(workspace)
+        raise HTTPException(status_code=500, detail=str(e))
+
+# --- ASYNC JOB API (long conversions) ---
+# POST returns a job id immediately; poll /api/jobs/{id} for per-page progress,
+# then download /api/jobs/{id}/result. Results are kept for JOB_RESULT_TTL seconds.
+
+def _job_accepted(job):
+    return JSONResponse(status_code=202, content={
+        "job_id": job.id,
+        "status": job.status,
+        "status_url": f"/api/jobs/{job.id}",
+        "result_url": f"/api/jobs/{job.id}/result",
+    })
+
+@app.post("/api/jobs/compress-pdf")
+async def submit_compress_pdf_job(
+    request: Request,
+    file: UploadFile = File(...),
+    quality: int = Form(50),
+    target_kb: int = Form(0),
+    bilevel: bool = Form(False),
+    strategy: str = Form(""),
+    deadline_ms: int = Form(0),
+    variants: str = Form(""),
+    deviceId: str = Form("")
+):
+    sliders = _compress_pdf_sliders(quality, target_kb, bilevel, strategy, deadline_ms, variants)
+    key = tracker.get_key(request, deviceId)
+    allowed, count = await tracker.check_and_record(key, deviceId)
+    if not allowed:
+        raise HTTPException(status_code=402, detail="Daily limit reached. Upgrade to Pro for unlimited use!")
+    workspace = workspaces.create()
+    try:
+        ext = os.path.splitext(file.filename)[1] or ".pdf"
+        upload = await ingest_upload(file, ext, workspace.path)
+        input_hash = upload.sha256
+        params, fn, args, make_result, _ = _compress_pdf_plan(
+            file.filename, upload.path, input_hash, quality, target_kb, bilevel, strategy, deadline_ms, sliders
         )
+        cached_path = await run_in_threadpool(result_cache.get_file, "compress-pdf", input_hash, params)
+        if cached_path:
+            report = await run_in_threadpool(result_cache.get_json, "compress-pdf-report", input_hash, params)
+            # The job outlives the request: it gets its own copy, cache eviction can't touch it
+            own_path = await run_in_threadpool(workspaces.adopt, workspace, cached_path)
+            job = await run_in_threadpool(jobs.complete, "compress-pdf", file.filename, make_result((own_path, report), cached=True), workspace)
+            return _job_accepted(job)
+
+        job = await jobs.submit("compress-pdf", file.filename, "pdf", fn, args, make_result, workspace)
+        return _job_accepted(job)
     except Exception as e:
+        await workspaces.discard(workspace)
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/api/jobs/pdf-to-word")
+async def submit_pdf_to_word_job(
+    request: Request,
+    file: UploadFile = File(...),
+    deviceId: str = Form("")
+):
+    key = tracker.get_key(request, deviceId)
+    allowed, count = await tracker.check_and_record(key, deviceId)
+    if not allowed:
+        raise HTTPException(status_code=402, detail="Daily limit reached. Upgrade to Pro for unlimited use!")
+    workspace = workspaces.create()
+    try:
+        ext = os.path.splitext(file.filename)[1] or ".pdf"
+        upload = await ingest_upload(file, ext, workspace.path)
+        tmp_path = upload.path
+
+        filename = file.filename.replace(".pdf", "") + ".docx"
+        media_type = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+        input_hash = upload.sha256
+        cached_path = await run_in_threadpool(result_cache.get_file, "pdf-to-word", input_hash)
+        if cached_path:
+            own_path = await run_in_threadpool(workspaces.adopt, workspace, cached_path)
+            job = await run_in_threadpool(jobs.complete, "pdf-to-word", file.filename, {"path": own_path, "media_type": media_type, "filename": filename}, workspace)
+            return _job_accepted(job)
+
+        def make_result(path):
+            result_cache.put_file("pdf-to-word", input_hash, {}, path)
+            return {"path": path, "media_type": media_type, "filename": filename}
+
+        job = await jobs.submit("pdf-to-word", file.filename, "pdf", pdf_to_word, (tmp_path,), make_result, workspace)
+        return _job_accepted(job)
+    except Exception as e:
+        await workspaces.discard(workspace)
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/api/jobs/ocr-pdf")
+async def submit_ocr_pdf_job(
+    request: Request,
+    file: UploadFile = File(...),
+    deviceId: str = Form("")
+):
+    key = tracker.get_key(request, deviceId)
+    allowed, count = await tracker.check_and_record(key, deviceId)
+    if not allowed:
+        raise HTTPException(status_code=402, detail="Daily limit reached. Upgrade to Pro for unlimited use!")
+    workspace = workspaces.create()
+    try:
+        ext = os.path.splitext(file.filename)[1] or ".pdf"
+        upload = await ingest_upload(file, ext, workspace.path)
+        tmp_path = upload.path
+
+        filename = file.filename
+        input_hash = upload.sha256
+        cached = await run_in_threadpool(result_cache.get_json, "ocr-pdf", input_hash)
+        if cached is not None:
+            await workspaces.discard(workspace)
+            job = await run_in_threadpool(jobs.complete, "ocr-pdf", file.filename, {"data": {"filename": filename, "ocr_data": cached}})
+            return _job_accepted(job)
+
+        def make_result(results):
+            result_cache.put_json("ocr-pdf", input_hash, {}, results)
+            return {"data": {"filename": filename, "ocr_data": results}}
+
+        job = await jobs.submit("ocr-pdf", file.filename, "ocr", process_ocr_pdf, (tmp_path,), make_result, workspace)
+        return _job_accepted(job)
+    except Exception as e:
+        await workspaces.discard(workspace)
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/api/jobs/{job_id}")
+async def get_job_status(job_id: str):
+    job = await run_in_threadpool(jobs.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired job")
+    return job.to_dict()
+
+@app.get("/api/jobs/{job_id}/result")
+async def get_job_result(job_id: str):
+    job = await run_in_threadpool(jobs.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired job")
+    if job.status == FAILED:
+        raise HTTPException(status_code=500, detail=job.error)
+    if job.status != DONE:
+        return JSONResponse(status_code=409, content=job.to_dict())
+    if "data" in job.result:
+        return job.result["data"]
+    return FileResponse(job.result["path"], media_type=job.result["media_type"], filename=job.result["filename"])
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run("app.main:app", host="0.0.0.0", port=8000, reload=True)
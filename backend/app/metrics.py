@@ -0,0 +1,204 @@
+import os
+import time
+import bisect
+import threading
+from app.tracing import start_trace, end_trace
+
+# Metrics: in-process Prometheus text exposition, no client library. Recording a sample
+# is a dict lookup, a bisect and a few adds under a lock, cheap enough for every request.
+# Point-in-time values (pool utilisation, temp-dir bytes, cache hit rate, rooms) are
+# not recorded at all: collectors registered with registry.collect() read them from the
+# live objects when /metrics is scraped.
+
+# Always attach Server-Timing, not only when the client sends X-Debug-Timing: 1
+TRACE_RESPONSE_HEADER = os.getenv("TRACE_RESPONSE_HEADER", "0") == "1"
+
+# Seconds. Spans the 5 ms health probe up to multi-minute OCR / pdf-to-word runs.
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _fmt(value) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels=()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self.values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount: float = 1):
+        with self._lock:
+            self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            items = list(self.values.items())
+        for label_values, value in items:
+            yield self.name, _labels(self.label_names, label_values), value
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        # label_values -> [bucket counts..., +Inf count, sum]
+        self.values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            row = self.values.get(label_values)
+            if row is None:
+                row = self.values[label_values] = [0] * (len(self.buckets) + 2)
+            row[index] += 1
+            row[-1] += value
+
+    def samples(self):
+        with self._lock:
+            items = [(k, list(v)) for k, v in self.values.items()]
+        for label_values, row in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), row[:-1]):
+                cumulative += count
+                yield self.name + "_bucket", _labels(self.label_names, label_values, f'le="{_fmt(bound)}"'), cumulative
+            yield self.name + "_sum", _labels(self.label_names, label_values), round(row[-1], 6)
+            yield self.name + "_count", _labels(self.label_names, label_values), cumulative
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+        self.collectors = []
+
+    def counter(self, name: str, help: str, labels=()) -> Counter:
+        metric = Counter(name, help, labels)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, help: str, labels=(), buckets=DEFAULT_BUCKETS) -> Histogram:
+        metric = Histogram(name, help, labels, buckets)
+        self.metrics.append(metric)
+        return metric
+
+    def collect(self, fn):
+        """
+        Registers fn() -> iterable of (name, help, {labels} | None, value) gauges,
+        evaluated at scrape time. Usable as a decorator.
+        """
+        self.collectors.append(fn)
+        return fn
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{labels} {_fmt(value)}")
+
+        gauges = {}
+        for fn in self.collectors:
+            try:
+                for name, help, labels, value in fn():
+                    gauges.setdefault(name, (help, []))[1].append((labels or {}, value))
+            except Exception as e:
+                print(f"Metrics collector error ({getattr(fn, '__name__', fn)}): {e}")
+        for name, (help, samples) in gauges.items():
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} gauge")
+            for labels, value in samples:
+                lines.append(f"{name}{_labels(labels.keys(), labels.values())} {_fmt(value)}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+http_requests = registry.counter(
+    "pdfninja_http_requests_total", "HTTP requests by route and status", ("method", "route", "status")
+)
+http_latency = registry.histogram(
+    "pdfninja_http_request_duration_seconds", "HTTP request latency by route", ("method", "route")
+)
+agent_runs = registry.counter(
+    "pdfninja_agent_runs_total", "Agent calls dispatched to the execution engine", ("job_class", "agent", "outcome")
+)
+agent_latency = registry.histogram(
+    "pdfninja_agent_duration_seconds", "Agent wall time including pool queueing", ("job_class", "agent")
+)
+stage_latency = registry.histogram(
+    "pdfninja_stage_duration_seconds", "Time spent in an agent stage per request or job", ("stage",)
+)
+
+
+def record_trace(trace):
+    for stage, (seconds, _) in trace.stages.items():
+        stage_latency.observe(seconds, stage)
+
+
+
+class MetricsMiddleware:
+    """
+    Pure ASGI middleware: counts and times every HTTP request by route template
+    (/api/jobs/{job_id}, not the concrete id) so label cardinality stays bounded.
+    Also owns the request's stage Trace and the optional Server-Timing header.
+    """
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        start = time.perf_counter()
+        status = [500]
+        end = [None]
+        want_timing = TRACE_RESPONSE_HEADER or (b"x-debug-timing", b"1") in scope.get("headers", [])
+        trace, token = start_trace()
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+                if want_timing and trace.stages:
+                    headers = list(message.get("headers", []))
+                    headers.append((b"server-timing", trace.server_timing().encode()))
+                    message = {**message, "headers": headers}
+            await send(message)
+            if message["type"] == "http.response.body" and not message.get("more_body"):
+                # Stop the clock at the last body chunk, not after background cleanup
+                end[0] = time.perf_counter()
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            end_trace(token)
+            record_trace(trace)
+            route = scope.get("route")
+            path = getattr(route, "path", None) or "unmatched"
+            method = scope.get("method", "GET")
+            http_requests.inc(method, path, str(status[0]))
+            http_latency.observe((end[0] or time.perf_counter()) - start, method, path)
@@ -7,6 +7,8 @@ import io
 import json
 import gc
 import numpy as np
+from app.tracing import span
+from app.pdf_agent import linearize_pdf
 
 def get_word_metrics(img, box_300dpi):
     """
@@ -79,33 +81,40 @@ def get_word_metrics(img, box_300dpi):
         print(f"Metrics Error: {e}")
         return "normal", "sans-serif", (0,0,0), (1,1,1), 1.0
 
-def process_ocr_pdf(file_path: str) -> dict:
+def process_ocr_pdf(file_path: str, progress=None) -> dict:
     """
     Extracts text, bounding boxes, and font properties.
     Groups words into lines and blocks.
+    Optional progress(done, total) is called after every page.
     """
     results = {"pages": []}
     doc = fitz.open(file_path)
+    total_pages = len(doc)
+    if progress:
+        progress(0, total_pages)
     
-    for page_num in range(len(doc)):
+    for page_num in range(total_pages):
         page = doc[page_num]
         
         # MEMORY OPTIMIZATION: Adaptive DPI (144 instead of 300)
         # Reduces pixel count by ~4x, keeping RAM under Render limits
         zoom = 2.0 
         mat = fitz.Matrix(zoom, zoom)
-        pix = page.get_pixmap(matrix=mat)
+        with span("ocr_pdf.pixmap"):
+            pix = page.get_pixmap(matrix=mat)
         
         # Process image
-        raw_bytes = pix.tobytes("png")
-        img = Image.open(io.BytesIO(raw_bytes)).convert("RGB")
+        with span("ocr_pdf.png_roundtrip"):
+            raw_bytes = pix.tobytes("png")
+            img = Image.open(io.BytesIO(raw_bytes)).convert("RGB")
         
         # Clear large pixmap immediately
         del pix
         
         # Run Tesseract with detailed data
         custom_config = r'-l eng+hin --psm 3'
-        data = pytesseract.image_to_data(img, config=custom_config, output_type=pytesseract.Output.DICT)
+        with span("ocr_pdf.tesseract"):
+            data = pytesseract.image_to_data(img, config=custom_config, output_type=pytesseract.Output.DICT)
         
         import math
         from collections import defaultdict
@@ -142,7 +151,7 @@ def process_ocr_pdf(file_path: str) -> dict:
                 "sharpness": sharpness
             }
 
-        with ThreadPoolExecutor(max_workers=8) as executor:
+        with span("ocr_pdf.word_metrics"), ThreadPoolExecutor(max_workers=8) as executor:
             words_raw = list(executor.map(process_single_word, range(len(data['text']))))
         
         words = [w for w in words_raw if w is not None]
@@ -182,6 +191,8 @@ def process_ocr_pdf(file_path: str) -> dict:
             "height": page.rect.height,
             "words": words
         })
+        if progress:
+            progress(page_num + 1, total_pages)
         
     doc.close()
     return results
@@ -323,7 +334,8 @@ def extract_edited_pdf(original_pdf_path: str, edits: list, full_ocr_data: dict
             # We use the full base_opacity here to ensure the text remains 'Perfect'
             page.insert_text(point_j, new_text, fontsize=true_point_size, color=fg, fontname=fontname, dir=dir_vec, fill_opacity=base_opacity, render_mode=0)
             
-    doc.save(out_path)
+    with span("ocr_export.save"):
+        doc.save(out_path)
     doc.close()
     
-    return out_path
+    return linearize_pdf(out_path)
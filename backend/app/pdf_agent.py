@@ -1,16 +1,1080 @@
 import fitz  # PyMuPDF
+import io
 import os
+import re
+import time
+import zlib
+import hashlib
+import logging
 import zipfile
+import shutil
+import threading
 import subprocess
+import multiprocessing
+import numpy as np
+from collections import namedtuple
 from PIL import Image
 from pdf2docx import Converter
+from app.tracing import span
 
-def run_iterative_pdf_compression(input_path: str, quality_slider: int) -> str:
+# Parallel XREF recompression: image XREFs are decoded, scaled and JPEG-encoded in
+# worker processes that open the same file read-only, each on a partition of XREFs.
+# Only the encoded bytes come back; the parent applies update_stream/xref_set_key in
+# XREF order, so the saved PDF is byte-for-byte identical to the serial loop.
+XREF_WORKERS = int(os.getenv("PDF_XREF_WORKERS", str(os.cpu_count() or 1)))
+XREF_PARALLEL_MIN_IMAGES = int(os.getenv("PDF_XREF_PARALLEL_MIN", "24"))
+
+
+_XREF_REF = re.compile(rb"(?<![\d.])(\d+) 0 R\b")
+
+
+def _object_digest(doc, xref: int, memo: dict, depth: int = 0) -> bytes:
+    # Content hash of an object with every indirect reference replaced by the digest of
+    # its target, so two copies pointing at two identical ICC profiles / SMasks match
+    if xref in memo:
+        return memo[xref]
+    memo[xref] = b"%d" % xref  # cycle guard
+    source = doc.xref_object(xref, compressed=True).encode()
+    if depth < 8:
+        source = _XREF_REF.sub(lambda m: _object_digest(doc, int(m.group(1)), memo, depth + 1).hex().encode(), source)
+    digest = hashlib.sha256(source)
+    if doc.xref_is_stream(xref):
+        digest.update(doc.xref_stream_raw(xref) or b"")
+    memo[xref] = digest.digest()
+    return memo[xref]
+
+
+def _find_duplicates(doc, xrefs: list, deadline: float = None) -> dict:
+    # {duplicate xref: first xref with the same content digest}; past the deadline, the
+    # duplicates found so far (any subset is safe to merge)
+    memo, first_seen, duplicates = {}, {}, {}
+    for xref in xrefs:
+        if deadline is not None and time.time() >= deadline:
+            break
+        try:
+            key = _object_digest(doc, xref, memo)
+        except Exception:
+            continue
+        if key in first_seen:
+            duplicates[xref] = first_seen[key]
+        else:
+            first_seen[key] = xref
+    return duplicates
+
+
+def _repoint_references(doc, duplicates: dict):
+    # Rewrites every "N 0 R" pointing at a duplicate to point at its first copy
+    def repoint(match):
+        target = duplicates.get(int(match.group(1)))
+        return b"%d 0 R" % target if target else match.group(0)
+
+    for xref in range(1, doc.xref_length()):
+        if xref in duplicates:
+            continue
+        try:
+            source = doc.xref_object(xref, compressed=True).encode()
+        except Exception:
+            continue
+        if b" 0 R" not in source:
+            continue
+        if not doc.xref_is_stream(xref):
+            updated = _XREF_REF.sub(repoint, source)
+            if updated != source:
+                doc.update_object(xref, updated.decode())
+            continue
+        # Streams (SMask'd images, form XObjects, font descriptors' programs): rewrite the keys, keep the data
+        for key in doc.xref_get_keys(xref):
+            kind, value = doc.xref_get_key(xref, key)
+            if kind not in ("xref", "dict", "array"):
+                continue
+            updated = _XREF_REF.sub(repoint, value.encode())
+            if updated != value.encode():
+                doc.xref_set_key(xref, key, updated.decode())
+
+
+def dedup_images(doc, image_xrefs: list, deadline: float = None) -> list:
+    """
+    Merged and scanned PDFs often embed the same logo/background under many XREFs.
+    Hashes every image's raw stream plus its dictionary (references resolved by
+    content), repoints references to duplicates at the first copy and returns the
+    image XREFs still in use. The orphaned copies are dropped by save(garbage=...).
+    Hashing stops at deadline (a time.time() value).
+    """
+    with span("compress.dedup"):
+        duplicates = _find_duplicates(doc, image_xrefs, deadline)
+        if not duplicates:
+            return list(image_xrefs)
+        _repoint_references(doc, duplicates)
+        remaining = [x for x in image_xrefs if x not in duplicates]
+        print(f"🧬 Image dedup: {len(duplicates)} duplicate image XREFs merged into {len(remaining)} unique")
+        return remaining
+
+
+# Font optimisation: merged and exported PDFs often embed the same font program once per
+# source document. Identical programs (same content digest as the image dedup) are
+# merged, then every embedded font is subset to the glyphs the pages actually use with
+# MuPDF's native subsetter (fontTools fallback if that fails). PDF_FONT_SUBSET=0 keeps
+# fonts whole, e.g. for files that will be edited afterwards.
+FONT_SUBSET = os.getenv("PDF_FONT_SUBSET", "1") == "1"
+_FONT_FILE_KEYS = ("FontFile", "FontFile2", "FontFile3")
+_SUBSET_TAG = re.compile(r"^[A-Z]{6}\+")
+
+
+def _font_programs(doc) -> dict:
+    # {embedded font program xref: font name without the subset tag}
+    programs = {}
+    for xref in range(1, doc.xref_length()):
+        if doc.xref_get_key(xref, "Type")[1] != "/FontDescriptor":
+            continue
+        name = _SUBSET_TAG.sub("", doc.xref_get_key(xref, "FontName")[1].lstrip("/"))
+        for key in _FONT_FILE_KEYS:
+            kind, value = doc.xref_get_key(xref, key)
+            if kind == "xref":
+                programs[int(value.split()[0])] = name
+    return programs
+
+
+def optimize_fonts(doc) -> list:
+    """
+    Merges duplicate embedded font programs and subsets the rest to the used glyphs.
+    Returns one row per font name:
+    {"font", "copies", "bytes_before", "bytes_after", "bytes_saved"} (raw stream bytes).
+    """
+    with span("compress.fonts"):
+        before = _font_programs(doc)
+        if not before:
+            return []
+        report = {}
+        for xref, name in before.items():
+            row = report.setdefault(name, {"font": name, "copies": 0, "bytes_before": 0, "bytes_after": 0})
+            row["copies"] += 1
+            row["bytes_before"] += len(doc.xref_stream_raw(xref) or b"")
+
+        duplicates = _find_duplicates(doc, list(before))
+        if duplicates:
+            _repoint_references(doc, duplicates)
+        if FONT_SUBSET:
+            try:
+                doc.subset_fonts()
+            except Exception as e:
+                print(f"Native font subsetting failed ({e}), trying fontTools")
+                try: doc.subset_fonts(fallback=True)
+                except Exception as e: print(f"Font subsetting skipped: {e}")
+
+        for xref, name in _font_programs(doc).items():
+            if name in report:
+                report[name]["bytes_after"] += len(doc.xref_stream_raw(xref) or b"")
+        rows = []
+        for row in report.values():
+            row["bytes_saved"] = row["bytes_before"] - row["bytes_after"]
+            rows.append(row)
+        rows.sort(key=lambda r: -r["bytes_saved"])
+        saved = sum(r["bytes_saved"] for r in rows)
+        print(f"🔤 Fonts: {len(duplicates)} duplicate programs merged, {saved // 1024} KB saved")
+        for row in rows:
+            print(f"   {row['font']}: {row['copies']}x {row['bytes_before'] // 1024} KB -> {row['bytes_after'] // 1024} KB")
+        return rows
+
+
+# Structural slimming: everything that is not page content or images. Thumbnails,
+# resources the content streams never name (rebuilt by MuPDF's content sanitizer),
+# JavaScript actions, embedded files, XMP packets, /PieceInfo application data and
+# duplicate ICC profiles are dropped, and the save packs objects into object streams
+# with a compressed xref stream. Bytes per category are what the removal leaves
+# unreachable from the trailer, net of anything it added. PDF_SLIM picks the
+# categories; JavaScript and attachments change behaviour, so like the outline they
+# only go at quality <= 50.
+SLIM_CATEGORIES = [c.strip() for c in os.getenv(
+    "PDF_SLIM", "thumbnails,resources,javascript,embedded_files,xmp,piece_info,icc"
+).split(",") if c.strip()]
+SLIM_LOSSY = ("javascript", "embedded_files")
+SLIM_OBJSTMS = os.getenv("PDF_SLIM_OBJSTMS", "1") == "1"
+_ICC_REF = re.compile(r"/ICCBased\s*(\d+) 0 R")
+_JS_ACTION = re.compile(r"/S\s*/JavaScript\b")
+_RESOURCE_NAME = re.compile(r"/([^\s/\[\]()<>{}%]+)\s*\d+ 0 R")
+
+
+def _slim_categories(quality_slider: int = None) -> list:
+    # quality_slider=None (target-size mode): the lossless categories only
+    if quality_slider is not None and quality_slider <= 50:
+        return list(SLIM_CATEGORIES)
+    return [c for c in SLIM_CATEGORIES if c not in SLIM_LOSSY]
+
+
+def _object_texts(doc) -> dict:
+    texts = {}
+    for xref in range(1, doc.xref_length()):
+        try:
+            texts[xref] = doc.xref_object(xref, compressed=True)
+        except Exception:
+            pass
+    return texts
+
+
+def _reachable(doc, texts: dict) -> set:
+    seen = set()
+    stack = [int(x) for x in _XREF_REF.findall(doc.pdf_trailer(compressed=True).encode())]
+    while stack:
+        xref = stack.pop()
+        if xref in seen or xref not in texts:
+            continue
+        seen.add(xref)
+        stack.extend(int(x) for x in _XREF_REF.findall(texts[xref].encode()))
+    return seen
+
+
+def _object_bytes(doc, xref: int, texts: dict) -> int:
+    size = len(texts.get(xref, ""))
+    if doc.xref_is_stream(xref):
+        if doc.xref_get_key(xref, "Filter")[0] == "null":
+            # save(deflate=True) will compress it
+            size += len(zlib.compress(doc.xref_stream_raw(xref) or b""))
+        else:
+            size += _stored_bytes(doc, xref)
+    return size
+
+
+def _drop_key(doc, xref: int, path: str) -> bool:
+    # xref_set_key cannot write through indirect objects: follow them first
+    *parents, key = path.split("/")
+    prefix = []
+    for part in parents:
+        kind, value = doc.xref_get_key(xref, "/".join(prefix + [part]))
+        if kind == "null":
+            return False
+        if kind == "xref":
+            xref, prefix = int(value.split()[0]), []
+        else:
+            prefix.append(part)
+    path = "/".join(prefix + [key])
+    if doc.xref_get_key(xref, path)[0] == "null":
+        return False
+    doc.xref_set_key(xref, path, "null")
+    return True
+
+
+def _slim_thumbnails(doc, texts: dict) -> int:
+    return sum(_drop_key(doc, page.xref, "Thumb") for page in doc)
+
+
+def _page_resource_names(doc, xref: int) -> set:
+    # Font and XObject names in the page's (possibly inherited) resource dictionary
+    for _ in range(32):
+        kind, value = doc.xref_get_key(xref, "Resources")
+        if kind != "null":
+            break
+        kind, parent = doc.xref_get_key(xref, "Parent")
+        if kind != "xref":
+            return set()
+        xref = int(parent.split()[0])
+    xref, prefix = (int(value.split()[0]), "") if kind == "xref" else (xref, "Resources/")
+    names = set()
+    for key in ("Font", "XObject"):
+        kind, value = doc.xref_get_key(xref, prefix + key)
+        if kind == "xref":
+            value = doc.xref_object(int(value.split()[0]), compressed=True)
+        if kind != "null":
+            names.update(_RESOURCE_NAME.findall(value))
+    return names
+
+
+def _has_unused_resources(doc, xref: int) -> bool:
+    # A name that merely occurs in the content counts as used: a miss only costs the
+    # slimming. Content streams are read until every name has turned up.
+    names = {b"/" + name.encode() for name in _page_resource_names(doc, xref)}
+    kind, value = doc.xref_get_key(xref, "Contents")
+    if not names or kind not in ("xref", "array"):
+        return bool(names)
+    for stream in _XREF_REF.findall(value.encode()):
+        content = doc.xref_stream(int(stream)) or b""
+        names = {name for name in names if name not in content}
+        if not names:
+            return False
+    return True
+
+
+def _slim_resources(doc, texts: dict) -> int:
+    # MuPDF's sanitizer rewrites a page's content and keeps only the resources it uses.
+    # It re-parses every operator, so it only runs on pages naming resources they never use.
+    cleaned = 0
+    for number in range(doc.page_count):
+        if _has_unused_resources(doc, doc.page_xref(number)):
+            doc[number].clean_contents(sanitize=True)
+            cleaned += 1
+    return cleaned
+
+
+def _slim_javascript(doc, texts: dict) -> int:
+    catalog = doc.pdf_catalog()
+    dropped = _drop_key(doc, catalog, "Names/JavaScript")
+    actions = {x for x, text in texts.items() if _JS_ACTION.search(text)}
+    for xref, text in texts.items():
+        if "JavaScript" not in text and not any(f"{a} 0 R" in text for a in actions):
+            continue
+        for key in ("OpenAction", "A", "AA"):
+            kind, value = doc.xref_get_key(xref, key)
+            if kind == "xref":
+                value = texts.get(int(value.split()[0]), "")
+            if kind != "null" and (_JS_ACTION.search(value) or (key == "AA" and "JavaScript" in value)):
+                dropped += _drop_key(doc, xref, key)
+    return dropped
+
+
+def _slim_embedded_files(doc, texts: dict) -> int:
+    catalog = doc.pdf_catalog()
+    return _drop_key(doc, catalog, "Names/EmbeddedFiles") + _drop_key(doc, catalog, "AF")
+
+
+def _slim_xmp(doc, texts: dict) -> int:
+    return sum(_drop_key(doc, x, "Metadata") for x, text in texts.items() if "/Metadata" in text)
+
+
+def _slim_piece_info(doc, texts: dict) -> int:
+    return sum(_drop_key(doc, x, "PieceInfo") for x, text in texts.items() if "/PieceInfo" in text)
+
+
+def _slim_icc(doc, texts: dict) -> int:
+    profiles = sorted({int(x) for text in texts.values() for x in _ICC_REF.findall(text)})
+    duplicates = _find_duplicates(doc, profiles)
+    if duplicates:
+        _repoint_references(doc, duplicates)
+    return len(duplicates)
+
+
+_SLIMMERS = {
+    "thumbnails": _slim_thumbnails,
+    "resources": _slim_resources,
+    "javascript": _slim_javascript,
+    "embedded_files": _slim_embedded_files,
+    "xmp": _slim_xmp,
+    "piece_info": _slim_piece_info,
+    "icc": _slim_icc,
+}
+
+
+def slim_structure(doc, categories: list = None, deadline: float = None) -> list:
+    """
+    Applies the structural slimming categories (default: all of PDF_SLIM) in order,
+    skipping the rest once deadline (a time.time() value) has passed.
+    Returns one row per category that changed something:
+    {"category", "changes", "objects", "bytes", "ms"} (objects and bytes no longer
+    reachable, time spent on the category).
+    """
+    with span("compress.slim"):
+        texts = _object_texts(doc)
+        live = _reachable(doc, texts)
+        rows = []
+        for category in categories if categories is not None else SLIM_CATEGORIES:
+            if deadline is not None and time.time() >= deadline:
+                break
+            slimmer = _SLIMMERS.get(category)
+            if slimmer is None:
+                continue
+            started = time.perf_counter()
+            try:
+                changes = slimmer(doc, texts)
+            except Exception as e:
+                print(f"Structural slimming '{category}' failed: {e}")
+                continue
+            if not changes:
+                continue
+            after = _object_texts(doc)
+            now_live = _reachable(doc, after)
+            gone, added = live - now_live, now_live - live
+            saved = sum(_object_bytes(doc, x, texts) for x in gone) - sum(_object_bytes(doc, x, after) for x in added)
+            # Keys removed inline (an action dict, /PieceInfo) shrink objects that stay
+            saved += sum(len(texts[x]) - len(after[x]) for x in live & now_live if texts[x] is not after[x] and texts[x] != after[x])
+            rows.append({
+                "category": category, "changes": changes, "objects": len(gone), "bytes": saved,
+                "ms": round((time.perf_counter() - started) * 1000, 1),
+            })
+            texts, live = after, now_live
+        if rows:
+            print("🧹 Structure: " + ", ".join(f"{r['category']} {r['bytes'] / 1024:.0f} KB in {r['ms']:.0f} ms" for r in rows))
+        return rows
+
+
+def live_images(doc) -> list:
+    # Image XREFs still reachable from the trailer: slimming orphans thumbnails and
+    # unused resources, which save(garbage=...) drops, so they are not worth encoding
+    live = _reachable(doc, _object_texts(doc))
+    return [x for x in range(1, doc.xref_length()) if x in live and doc.xref_is_image(x)]
+
+
+def _compression_tier(quality_slider: int):
+    # Determine target DPI and JPEG quality based on slider (1-100)
+    if quality_slider <= 25: return 60, 15
+    elif quality_slider <= 40: return 72, 20
+    elif quality_slider <= 60: return 120, 50
+    elif quality_slider <= 85: return 150, 75
+    else: return 300, 90
+
+
+# Effective DPI: an image is downsampled to the tier's DPI at the largest size it is
+# drawn anywhere in the document, not to a fixed letter-page width. A 2000 px logo drawn
+# 1 inch wide keeps 150 px at 150 DPI; a full-bleed A3 spread keeps all the pixels it
+# needs. Placements come from every page's display list (nested forms included) as
+# inches per source pixel; images never drawn directly (patterns, Type3 glyphs) keep
+# the old 8.5-inch rule, and soft masks follow the image they belong to.
+def image_placements(doc, deadline: float = None) -> dict:
+    """
+    {image xref: inches per source pixel at its largest placement}.
+    Scaling by factor * dpi gives exactly dpi where the image is drawn biggest.
+    Pages left when deadline (a time.time() value) passes are not scanned.
+    """
+    with span("compress.placements"):
+        placements = {}
+        for page in doc:
+            if deadline is not None and time.time() >= deadline:
+                # Images seen only on later pages fall back to the 8.5-inch rule
+                break
+            try:
+                # xrefs=True would hash every image's pixels to identify it; match the
+                # cheap draw list to the page's image XREFs by pixel size instead. Two
+                # images of the same size share the larger factor, which never undersamples.
+                by_size = {}
+                for item in page.get_images(full=True):
+                    by_size.setdefault((item[2], item[3]), []).append(item[0])
+                if not by_size:
+                    # Building the draw list costs ~2 ms a page; text pages have nothing to match
+                    continue
+                infos = page.get_image_info()
+            except Exception:
+                continue
+            for info in infos:
+                w, h = info.get("width"), info.get("height")
+                if not w or not h or (w, h) not in by_size:
+                    continue
+                # The transform maps the unit square onto the page, so its axis lengths
+                # are the drawn width and height in points, whatever the rotation
+                a, b, c, d = info["transform"][:4]
+                factor = max((a * a + b * b) ** 0.5 / w, (c * c + d * d) ** 0.5 / h) / 72
+                for xref in by_size[(w, h)]:
+                    if factor > placements.get(xref, 0):
+                        placements[xref] = factor
+        for xref, factor in list(placements.items()):
+            kind, value = doc.xref_get_key(xref, "SMask")
+            if kind == "xref":
+                mask = int(value.split()[0])
+                placements[mask] = max(placements.get(mask, 0), factor)
+        return placements
+
+
+def _dpi_scale(width: int, dpi: int, placement: float = None) -> float:
+    # Fraction of the source width needed for dpi; never upsamples
+    if not width:
+        return 1.0
+    if placement is None:
+        return min(1.0, int(8.5 * dpi) / width)
+    return min(1.0, placement * dpi)
+
+
+# Already-efficient JPEGs: decoding a DCT image only to re-encode it at about the same
+# quality burns CPU and adds generation loss. The JPEG header alone (no pixel data)
+# gives size, components and quantisation tables; the luma table's scale against the
+# IJG standard table inverts libjpeg's quality formula. Streams at or below the tier's
+# quality (plus a rounding margin), or already under JPEG_SKIP_MAX_BPP, are kept without
+# decoding unless the tier must downscale them or they are colour JPEGs of gray content.
+JPEG_SKIP_QUALITY_MARGIN = int(os.getenv("PDF_JPEG_SKIP_MARGIN", "2"))
+JPEG_SKIP_MAX_BPP = 0.2
+JPEG_SKIP_MIN_AREA = 0.8  # re-encode anyway when the tier drops over 20% of the pixels
+_IJG_LUMA_TABLE_SUM = 3688  # sum of the Annex K luminance table, i.e. quality 50
+
+
+def _jpeg_quality(tables: dict) -> int:
+    luma = tables.get(0)
+    if not luma:
+        return 100
+    scale = sum(luma) * 100 / _IJG_LUMA_TABLE_SUM
+    quality = (200 - scale) / 2 if scale <= 100 else 5000 / scale
+    return max(1, min(100, round(quality)))
+
+
+def _skip_reencode(doc, xref: int, target_dpi: int, jpg_quality: int, placement: float = None) -> bool:
+    """
+    True if xref is a plain JPEG the tier could not shrink meaningfully: it needs no
+    real downscale, is already at or below the tier quality, and is not a colour JPEG
+    of gray content (those still lose two channels).
+    """
+    kind, value = doc.xref_get_key(xref, "Filter")
+    if value.strip("[] ") != "/DCTDecode":
+        return False
+    try:
+        raw = doc.xref_stream_raw(xref) or b""
+        with Image.open(io.BytesIO(raw)) as jpeg:
+            width, height = jpeg.size
+            mode = jpeg.mode
+            tables = getattr(jpeg, "quantization", None) or {}
+    except Exception:
+        return False
+    if mode not in ("L", "RGB"):
+        return False
+    scale = _dpi_scale(width, target_dpi, placement)
+    if scale * scale < JPEG_SKIP_MIN_AREA:
+        return False
+    bits_per_pixel = len(raw) * 8 / max(1, width * height)
+    if bits_per_pixel > JPEG_SKIP_MAX_BPP and _jpeg_quality(tables) > jpg_quality + JPEG_SKIP_QUALITY_MARGIN:
+        return False
+    return mode == "L" or _jpeg_is_color(raw)
+
+
+# Adaptive colour: every image is classified from its own pixels as colour, gray or
+# bilevel and stored in the cheapest form that keeps it - a 1-channel JPEG for gray
+# content (a third of the samples), 1-bit G4/Flate for two-tone line art, RGB only
+# when there is real colour. Chroma is measured on a filtered downsample of about
+# CLASSIFY_PIXELS, where scanner noise, JPEG chroma bleed and colour fringes on glyph
+# edges average out but a colour area of any real size does not. A mild paper tint
+# (yellowed or cream pages) is white-balanced away first, from the brightest quarter.
+# Bilevel needs almost no mid-tones on a nearest-neighbour sample of the full image,
+# since a filtered one would blur every edge into gray.
+GRAY_CHROMA = int(os.getenv("PDF_GRAY_CHROMA", "28"))
+GRAY_MAX_COLOR_FRACTION = float(os.getenv("PDF_GRAY_MAX_COLOR_FRACTION", "0.002"))
+AUTO_BILEVEL_MAX_MIDTONES = float(os.getenv("PDF_AUTO_BILEVEL_MAX_MIDTONES", "0.02"))
+AUTO_BILEVEL_MIN_TONE = 0.001
+CLASSIFY_PIXELS = 65536
+PAPER_TINT_MAX = 1.25  # strongest per-channel gain still treated as paper colour
+_LUMA = np.array([0.299, 0.587, 0.114], dtype=np.float32)
+
+
+def _has_color(rgb: np.ndarray) -> bool:
+    # rgb: (pixels, 3) uint8
+    rgb = rgb.astype(np.float32)
+    luma = rgb @ _LUMA
+    paper = rgb[luma >= np.percentile(luma, 75)].mean(axis=0)
+    if paper.min() >= 128 and paper.max() <= paper.min() * PAPER_TINT_MAX:
+        rgb *= paper.mean() / paper
+    spread = rgb.max(axis=1) - rgb.min(axis=1)
+    return np.count_nonzero(spread > GRAY_CHROMA) > GRAY_MAX_COLOR_FRACTION * len(spread)
+
+
+def _classify_pixmap(pix) -> str:
+    """
+    "color", "gray" or "bilevel" for a decoded image pixmap (gray or RGB, alpha ignored).
+    """
+    n = pix.colorspace.n if pix.colorspace else 1
+    step = max(1, int((pix.width * pix.height / CLASSIFY_PIXELS) ** 0.5))
+    if n == 3:
+        small = pix
+        if step > 1:
+            small = fitz.Pixmap(pix, max(1, pix.width // step), max(1, pix.height // step))
+        pixels = np.frombuffer(small.samples_mv, np.uint8).reshape(small.height, small.stride)
+        pixels = pixels[:, :small.width * small.n].reshape(-1, small.n)[:, :3]
+        if _has_color(pixels):
+            return "color"
+    rows = np.frombuffer(pix.samples_mv, np.uint8).reshape(pix.height, pix.stride)[::step]
+    sample = rows[:, :pix.width * pix.n].reshape(len(rows), pix.width, pix.n)[:, ::step, :n]
+    luma = sample.reshape(-1, n).astype(np.float32) @ _LUMA if n == 3 else sample.reshape(-1)
+    # Both tones must be there: an all-light or all-dark image would threshold to nothing
+    dark, light = np.count_nonzero(luma <= 64), np.count_nonzero(luma >= 192)
+    midtones = luma.size - dark - light
+    if midtones <= AUTO_BILEVEL_MAX_MIDTONES * luma.size and min(dark, light) >= AUTO_BILEVEL_MIN_TONE * luma.size:
+        return "bilevel"
+    return "gray"
+
+
+def _jpeg_is_color(raw: bytes) -> bool:
+    # DCT-domain 1/8 decode: enough pixels to classify, at a fraction of a full decode
+    try:
+        with Image.open(io.BytesIO(raw)) as jpeg:
+            jpeg.draft("RGB", (max(1, jpeg.width // 8), max(1, jpeg.height // 8)))
+            pixels = np.asarray(jpeg.convert("RGB"))
+        return _has_color(pixels.reshape(-1, 3))
+    except Exception:
+        return True
+
+
+# Flat-colour images (diagrams, screenshots, line art with colour) are a few solid
+# colours with sharp edges: JPEG spends bits on ringing around every edge and still
+# smears them. Such images go to a palette: up to PALETTE_MAX_COLORS colours, exact
+# when the image has no more, median-cut (no dither) otherwise, packed at 1/2/4/8 bits
+# and Flate-compressed as an /Indexed image. Flatness is read from a strided sample:
+# the share of neighbouring samples that differ (edge density) and the share covered
+# by the PALETTE_DOMINANT commonest colours. Anti-aliasing and scaling add thousands
+# of rare colours, so a plain colour count says little. Photos fail both tests and
+# stay on JPEG; for candidates both encodings are made and the smaller one is kept.
+PALETTE_MAX_COLORS = 256
+PALETTE_MAX_EDGES = float(os.getenv("PDF_PALETTE_MAX_EDGES", "0.25"))
+PALETTE_DOMINANT = 16
+PALETTE_MIN_COVERAGE = 0.8
+
+PaletteImage = namedtuple("PaletteImage", "data width height bits colorspace")
+
+
+def _is_flat(pix) -> bool:
+    if pix.alpha:
+        return False
+    step = max(1, int((pix.width * pix.height / CLASSIFY_PIXELS) ** 0.5))
+    rows = np.frombuffer(pix.samples_mv, np.uint8).reshape(pix.height, pix.stride)[::step]
+    sample = rows[:, :pix.width * pix.n].reshape(len(rows), pix.width, pix.n)[:, ::step].astype(np.uint32)
+    packed = sample[..., 0] if pix.n == 1 else (sample[..., 0] << 16) | (sample[..., 1] << 8) | sample[..., 2]
+    if packed.size < 2:
+        return False
+    edges = np.count_nonzero(packed[:, 1:] != packed[:, :-1]) + np.count_nonzero(packed[1:] != packed[:-1])
+    pairs = packed[:, 1:].size + packed[1:].size
+    if edges > PALETTE_MAX_EDGES * pairs:
+        return False
+    counts = np.unique(packed, return_counts=True)[1]
+    return np.sort(counts)[-PALETTE_DOMINANT:].sum() >= PALETTE_MIN_COVERAGE * packed.size
+
+
+def _encode_palette(pix) -> PaletteImage:
+    mode = "L" if pix.n == 1 else "RGB"
+    img = Image.frombuffer(mode, (pix.width, pix.height), pix.samples_mv, "raw", mode, pix.stride, 1)
+    colors = img.getcolors(PALETTE_MAX_COLORS)
+    if colors is not None:
+        # Few enough colours: an exact palette, indices by lookup in the sorted colours
+        pixels = np.asarray(img).astype(np.uint32)
+        packed = pixels if mode == "L" else (pixels[..., 0] << 16) | (pixels[..., 1] << 8) | pixels[..., 2]
+        keys = np.unique(packed)
+        indices = np.searchsorted(keys, packed).astype(np.uint8)
+        if mode == "L":
+            palette = keys.astype(np.uint8)
+        else:
+            palette = np.stack([keys >> 16, (keys >> 8) & 255, keys & 255], axis=1).astype(np.uint8)
+    else:
+        quantized = img.quantize(PALETTE_MAX_COLORS, method=Image.Quantize.MEDIANCUT, dither=Image.Dither.NONE)
+        indices = np.asarray(quantized)
+        count = int(indices.max()) + 1
+        palette = np.array(quantized.getpalette()[:3 * count], dtype=np.uint8).reshape(count, 3)
+    count = len(palette)
+    bits = 1 if count <= 2 else 2 if count <= 4 else 4 if count <= 16 else 8
+    if bits < 8:
+        # Pack 8 / bits indices per byte, rows padded to whole bytes
+        per_byte = 8 // bits
+        h, w = indices.shape
+        padded = np.zeros((h, -(-w // per_byte) * per_byte), np.uint8)
+        padded[:, :w] = indices
+        groups = padded.reshape(h, -1, per_byte)
+        shifts = np.arange(8 - bits, -1, -bits, dtype=np.uint8)
+        indices = np.bitwise_or.reduce(groups << shifts, axis=2).astype(np.uint8)
+    base = "/DeviceGray" if mode == "L" else "/DeviceRGB"
+    colorspace = f"[/Indexed {base} {count - 1} <{palette.tobytes().hex()}>]"
+    # Level 6: level 9 is about 8x slower for 3-4% on index data
+    return PaletteImage(zlib.compress(indices.tobytes(), 6), pix.width, pix.height, bits, colorspace)
+
+
+def _apply_palette(doc, xref: int, image: PaletteImage):
+    with span("compress.update_stream"):
+        try:
+            doc.update_stream(xref, image.data, compress=False)
+            for key, value in (
+                ("Filter", "/FlateDecode"), ("DecodeParms", "null"),
+                ("Width", str(image.width)), ("Height", str(image.height)),
+                ("BitsPerComponent", str(image.bits)), ("ColorSpace", image.colorspace), ("Decode", "null"),
+            ):
+                doc.xref_set_key(xref, key, value)
+        except Exception as e:
+            print(f"Palette update failed for XREF {xref}: {e}")
+
+
+def _encode_classified(base, kind: str, target_dpi: int, jpg_quality: int, old_size: int, placement: float = None, pixmaps: dict = None, scaled=None):
+    """
+    Encodes a decoded image of class kind for one tier: a BilevelImage (if 1 bit beats
+    old_size, else it goes gray), gray or RGB JPEG bytes, or a PaletteImage for flat
+    images where that is smaller; None if nothing beats old_size.
+    pixmaps caches scaled/gray pixmaps by (width, height, gray) across tiers;
+    scaled(dpi, gray) replaces that cache (target mode's _PixmapCache).
+    """
+    pixmaps = {} if pixmaps is None else pixmaps
+
+    def scale_base(dpi, gray):
+        scale = _dpi_scale(base.width, dpi, placement)
+        size = (base.width, base.height)
+        if scale < 1.0:
+            size = (max(1, int(base.width * scale)), max(1, int(base.height * scale)))
+        gray = gray and base.colorspace.n != 1
+        pix = pixmaps.get((*size, gray))
+        if pix is None:
+            pix = base if size == (base.width, base.height) else pixmaps.get((*size, False))
+            if pix is None:
+                with span("compress.scale"):
+                    pix = pixmaps[(*size, False)] = fitz.Pixmap(base, *size)
+            if gray:
+                with span("compress.grayscale"):
+                    pix = pixmaps[(*size, True)] = fitz.Pixmap(fitz.csGRAY, pix)
+        return pix
+
+    scaled = scaled or scale_base
+    if kind == "bilevel" and not base.alpha:
+        # 1 bit needs the sharper of the tier and bilevel DPIs to stay legible
+        pix = scaled(max(target_dpi, BILEVEL_DPI), True)
+        with span("compress.bilevel_encode"):
+            gray = np.frombuffer(pix.samples_mv, np.uint8).reshape(pix.height, pix.stride)[:, :pix.width]
+            image = _encode_bilevel(gray >= 128)
+        if len(image.data) < old_size:
+            return image
+    pix = scaled(target_dpi, kind != "color")
+    with span("compress.jpeg_encode"):
+        img_bytes = pix.tobytes("jpeg", jpg_quality=jpg_quality)
+    with span("compress.palette_encode"):
+        if _is_flat(pix):
+            palette = _encode_palette(pix)
+            if len(palette.data) < len(img_bytes):
+                img_bytes = palette
+    # Compare with the stored (still encoded) stream, not the decoded pixels
+    size = len(img_bytes.data) if isinstance(img_bytes, PaletteImage) else len(img_bytes)
+    return img_bytes if size < old_size else None
+
+
+def _recompress_xref(doc, xref: int, target_dpi: int, jpg_quality: int, placement: float = None):
+    """
+    Re-encodes one image XREF in the cheapest form its content allows (see
+    _classify_pixmap). Returns JPEG bytes, a BilevelImage or PaletteImage, or None to
+    keep the original.
+    placement is its image_placements() factor (None: not drawn directly).
+    Never modifies doc, so it is safe on a read-only copy in a worker process.
+    """
+    try:
+        with span("compress.precheck"):
+            # Stencil masks are 1 bit already and cannot carry a colour space
+            if doc.xref_get_key(xref, "ImageMask")[1] == "true":
+                return None
+            if _skip_reencode(doc, xref, target_dpi, jpg_quality, placement):
+                return None
+        with span("compress.decode"):
+            pix = fitz.Pixmap(doc, xref)
+            if pix.colorspace.n > 3 or pix.colorspace.name in ("DeviceCMYK", "Indexed"):
+                pix = fitz.Pixmap(fitz.csRGB, pix)
+        with span("compress.classify"):
+            kind = _classify_pixmap(pix)
+        old_size = len(doc.xref_stream_raw(xref) or b"")
+        return _encode_classified(pix, kind, target_dpi, jpg_quality, old_size, placement)
+    except: pass
+    return None
+
+
+_JPEG_COLORSPACES = {"L": "/DeviceGray", "RGB": "/DeviceRGB", "CMYK": "/DeviceCMYK"}
+
+
+def _apply_recompressed(doc, xref: int, img_bytes: bytes):
+    with span("compress.update_stream"):
+        try:
+            # compress=False: a deflated JPEG labelled /DCTDecode would not render
+            doc.update_stream(xref, img_bytes, compress=False)
+            doc.xref_set_key(xref, "Filter", "/DCTDecode")
+            try: doc.xref_set_key(xref, "DecodeParms", "null")
+            except: pass
+            # The dictionary must describe the new JPEG: scaling changes its size and
+            # grayscale/CMYK/Indexed conversion its colour space (header read only)
+            with Image.open(io.BytesIO(img_bytes)) as header:
+                width, height = header.size
+                colorspace = _JPEG_COLORSPACES.get(header.mode)
+            doc.xref_set_key(xref, "Width", str(width))
+            doc.xref_set_key(xref, "Height", str(height))
+            doc.xref_set_key(xref, "BitsPerComponent", "8")
+            if colorspace:
+                doc.xref_set_key(xref, "ColorSpace", colorspace)
+                doc.xref_set_key(xref, "Decode", "null")
+        except: pass
+
+
+# Bilevel scan mode: a scanned book page is one image covering the page, mostly paper
+# white with dark ink and few mid-tones. Such images are thresholded to 1 bit with a
+# vectorised Bradley-Roth adaptive threshold (survives uneven lighting and yellowed
+# paper) and stored as CCITT G4, or Flate-packed 1-bit rows when Pillow has no libtiff.
+# A G4 text page is typically 30-80 KB at 200 DPI and decodes far faster than a JPEG.
+# Images that fail the text test (photos, colour plates) fall back to the JPEG tier.
+BILEVEL_DPI = int(os.getenv("PDF_BILEVEL_DPI", "200"))
+BILEVEL_MAX_MIDTONES = float(os.getenv("PDF_BILEVEL_MAX_MIDTONES", "0.12"))
+BILEVEL_PAGE_COVERAGE = 0.85
+BILEVEL_SENSITIVITY = 15  # percent darker than the neighbourhood mean counts as ink
+
+try:
+    from PIL import features as _pil_features
+    BILEVEL_G4 = bool(_pil_features.check("libtiff"))
+except Exception:
+    BILEVEL_G4 = False
+
+BilevelImage = namedtuple("BilevelImage", "data width height filter decode_parms")
+
+
+def _scan_page_images(doc) -> dict:
+    """
+    {xref: display width in points} for opaque images that fill most of a page.
+    """
+    found = {}
+    for page in doc:
+        page_area = abs(page.rect)
+        for item in page.get_images(full=True):
+            xref = item[0]
+            if doc.xref_get_key(xref, "SMask")[0] != "null" or doc.xref_get_key(xref, "ImageMask")[1] == "true":
+                continue
+            try:
+                rects = page.get_image_rects(xref)
+            except Exception:
+                continue
+            for rect in rects:
+                if abs(rect) >= BILEVEL_PAGE_COVERAGE * page_area:
+                    found[xref] = max(found.get(xref, 0), rect.width)
+    return found
+
+
+def _looks_like_text(gray: np.ndarray) -> bool:
+    # Light paper, and almost nothing between ink and paper. Photos and gradients
+    # spread across the mid-tones; antialiased glyph edges only add a few percent.
+    sample = gray[::4, ::4]
+    paper = float(np.percentile(sample, 90))
+    if paper < 128:
+        return False
+    mid = np.count_nonzero((sample >= 0.45 * paper) & (sample < 0.8 * paper))
+    return mid / sample.size <= BILEVEL_MAX_MIDTONES
+
+
+def _adaptive_threshold(gray: np.ndarray, window: int) -> np.ndarray:
+    """
+    Bradley-Roth threshold: True (white) unless a pixel is BILEVEL_SENSITIVITY percent
+    darker than the mean of the window around it. Window sums come from one integral
+    image, so the cost is a few whole-array operations whatever the window size.
+    """
+    h, w = gray.shape
+    r = window // 2
+    integral = np.zeros((h + 1, w + 1), dtype=np.int64)
+    integral[1:, 1:] = gray.cumsum(0, dtype=np.int64).cumsum(1)
+    y0 = np.clip(np.arange(h) - r, 0, h)
+    y1 = np.clip(np.arange(h) + r + 1, 0, h)
+    x0 = np.clip(np.arange(w) - r, 0, w)
+    x1 = np.clip(np.arange(w) + r + 1, 0, w)
+    top, bottom = integral[y0], integral[y1]
+    sums = bottom[:, x1] - bottom[:, x0] - top[:, x1] + top[:, x0]
+    counts = (y1 - y0)[:, None] * (x1 - x0)[None, :]
+    return gray.astype(np.int64) * counts * 100 >= sums * (100 - BILEVEL_SENSITIVITY)
+
+
+def _encode_bilevel(white: np.ndarray) -> BilevelImage:
+    h, w = white.shape
+    if BILEVEL_G4:
+        try:
+            buf = io.BytesIO()
+            # One strip (RowsPerStrip = height) so the strip is a complete G4 stream
+            Image.fromarray(white).save(buf, "TIFF", compression="group4", tiffinfo={278: h})
+            tiff = Image.open(buf)
+            offsets, counts = tiff.tag_v2[273], tiff.tag_v2[279]
+            if len(offsets) == 1:
+                data = buf.getvalue()[offsets[0]:offsets[0] + counts[0]]
+                # Pillow's fax encoder codes set (white) bits the way PDF's BlackIs1 expects
+                return BilevelImage(data, w, h, "/CCITTFaxDecode", f"<</K -1/Columns {w}/Rows {h}/BlackIs1 true>>")
+        except Exception as e:
+            print(f"G4 encode failed, using Flate: {e}")
+    # DeviceGray at 1 bit per component: 1 is white
+    return BilevelImage(zlib.compress(np.packbits(white, axis=1).tobytes(), 9), w, h, "/FlateDecode", "null")
+
+
+def _bilevel_xref(doc, xref: int, display_width: float):
+    """
+    Thresholds a page-sized scan to 1 bit at BILEVEL_DPI. Returns a BilevelImage, or
+    None if the image does not look like text on paper or would not get smaller.
+    Never modifies doc.
+    """
+    try:
+        with span("bilevel.decode"):
+            pix = fitz.Pixmap(doc, xref)
+            if pix.alpha:
+                pix = fitz.Pixmap(pix, 0)
+            if pix.colorspace is None or pix.colorspace.n != 1:
+                pix = fitz.Pixmap(fitz.csGRAY, pix)
+            target_width = int(display_width / 72 * BILEVEL_DPI)
+            if 0 < target_width < pix.width:
+                scale = target_width / pix.width
+                pix = fitz.Pixmap(pix, int(pix.width * scale), int(pix.height * scale))
+            gray = np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.height, pix.stride)[:, :pix.width]
+
+        with span("bilevel.classify"):
+            if not _looks_like_text(gray):
+                return None
+        with span("bilevel.threshold"):
+            white = _adaptive_threshold(gray, max(15, BILEVEL_DPI // 6) | 1)
+        with span("bilevel.encode"):
+            image = _encode_bilevel(white)
+        if len(image.data) < len(doc.xref_stream_raw(xref) or b""):
+            return image
+    except Exception as e:
+        print(f"Bilevel conversion skipped for XREF {xref}: {e}")
+    return None
+
+
+def _apply_bilevel(doc, xref: int, image: BilevelImage):
+    with span("bilevel.update_stream"):
+        try:
+            doc.update_stream(xref, image.data, compress=False)
+            for key, value in (
+                ("Filter", image.filter), ("DecodeParms", image.decode_parms),
+                ("Width", str(image.width)), ("Height", str(image.height)),
+                ("BitsPerComponent", "1"), ("ColorSpace", "/DeviceGray"), ("Decode", "null"),
+            ):
+                doc.xref_set_key(xref, key, value)
+        except Exception as e:
+            print(f"Bilevel update failed for XREF {xref}: {e}")
+
+
+def _encode_xref(doc, xref: int, target_dpi: int, jpg_quality: int, bilevel: dict, placements: dict):
+    # Scanned text pages try 1 bit first and fall back to the slider's JPEG tier
+    if xref in bilevel:
+        image = _bilevel_xref(doc, xref, bilevel[xref])
+        if image is not None:
+            return image
+    return _recompress_xref(doc, xref, target_dpi, jpg_quality, placements.get(xref))
+
+
+def _apply_encoded(doc, xref: int, encoded):
+    if isinstance(encoded, BilevelImage):
+        _apply_bilevel(doc, xref, encoded)
+    elif isinstance(encoded, PaletteImage):
+        _apply_palette(doc, xref, encoded)
+    else:
+        _apply_recompressed(doc, xref, encoded)
+
+
+def _recompress_partition(input_path: str, xrefs: list, target_dpi: int, jpg_quality: int, bilevel=None, placements=None, deadline=None):
+    # Worker-process side of the parallel mode. XREFs not started by the deadline
+    # (a time.time() value) are left out of the result.
+    doc = fitz.open(input_path)
+    try:
+        encoded = []
+        for xref in xrefs:
+            if deadline is not None and time.time() >= deadline:
+                break
+            encoded.append((xref, _encode_xref(doc, xref, target_dpi, jpg_quality, bilevel or {}, placements or {})))
+        return encoded
+    finally:
+        doc.close()
+
+
+def _xref_workers(image_count: int) -> int:
+    # Default fan-out for image_count XREFs, capped at this job's share of the cores so a
+    # "pdf" pool worker doesn't start a second full-size pool (1 when the pool fills the CPUs)
+    from app.executor import cpu_share
+    if image_count < XREF_PARALLEL_MIN_IMAGES:
+        return 1
+    return max(1, min(XREF_WORKERS, cpu_share()))
+
+
+def _recompress_parallel(input_path: str, image_xrefs: list, workers: int, target_dpi, jpg_quality, progress=None, bilevel=None, placements=None, deadline=None):
+    """
+    Fans image XREFs out to a process pool.
+    Returns {xref: jpeg bytes, BilevelImage, PaletteImage or None}; with a deadline, only the
+    XREFs started before it.
+    """
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+    from app.executor import _get_context
+    from app.tracing import run_traced, current_trace
+
+    # Several small partitions per worker keep the cores busy when page sizes vary
+    chunk = max(1, len(image_xrefs) // (workers * 4))
+    partitions = [image_xrefs[i:i + chunk] for i in range(0, len(image_xrefs), chunk)]
+    results = {}
+    trace = current_trace()
+    placements = placements or {}
+    with ProcessPoolExecutor(max_workers=workers, mp_context=_get_context()) as pool:
+        futures = [
+            pool.submit(run_traced, _recompress_partition, (
+                input_path, part, target_dpi, jpg_quality, bilevel,
+                {x: placements[x] for x in part if x in placements}, deadline,
+            ), {})
+            for part in partitions
+        ]
+        for future in as_completed(futures):
+            encoded, stages = future.result()
+            results.update(encoded)
+            if trace is not None:
+                trace.merge(stages)
+            if progress:
+                progress(len(results), len(image_xrefs))
+    return results
+
+
+# Linearized output ("fast web view"): MuPDF no longer writes linearized files, so the
+# save stage of every PDF-producing agent hands the saved file to qpdf (via pikepdf),
+# which rewrites it with page 1's objects and the hint stream first. A viewer on a slow
+# link then draws the first page after the first few KB instead of waiting for the
+# xref at the end of the file. PDF_LINEARIZE=0 turns it off; without pikepdf files
+# are left as saved.
+LINEARIZE = os.getenv("PDF_LINEARIZE", "1") == "1"
+# Linearizing moves first-page objects out of object streams and adds hint tables: a few
+# KB on most files, but a third more on long text documents. A linearized file larger
+# than the plain one by more than this is dropped and the plain file kept.
+LINEARIZE_MAX_GROWTH = float(os.getenv("PDF_LINEARIZE_MAX_GROWTH", "0.01"))
+LINEARIZE_MAX_GROWTH_BYTES = 4 * 1024
+
+
+def linearize_pdf(path: str, max_bytes: int = None) -> str:
+    """
+    Rewrites the PDF at path in place as a linearized file and returns path.
+    The plain file is kept when linearizing grows it past LINEARIZE_MAX_GROWTH (or past
+    max_bytes), or on any failure (no pikepdf, encrypted or unreadable file).
+    """
+    if not LINEARIZE:
+        return path
+    try:
+        import pikepdf
+    except ImportError:
+        return path
+    tmp_path = path + ".linear"
+    try:
+        with span("pdf.linearize"):
+            with pikepdf.open(path) as pdf:
+                pdf.save(tmp_path, linearize=True, object_stream_mode=pikepdf.ObjectStreamMode.preserve)
+            plain, linear = os.path.getsize(path), os.path.getsize(tmp_path)
+            limit = plain + max(LINEARIZE_MAX_GROWTH_BYTES, int(plain * LINEARIZE_MAX_GROWTH))
+            if max_bytes is not None:
+                limit = min(limit, max(plain, max_bytes))
+            if linear > limit:
+                print(f"Linearization dropped for {os.path.basename(path)}: {plain // 1024} KB -> {linear // 1024} KB")
+                os.remove(tmp_path)
+                return path
+            os.replace(tmp_path, path)
+    except Exception as e:
+        print(f"Linearization skipped for {os.path.basename(path)}: {e}")
+        try: os.remove(tmp_path)
+        except: pass
+    return path
+
+
+# Deadline mode: with deadline_ms, images are re-encoded biggest expected saving first
+# and no new image is started once the deadline (minus the time the save is expected
+# to take) has passed. What is done is kept, the rest is left as it was, and the file
+# is written with a fast save profile. One image already being encoded still finishes,
+# so the overshoot is bounded by the slowest single image. The fast save still deflates:
+# slimming rewrites page content uncompressed. If the result is not smaller than the
+# input, the input is returned as it was.
+DEADLINE_EST_BPP = 1.0  # bits per output pixel assumed when ranking images
+FAST_SAVE = dict(garbage=1, deflate=True)
+FAST_SAVE_BYTES_PER_SEC = 400 * 1024 * 1024  # conservative; deflate only touches unfiltered streams
+FULL_SAVE = dict(garbage=4, deflate=True, clean=True, deflate_fonts=True, deflate_images=True, use_objstms=SLIM_OBJSTMS)
+
+
+def _stored_bytes(doc, xref: int) -> int:
+    kind, value = doc.xref_get_key(xref, "Length")
+    if kind == "int":
+        return int(value)
+    # Indirect or missing /Length: measure the stream itself
+    return len(doc.xref_stream_raw(xref) or b"")
+
+
+def _savings_potential(doc, xref: int, stored: int, target_dpi: int, placement: float = None) -> float:
+    # Stored bytes minus a rough size of the re-encoded image at the tier DPI
+    try:
+        width = int(doc.xref_get_key(xref, "Width")[1])
+        height = int(doc.xref_get_key(xref, "Height")[1])
+    except ValueError:
+        return stored
+    scale = min(1.0, _dpi_scale(width, target_dpi, placement))
+    return stored - width * height * scale * scale * DEADLINE_EST_BPP / 8
+
+
+def run_iterative_pdf_compression(input_path: str, quality_slider: int, progress=None, workers: int = None, bilevel: bool = False, deadline_ms: int = None, report: dict = None) -> str:
     """
     Standard Tier High-Power Compressor: 
     - Quality > 30: Uses sophisticated XREF-wide iteration (Preserves text).
     - Quality <= 30: Uses "Nuclear 2.0" Rasterization (Guaranteed 1/3+ reduction).
+    Optional progress(done, total) is called after every image XREF.
+    workers > 1 re-encodes image XREFs in that many processes (default PDF_XREF_WORKERS
+    capped at the job's share of the cores, used once the file has PDF_XREF_PARALLEL_MIN
+    images); workers=1 forces the serial loop.
+    bilevel=True stores scanned text pages as 1-bit images (see compress_pdf_bilevel).
+    deadline_ms bounds the run (see compress_pdf_within_deadline); report, if given,
+    is filled with how much of the document was optimized.
     """
+    started = time.time()
     out_path = input_path + "_compressed.pdf"
     doc = fitz.open(input_path)
     
@@ -18,40 +1082,91 @@ def run_iterative_pdf_compression(input_path: str, quality_slider: int) -> str:
         # --- PHASE 1: PERFECT STRUCTURAL v0 (USER PREFERRED QUALITY) ---
         # This method performs a reiterative loop over all XREFs, re-encoding them 
         # at calibrated DPIs while preserving the sharpness of vector text.
-        
-        # Determine target DPI and JPEG quality based on slider (1-100)
-        if quality_slider <= 25: target_dpi, jpg_quality = 60, 15
-        elif quality_slider <= 40: target_dpi, jpg_quality = 72, 20
-        elif quality_slider <= 60: target_dpi, jpg_quality = 120, 50
-        elif quality_slider <= 85: target_dpi, jpg_quality = 150, 75
-        else: target_dpi, jpg_quality = 300, 90
-
-        # Reiterative XREF loop to shrink images while preserving text
-        for xref in range(1, doc.xref_length()):
-            if not doc.xref_is_image(xref):
-                continue
+        # Colour, gray or 1 bit is decided per image from its pixels, not by the slider
+        target_dpi, jpg_quality = _compression_tier(quality_slider)
+
+        deadline = None
+        if deadline_ms:
+            # The save cannot be interrupted, so stop encoding early enough to fit it
+            save_reserve = os.path.getsize(input_path) / FAST_SAVE_BYTES_PER_SEC
+            deadline = started + max(0.0, deadline_ms / 1000 - save_reserve)
+
+        # Reiterative XREF loop to shrink images while preserving text.
+        # Identical copies are merged first so each unique image is encoded once.
+        # Structure first, so dropped thumbnails and unused images are never encoded.
+        # Under a deadline these passes stop where it falls, like the encode loop.
+        structure = slim_structure(doc, _slim_categories(quality_slider), deadline)
+        if report is not None:
+            report["structure"] = structure
+        if deadline is not None and time.time() >= deadline:
+            # No time left to walk the object graph for reachable images
+            image_xrefs = [x for x in range(1, doc.xref_length()) if doc.xref_is_image(x)]
+        else:
+            image_xrefs = dedup_images(doc, live_images(doc), deadline)
+        if workers is None:
+            workers = _xref_workers(len(image_xrefs))
+        workers = max(1, min(workers, len(image_xrefs)))
+        placements = image_placements(doc, deadline) if image_xrefs else {}
+        # A pass cut short means the file is not the full result, even with every image encoded
+        prepass_cut = deadline is not None and time.time() >= deadline
+        scans = {}
+        if bilevel:
+            unique = set(image_xrefs)
+            scans = {x: w for x, w in _scan_page_images(doc).items() if x in unique}
+
+        stored = {}
+        if deadline_ms:
+            stored = {x: _stored_bytes(doc, x) for x in image_xrefs}
+            image_xrefs.sort(key=lambda x: -_savings_potential(doc, x, stored[x], target_dpi, placements.get(x)))
+
+        encoded = None
+        if workers > 1:
+            if progress:
+                progress(0, len(image_xrefs))
             try:
-                pix = fitz.Pixmap(doc, xref)
-                if pix.colorspace.n > 3 or pix.colorspace.name in ("DeviceCMYK", "Indexed"):
-                    pix = fitz.Pixmap(fitz.csRGB, pix)
+                encoded = _recompress_parallel(input_path, image_xrefs, workers, target_dpi, jpg_quality, progress, scans, placements, deadline)
+            except Exception as e:
+                print(f"Parallel XREF recompression failed, falling back to serial: {e}")
 
-                target_width = int(8.5 * target_dpi)
-                if pix.width > target_width:
-                    scale = target_width / pix.width
-                    pix = fitz.Pixmap(pix, int(pix.width * scale), int(pix.height * scale))
+        if encoded is None:
+            encoded = {}
+            for done, xref in enumerate(image_xrefs, start=1):
+                if deadline is not None and time.time() >= deadline:
+                    break
+                if progress:
+                    progress(done - 1, len(image_xrefs))
+                encoded[xref] = _encode_xref(doc, xref, target_dpi, jpg_quality, scans, placements)
+        for xref in image_xrefs:
+            if encoded.get(xref):
+                _apply_encoded(doc, xref, encoded[xref])
+        if bilevel:
+            converted = sum(isinstance(encoded.get(x), BilevelImage) for x in scans)
+            codec = "CCITT G4" if BILEVEL_G4 else "Flate"
+            print(f"🖨️ Bilevel: {converted} of {len(scans)} page scans stored as 1-bit {codec}")
 
-                # Grayscale for ultra-balance
-                if quality_slider <= 50 and pix.colorspace.n != 1:
-                    pix = fitz.Pixmap(fitz.csGRAY, pix)
-                
-                img_bytes = pix.tobytes("jpeg", jpg_quality=jpg_quality)
-                old_stream = doc.xref_stream(xref)
-                if old_stream and len(img_bytes) < len(old_stream):
-                    doc.update_stream(xref, img_bytes)
-                    doc.xref_set_key(xref, "Filter", "/DCTDecode")
-                    try: doc.xref_set_key(xref, "DecodeParms", "null")
-                    except: pass
-            except: pass
+        deadline_hit = prepass_cut or len(encoded) < len(image_xrefs)
+        total_bytes = sum(stored.values())
+        done_bytes = sum(stored[x] for x in encoded if x in stored)
+        if deadline_hit:
+            print(f"⏱️ Deadline {deadline_ms} ms: optimized {len(encoded)} of {len(image_xrefs)} images "
+                  f"({done_bytes / max(1, total_bytes):.0%} of image bytes), fast save")
+        else:
+            # Font subsetting is skipped when out of time
+            optimize_fonts(doc)
+        if report is not None and deadline_ms:
+            report.update({
+                "deadline_ms": deadline_ms,
+                "deadline_hit": deadline_hit,
+                "images_total": len(image_xrefs),
+                "images_optimized": len(encoded),
+                "image_bytes_total": total_bytes,
+                "image_bytes_optimized": done_bytes,
+                "coverage": round(done_bytes / total_bytes, 4) if total_bytes else 1.0,
+                "save_profile": "fast" if deadline_hit else "full",
+            })
+
+        if progress:
+            progress(len(image_xrefs), len(image_xrefs))
 
         doc.set_metadata({})
         # Prune redundant structural data (bookmarks, XMPs, etc)
@@ -59,8 +1174,18 @@ def run_iterative_pdf_compression(input_path: str, quality_slider: int) -> str:
             try: doc.set_outline([])
             except: pass
 
-        doc.save(out_path, garbage=4, deflate=True, clean=True, deflate_fonts=True, deflate_images=True)
+        with span("compress.save"):
+            doc.save(out_path, **(FAST_SAVE if deadline_hit else FULL_SAVE))
         doc.close()
+        if not deadline_hit:
+            linearize_pdf(out_path)
+        if os.path.getsize(out_path) >= os.path.getsize(input_path):
+            print(f"Output not smaller than {os.path.basename(input_path)}, keeping the original")
+            shutil.copyfile(input_path, out_path)
+            if report is not None:
+                report["kept_original"] = True
+        if report is not None and deadline_ms:
+            report["elapsed_ms"] = round((time.time() - started) * 1000)
         return out_path
             
     except Exception as e:
@@ -80,6 +1205,646 @@ def run_iterative_pdf_compression(input_path: str, quality_slider: int) -> str:
         
     return out_path
 
+def compress_pdf_bilevel(input_path: str, quality_slider: int, progress=None) -> str:
+    """
+    Scanned-book mode: page scans that look like text on paper become 1-bit CCITT G4
+    images at PDF_BILEVEL_DPI; photos and everything else get the slider's JPEG tier.
+    """
+    return run_iterative_pdf_compression(input_path, quality_slider, progress=progress, bilevel=True)
+
+
+def compress_pdf_within_deadline(input_path: str, quality_slider: int, deadline_ms: int, bilevel: bool = False, progress=None):
+    """
+    run_iterative_pdf_compression bounded by deadline_ms: returns (out_path, report)
+    with the best-so-far file and how much of it was optimized.
+    """
+    report = {}
+    out_path = run_iterative_pdf_compression(input_path, quality_slider, progress=progress, bilevel=bilevel, deadline_ms=deadline_ms, report=report)
+    return out_path, report
+
+# Multi-variant mode: the UI lets users try several slider positions on one upload.
+# compress_pdf_variants runs them in one pass: every image is decoded and classified
+# once, its scaled (and gray) pixmaps are shared by the tiers that need the same size,
+# and only the encode runs per tier. Each variant is the file run_iterative_pdf_compression
+# would write at that slider; they come back as one ZIP.
+VARIANT_PRESETS = {"low": 20, "medium": 50, "high": 80}
+MAX_VARIANTS = 5
+
+
+def parse_variants(spec: str) -> list:
+    """
+    "low,medium,high" or slider values like "20, 50, 80" -> list of sliders.
+    Raises ValueError for anything else.
+    """
+    sliders = []
+    for part in spec.split(","):
+        part = part.strip().lower()
+        if not part:
+            continue
+        if part in VARIANT_PRESETS:
+            slider = VARIANT_PRESETS[part]
+        elif part.isdigit():
+            slider = int(part)
+        else:
+            raise ValueError(f"Unknown variant '{part}', use low, medium, high or a slider value")
+        if not 1 <= slider <= 100:
+            raise ValueError(f"Slider {slider} is outside 1-100")
+        if slider not in sliders:
+            sliders.append(slider)
+    if not sliders or len(sliders) > MAX_VARIANTS:
+        raise ValueError(f"Give 1 to {MAX_VARIANTS} variants")
+    return sliders
+
+
+def _encode_variants(doc, xref: int, tiers: list, placement: float = None) -> list:
+    """
+    _recompress_xref for several (target_dpi, jpg_quality) tiers at once: one decode
+    and one classification. Returns one entry per tier: JPEG bytes, a BilevelImage or
+    PaletteImage, or None to keep the original.
+    """
+    results = [None] * len(tiers)
+    with span("compress.precheck"):
+        if doc.xref_get_key(xref, "ImageMask")[1] == "true":
+            return results
+        pending = [i for i, tier in enumerate(tiers) if not _skip_reencode(doc, xref, *tier, placement)]
+    if not pending:
+        return results
+    try:
+        with span("compress.decode"):
+            base = fitz.Pixmap(doc, xref)
+            if base.colorspace.n > 3 or base.colorspace.name in ("DeviceCMYK", "Indexed"):
+                base = fitz.Pixmap(fitz.csRGB, base)
+        with span("compress.classify"):
+            kind = _classify_pixmap(base)
+        old_size = len(doc.xref_stream_raw(xref) or b"")
+        # (width, height, gray) -> pixmap, shared by tiers
+        pixmaps = {}
+        for i in pending:
+            target_dpi, jpg_quality = tiers[i]
+            results[i] = _encode_classified(base, kind, target_dpi, jpg_quality, old_size, placement, pixmaps)
+    except: pass
+    return results
+
+
+def compress_pdf_variants(input_path: str, sliders: list, progress=None):
+    """
+    Compresses input_path at several quality sliders in one pass.
+    Returns (zip_path, report) with one PDF per slider and their sizes.
+    """
+    started = time.perf_counter()
+    tiers = [_compression_tier(slider) for slider in sliders]
+    doc = fitz.open(input_path)
+    try:
+        # JavaScript and attachments never hold images: the lossless categories are enough here
+        slim_structure(doc, _slim_categories())
+        image_xrefs = dedup_images(doc, live_images(doc))
+        placements = image_placements(doc) if image_xrefs else {}
+        encoded = {}
+        for done, xref in enumerate(image_xrefs):
+            if progress:
+                progress(done, len(image_xrefs) + len(sliders))
+            encoded[xref] = _encode_variants(doc, xref, tiers, placements.get(xref))
+    finally:
+        doc.close()
+
+    variants = []
+    for i, slider in enumerate(sliders):
+        if progress:
+            progress(len(image_xrefs) + i, len(image_xrefs) + len(sliders))
+        out_path = f"{input_path}_q{slider}.pdf"
+        # A fresh copy per variant; dedup is deterministic, so the XREFs line up
+        doc = fitz.open(input_path)
+        try:
+            variant_structure = slim_structure(doc, _slim_categories(slider))
+            for xref in dedup_images(doc, live_images(doc)):
+                if xref in encoded and encoded[xref][i]:
+                    _apply_encoded(doc, xref, encoded[xref][i])
+            optimize_fonts(doc)
+            doc.set_metadata({})
+            if slider <= 50:
+                try: doc.set_outline([])
+                except: pass
+            with span("compress.save"):
+                doc.save(out_path, **FULL_SAVE)
+        finally:
+            doc.close()
+        linearize_pdf(out_path)
+        # Same guard as run_iterative_pdf_compression: never ship a variant larger than the upload
+        kept_original = os.path.getsize(out_path) >= os.path.getsize(input_path)
+        if kept_original:
+            print(f"Variant q{slider} not smaller than {os.path.basename(input_path)}, keeping the original")
+            shutil.copyfile(input_path, out_path)
+        variants.append({
+            "quality": slider, "filename": f"compressed-q{slider}.pdf", "bytes": os.path.getsize(out_path),
+            "structure": variant_structure, "kept_original": kept_original, "path": out_path,
+        })
+
+    zip_path = input_path + "_variants.zip"
+    with zipfile.ZipFile(zip_path, "w") as zipf:
+        for variant in variants:
+            zipf.write(variant.pop("path"), variant["filename"])
+    if progress:
+        progress(len(image_xrefs) + len(sliders), len(image_xrefs) + len(sliders))
+    report = {
+        "input_bytes": os.path.getsize(input_path),
+        "images": len(image_xrefs),
+        "variants": variants,
+        "seconds": round(time.perf_counter() - started, 2),
+    }
+    print("🎚️ Variants: " + ", ".join(f"q{v['quality']} {v['bytes'] / 1024:.0f} KB" for v in variants) + f" in {report['seconds']}s")
+    return zip_path, report
+
+
+# Target-size mode: instead of a fixed slider tier, find the sharpest rendition whose
+# output fits target_kb. Only image streams are searched: everything else (text, fonts,
+# page trees) is treated as a fixed cost measured from the input. Each image is decoded
+# once and its scaled pixmaps are cached, so every search step is encoding only. Images
+# are encoded as the slider path does (_classify_pixmap, _encode_classified): only gray
+# and bilevel content loses its colour channels, flat images may go to a palette.
+# Rungs are DPIs from sharpest to smallest; a cheap per-rung estimate from a sample of
+# images picks the starting rung, then JPEG quality is binary-searched over the real images.
+TARGET_RUNGS = [300, 200, 150, 120, 96, 72, 60, 48, 36]
+TARGET_MIN_QUALITY = 30     # below this a rung looks worse than the next smaller one
+TARGET_FLOOR_QUALITY = 10   # last rung only
+TARGET_MAX_QUALITY = 90
+TARGET_SAMPLE_IMAGES = 8
+# Per pdf pool worker, so the pool holds up to CPU_COUNT times this: sized for the ~2 GB
+# Render instance. Past the budget, pixmaps are re-derived on demand instead of cached.
+TARGET_PIXMAP_CACHE_BYTES = int(os.getenv("PDF_TARGET_PIXMAP_CACHE_MB", "96")) * 1024 * 1024
+
+
+class _PixmapCache:
+    """
+    Decoded (and scaled) image pixmaps keyed by (xref, dpi, gray). Stops caching
+    once the byte budget is used up; later lookups then re-derive on demand.
+    placements (image_placements) sets each image's effective-DPI scale.
+    """
+    def __init__(self, doc, budget: int = TARGET_PIXMAP_CACHE_BYTES, placements: dict = None):
+        self.doc = doc
+        self.placements = placements or {}
+        self.budget = budget
+        self.used = 0
+        self.pixmaps = {}
+
+    def _keep(self, key, pix):
+        size = pix.stride * pix.height
+        if self.used + size <= self.budget:
+            self.pixmaps[key] = pix
+            self.used += size
+        return pix
+
+    def get(self, xref: int, dpi: int = None, gray: bool = False):
+        key = (xref, dpi, gray)
+        pix = self.pixmaps.get(key)
+        if pix is not None:
+            return pix
+        if dpi is None:
+            with span("compress_target.decode"):
+                pix = fitz.Pixmap(self.doc, xref)
+                if pix.colorspace.n > 3 or pix.colorspace.name in ("DeviceCMYK", "Indexed"):
+                    pix = fitz.Pixmap(fitz.csRGB, pix)
+                if pix.alpha:
+                    pix = fitz.Pixmap(pix, 0)
+            return self._keep(key, pix)
+        pix = self.get(xref)
+        scale = _dpi_scale(pix.width, dpi, self.placements.get(xref))
+        with span("compress_target.scale"):
+            if scale < 1.0:
+                pix = fitz.Pixmap(pix, max(1, int(pix.width * scale)), max(1, int(pix.height * scale)))
+            if gray and pix.colorspace.n != 1:
+                pix = fitz.Pixmap(fitz.csGRAY, pix)
+        return self._keep(key, pix)
+
+
+def _image_area(doc, xref: int, dpi: int, placements: dict = None) -> float:
+    try:
+        w = int(doc.xref_get_key(xref, "Width")[1])
+        h = int(doc.xref_get_key(xref, "Height")[1])
+    except (ValueError, TypeError):
+        return 0.0
+    scale = _dpi_scale(w, dpi, (placements or {}).get(xref))
+    return w * h * scale * scale
+
+
+def compress_pdf_to_target(input_path: str, target_kb: int, progress=None) -> str:
+    """
+    Target-size PDF compression: re-encodes image XREFs at the highest DPI/JPEG quality
+    that keeps the saved file under target_kb. Text and vectors are left untouched.
+    If even the smallest rung cannot reach the target, the smallest result is returned.
+    Optional progress(done, total) is called after every search step.
+    """
+    out_path = input_path + "_compressed.pdf"
+    target_bytes = target_kb * 1024
+    file_size = os.path.getsize(input_path)
+    doc = fitz.open(input_path)
+
+    try:
+        slim_savings = sum(row["bytes"] for row in slim_structure(doc, _slim_categories()))
+        all_images = live_images(doc)
+        raw_sizes = {x: len(doc.xref_stream_raw(x) or b"") for x in all_images}
+        image_xrefs = dedup_images(doc, all_images)
+        font_savings = sum(row["bytes_saved"] for row in optimize_fonts(doc))
+        fixed_bytes = max(0, file_size - sum(raw_sizes.values()) - font_savings - slim_savings)
+
+        if file_size <= target_bytes or not image_xrefs:
+            # Nothing to trade off: lossless cleanup only
+            doc.set_metadata({})
+            with span("compress_target.save"):
+                doc.save(out_path, **FULL_SAVE)
+            return linearize_pdf(out_path)
+
+        placements = image_placements(doc)
+        cache = _PixmapCache(doc, placements=placements)
+        max_steps = 12
+        steps = [0]
+
+        def report():
+            steps[0] += 1
+            if progress:
+                progress(min(steps[0], max_steps - 1), max_steps)
+
+        classes = {}
+
+        def classify(xref):
+            # Once per image; stencil masks are 1 bit already and keep their stream
+            kind = classes.get(xref)
+            if kind is None:
+                if doc.xref_get_key(xref, "ImageMask")[1] == "true":
+                    kind = "mask"
+                else:
+                    with span("compress_target.classify"):
+                        kind = _classify_pixmap(cache.get(xref))
+                classes[xref] = kind
+            return kind
+
+        def encode(xrefs, dpi, quality):
+            # -> ({xref: encoded image or None to keep the original}, image bytes after encoding)
+            encoded, total = {}, 0
+            for xref in xrefs:
+                image = None
+                try:
+                    kind = classify(xref)
+                    if kind != "mask":
+                        image = _encode_classified(
+                            cache.get(xref), kind, dpi, quality, raw_sizes[xref],
+                            scaled=lambda d, gray, xref=xref: cache.get(xref, d, gray),
+                        )
+                except Exception:
+                    pass
+                encoded[xref] = image
+                if image is None:
+                    total += raw_sizes[xref]
+                else:
+                    total += len(image) if isinstance(image, bytes) else len(image.data)
+            return encoded, total
+
+        # Cheap estimate: encode a spread-out sample and extrapolate by scaled pixel area
+        stride = max(1, len(image_xrefs) // TARGET_SAMPLE_IMAGES)
+        sample = image_xrefs[::stride][:TARGET_SAMPLE_IMAGES]
+
+        def estimate(dpi, quality):
+            _, sample_bytes = encode(sample, dpi, quality)
+            sample_area = sum(_image_area(doc, x, dpi, placements) for x in sample)
+            total_area = sum(_image_area(doc, x, dpi, placements) for x in image_xrefs)
+            if not sample_area:
+                return fixed_bytes + sample_bytes * len(image_xrefs) / len(sample)
+            return fixed_bytes + sample_bytes * total_area / sample_area
+
+        def search(budget):
+            """
+            Returns (dpi, quality, encoded) for the sharpest rendition whose images fit
+            in budget bytes, or the smallest rendition tried if nothing fits.
+            """
+            smallest = None
+            for i, dpi in enumerate(TARGET_RUNGS):
+                last_rung = i == len(TARGET_RUNGS) - 1
+                low = TARGET_FLOOR_QUALITY if last_rung else TARGET_MIN_QUALITY
+                if not last_rung and estimate(dpi, low) - fixed_bytes > budget * 1.1:
+                    continue
+                encoded, total = encode(image_xrefs, dpi, low)
+                report()
+                if smallest is None or total < smallest[3]:
+                    smallest = (dpi, low, encoded, total)
+                if total > budget:
+                    continue
+                best = (dpi, low, encoded)
+                high = TARGET_MAX_QUALITY
+                while low < high:
+                    mid = (low + high + 1) // 2
+                    encoded, total = encode(image_xrefs, dpi, mid)
+                    report()
+                    if total <= budget:
+                        best, low = (dpi, mid, encoded), mid
+                    else:
+                        high = mid - 1
+                return best
+            return smallest[:3]
+
+        budget = target_bytes - fixed_bytes
+        tried = set()
+        for attempt in range(3):
+            dpi, quality, encoded = search(budget)
+            if (dpi, quality) in tried:
+                break
+            tried.add((dpi, quality))
+            for xref, image in encoded.items():
+                if image is not None:
+                    _apply_encoded(doc, xref, image)
+            doc.set_metadata({})
+            with span("compress_target.save"):
+                doc.save(out_path, **FULL_SAVE)
+            # Measured after linearizing: the hint stream counts towards the target,
+            # and a plain file that fits is never traded for a linearized one that doesn't
+            linearize_pdf(out_path, max_bytes=target_bytes)
+            achieved = os.path.getsize(out_path)
+            print(f"🎯 Target {target_kb} KB: dpi={dpi} q={quality} -> {achieved // 1024} KB")
+            if achieved <= target_bytes:
+                break
+            # The fixed-cost guess was off (object overhead, fonts): shrink the image budget
+            budget -= achieved - target_bytes
+            doc.close()
+            doc = fitz.open(input_path)
+            slim_structure(doc, _slim_categories())
+            dedup_images(doc, all_images)
+            optimize_fonts(doc)
+            cache.doc = doc
+
+        if progress:
+            progress(max_steps, max_steps)
+        return out_path
+    finally:
+        if not doc.is_closed:
+            doc.close()
+
+# Compression preview: predicts output size and runtime for every slider tier without
+# compressing. Unique images (grouped by length/size/filter, a cheap stand-in for the
+# dedup hash) are stratified by stream size and one image per stratum is decoded once,
+# then scaled and encoded per tier. Results are extrapolated by scaled pixel area and
+# capped at each image's current size, since the compressor keeps smaller originals.
+# Tiers follow every step in the compressor: 41-50 and 51-60 share DPI and JPEG quality
+# but only 50 and below slim the lossy structure categories and drop the outline.
+SLIDER_TIERS = [(1, 25), (26, 40), (41, 50), (51, 60), (61, 85), (86, 100)]
+ESTIMATE_MAX_SAMPLES = int(os.getenv("PDF_ESTIMATE_SAMPLES", "6"))
+ESTIMATE_TIME_BUDGET = float(os.getenv("PDF_ESTIMATE_BUDGET_S", "0.5"))
+ESTIMATE_BAND_PIXELS = 400_000
+# Rough save(garbage=4, deflate=True) + linearize throughput over the output bytes
+ESTIMATE_SAVE_BYTES_PER_SEC = 40 * 1024 * 1024
+# Unfiltered stream bytes actually deflated to measure the ratio for the rest
+ESTIMATE_DEFLATE_SAMPLE = 4 * 1024 * 1024
+# Structure, font and deflate savings are measured on a copy of this many evenly spaced
+# pages and scaled by page count: the full passes cost as much as the compression itself
+ESTIMATE_STRUCTURE_PAGES = int(os.getenv("PDF_ESTIMATE_PAGES", "8"))
+# Page keys insert_pdf does not copy, measured on the original pages instead
+_SLIM_PAGE_KEYS = {"thumbnails": "Thumb", "piece_info": "PieceInfo"}
+
+
+def _centre_band(pix, rows: int):
+    # The middle rows of pix as a pixmap of their own
+    if rows >= pix.height:
+        return pix
+    top = (pix.height - rows) // 2
+    region = fitz.IRect(0, top, pix.width, top + rows)
+    band = fitz.Pixmap(pix.colorspace, region, pix.alpha)
+    band.copy(pix, region)
+    band.set_origin(0, 0)
+    return band
+
+
+def _unfiltered_streams(doc) -> set:
+    # Non-image streams stored without a filter (vector content written uncompressed by
+    # some producers), which the full save deflates
+    return {
+        x for x in range(1, doc.xref_length())
+        if doc.xref_is_stream(x) and not doc.xref_is_image(x) and doc.xref_get_key(x, "Filter")[0] == "null"
+    }
+
+
+def _deflate_savings(doc, xrefs: set) -> int:
+    # Bytes deflate takes off these unfiltered streams: zlib on the first
+    # ESTIMATE_DEFLATE_SAMPLE bytes, that ratio applied to the rest
+    total, sample_in, sample_out = 0, 0, 0
+    for xref in sorted(xrefs):
+        if sample_in < ESTIMATE_DEFLATE_SAMPLE:
+            raw = doc.xref_stream_raw(xref) or b""
+            sample_in += len(raw)
+            sample_out += len(zlib.compress(raw, 6))
+            total += len(raw)
+        else:
+            try: total += int(doc.xref_get_key(xref, "Length")[1])
+            except ValueError: pass
+    return int(total * (1 - sample_out / sample_in)) if sample_in else 0
+
+
+def _page_sample(doc, count: int):
+    # (copy of count evenly spaced pages, page numbers); the document itself when short
+    if doc.page_count <= count:
+        return doc, list(range(doc.page_count))
+    numbers = sorted({i * doc.page_count // count for i in range(count)})
+    sample = fitz.open()
+    for number in numbers:
+        # One call per page: objects the pages share are grafted once
+        sample.insert_pdf(doc, from_page=number, to_page=number)
+    return sample, numbers
+
+
+def _page_key_bytes(doc, numbers: list, key: str) -> int:
+    # Bytes slimming key off these pages frees: the inline value and every object
+    # only it reaches (never back into the page tree)
+    texts, total, seen = {}, 0, set()
+    for number in numbers:
+        kind, value = doc.xref_get_key(doc.page_xref(number), key)
+        if kind == "null":
+            continue
+        total += len(value)
+        stack = [int(x) for x in _XREF_REF.findall(value.encode())]
+        while stack:
+            xref = stack.pop()
+            if xref in seen:
+                continue
+            seen.add(xref)
+            texts[xref] = text = doc.xref_object(xref, compressed=True)
+            if re.search(r"/Type\s*/Page", text):
+                continue
+            total += _object_bytes(doc, xref, texts)
+            stack.extend(int(x) for x in _XREF_REF.findall(text.encode()))
+    return total
+
+
+def _catalog_bytes(doc, categories: list) -> int:
+    # Document-level data the page sample does not carry: attachments and catalog XMP
+    total = 0
+    if "embedded_files" in categories:
+        for i in range(doc.embfile_count()):
+            try: total += doc.embfile_info(i).get("length", 0)
+            except Exception: pass
+    kind, value = doc.xref_get_key(doc.pdf_catalog(), "Metadata")
+    if "xmp" in categories and kind == "xref":
+        total += _stored_bytes(doc, int(value.split()[0]))
+    return total
+
+
+def _page_images(doc) -> list:
+    # Image XREFs the pages draw (soft masks included), without the xref-table scan
+    # live_images needs. Images a page names but never draws go in slimming's savings.
+    images = set()
+    for page in doc:
+        items = page.get_images(full=True)
+        if not items:
+            continue
+        content = b"".join(doc.xref_stream(x) or b"" for x in page.get_contents())
+        for item in items:
+            # referencer != 0: drawn from a form XObject, not this content
+            if item[-1] == 0 and b"/" + item[7].encode() not in content:
+                continue
+            images.update(x for x in item[:2] if x > 0)
+    return sorted(images)
+
+
+def estimate_pdf_compression(input_path: str) -> dict:
+    """
+    Predicted output bytes and seconds for each quality-slider tier of
+    run_iterative_pdf_compression, from a stratified sample of the images.
+    """
+    started = time.perf_counter()
+    file_size = os.path.getsize(input_path)
+    doc = fitz.open(input_path)
+    sample = None
+    try:
+        # Structure and fonts shrink the same way at every tier, except the lossy slimming
+        # categories at 50 and below: run them on a page sample and subtract their bytes, as
+        # compress_pdf_to_target does. Lossless first, so the lossy rows are the difference.
+        # The save also deflates streams stored unfiltered; slimming's rows already count
+        # what it removes or rewrites at deflated size, so measure those before it runs.
+        # Per-page savings scale with the page count; fonts are shared, so they do not.
+        sample, numbers = _page_sample(doc, ESTIMATE_STRUCTURE_PAGES)
+        scale = doc.page_count / max(1, len(numbers))
+        lossless, lossy = _slim_categories(), [c for c in _slim_categories(1) if c in SLIM_LOSSY]
+        deflate_savings = _deflate_savings(sample, _unfiltered_streams(sample) & _reachable(sample, _object_texts(sample)))
+        slim_savings = sum(row["bytes"] for row in slim_structure(sample, lossless))
+        lossy_savings = sum(row["bytes"] for row in slim_structure(sample, lossy))
+        if sample is not doc:
+            slim_savings += sum(_page_key_bytes(doc, numbers, key) for c, key in _SLIM_PAGE_KEYS.items() if c in lossless)
+            deflate_savings, slim_savings, lossy_savings = (
+                deflate_savings * scale, slim_savings * scale + _catalog_bytes(doc, lossless),
+                lossy_savings * scale + _catalog_bytes(doc, lossy),
+            )
+        font_savings = sum(row["bytes_saved"] for row in optimize_fonts(sample))
+        structure_s = (time.perf_counter() - started) * scale
+
+        images, seen, all_image_bytes = [], set(), 0
+        # Images orphaned by slimming are already counted in its savings
+        for xref in _page_images(doc):
+            keys = tuple(doc.xref_get_key(xref, k)[1] for k in ("Length", "Width", "Height", "Filter"))
+            try:
+                raw = int(keys[0])
+            except ValueError:
+                raw = len(doc.xref_stream_raw(xref) or b"")
+            all_image_bytes += raw
+            if keys in seen:
+                continue
+            seen.add(keys)
+            images.append((raw, xref))
+        image_bytes = sum(raw for raw, _ in images)
+        # Duplicates disappear in the dedup pass, so they count as neither fixed nor image bytes
+        fixed_bytes = max(0, file_size - all_image_bytes - slim_savings - font_savings - deflate_savings)
+
+        # Stratify by stream size and take the median image of each stratum
+        images.sort()
+        n_samples = min(ESTIMATE_MAX_SAMPLES, len(images))
+        strata = [images[i * len(images) // n_samples:(i + 1) * len(images) // n_samples] for i in range(n_samples)]
+        candidates = [stratum[len(stratum) // 2] for stratum in strata if stratum]
+
+        tiers = [(low, high) + _compression_tier(high) for low, high in SLIDER_TIERS]
+        # per tier: [encoded bytes, original bytes, scaled area, seconds]
+        totals = [[0, 0, 0.0, 0.0] for _ in tiers]
+        sampled, classes = [], {}
+        placements = image_placements(doc)
+        cache = _PixmapCache(doc, placements=placements)
+        # Largest stratum first: when the time budget cuts sampling short, the images that
+        # hold most of the bytes have been measured
+        sampling_started = time.perf_counter()
+        for raw, xref in reversed(candidates):
+            if sampled and time.perf_counter() - sampling_started > ESTIMATE_TIME_BUDGET:
+                break
+            try:
+                t0 = time.perf_counter()
+                kind = _classify_pixmap(cache.get(xref))
+                decode_s = time.perf_counter() - t0
+                rows = []
+                for low, high, dpi, quality in tiers:
+                    area = _image_area(doc, xref, dpi, placements)
+                    if _skip_reencode(doc, xref, dpi, quality, placements.get(xref)):
+                        # Kept as is without decoding
+                        rows.append((raw, area or raw, 0.0))
+                        continue
+                    t0 = time.perf_counter()
+                    bilevel = kind == "bilevel"
+                    pix = cache.get(xref, max(dpi, BILEVEL_DPI) if bilevel else dpi, kind != "color")
+                    # Encode a centre band of at most ESTIMATE_BAND_PIXELS and scale by area:
+                    # JPEG size and time are close to linear in pixels, full encodes are slow
+                    band = max(1, min(pix.height, ESTIMATE_BAND_PIXELS // max(1, pix.width)))
+                    crop = _centre_band(pix, band)
+                    palette_s = 0.0
+                    if bilevel:
+                        gray = np.frombuffer(crop.samples_mv, np.uint8).reshape(crop.height, crop.stride)[:, :crop.width]
+                        size = len(_encode_bilevel(gray >= 128).data) / band
+                    else:
+                        size = len(crop.tobytes("jpeg", jpg_quality=quality)) / band
+                        if _is_flat(crop):
+                            # Quantizing is several times slower than JPEG: a quarter band will do
+                            t1 = time.perf_counter()
+                            sub = _centre_band(crop, max(1, band // 4))
+                            size = min(size, len(_encode_palette(sub).data) / sub.height)
+                            palette_s = (time.perf_counter() - t1) * pix.height / sub.height
+                    size *= pix.height
+                    encode_s = (time.perf_counter() - t0) * pix.height / band + palette_s
+                    rows.append((min(size, raw), area or pix.width * pix.height, decode_s + encode_s))
+            except Exception:
+                continue
+            sampled.append(xref)
+            classes[kind] = classes.get(kind, 0) + 1
+            for total, (size, area, seconds) in zip(totals, rows):
+                total[0] += size
+                total[1] += raw
+                total[2] += area
+                total[3] += seconds
+            cache.pixmaps.clear()
+            cache.used = 0
+
+        workers = _xref_workers(len(images))
+        result = []
+        for (low, high, dpi, quality), (enc, orig, area, seconds) in zip(tiers, totals):
+            if sampled and orig:
+                # Bytes and seconds per scaled pixel, applied to every unique image
+                all_area = sum(_image_area(doc, x, dpi, placements) for _, x in images) or area
+                predicted_images = min(image_bytes, enc / area * all_area) if area else enc / orig * image_bytes
+                # Decode time follows the stream size, so seconds scale by bytes like the sample
+                predicted_seconds = seconds / orig * image_bytes / max(1, min(workers, len(images)))
+            else:
+                predicted_images, predicted_seconds = image_bytes, 0.0
+            tier_fixed = max(0, fixed_bytes - (lossy_savings if high <= 50 else 0))
+            predicted_seconds += structure_s + (tier_fixed + predicted_images) / ESTIMATE_SAVE_BYTES_PER_SEC
+            result.append({
+                "slider": [low, high],
+                "dpi": dpi,
+                "jpg_quality": quality,
+                "predicted_bytes": int(tier_fixed + predicted_images),
+                "predicted_seconds": round(predicted_seconds, 2),
+            })
+        return {
+            "input_bytes": file_size,
+            "unique_images": len(images),
+            "sampled_images": len(sampled),
+            "image_classes": classes,
+            "estimate_ms": round((time.perf_counter() - started) * 1000, 1),
+            "tiers": result,
+        }
+    finally:
+        if sample is not None and sample is not doc:
+            sample.close()
+        doc.close()
+
+
 def organize_pdf(input_path: str, order_string: str) -> str:
     """
     Rearranges or deletes pages in a PDF based on a comma-separated string of 0-indexed page numbers.
@@ -98,7 +1863,7 @@ def organize_pdf(input_path: str, order_string: str) -> str:
             new_doc.new_page()
             new_doc.save(out_path)
             new_doc.close()
-            return out_path
+            return linearize_pdf(out_path)
             
         page_indices = [int(x) for x in order_string.split(",")]
         
@@ -106,6 +1871,7 @@ def organize_pdf(input_path: str, order_string: str) -> str:
         doc.select(page_indices)
         doc.save(out_path)
         doc.close()
+        linearize_pdf(out_path)
     except Exception as e:
         print(f"Error organizing PDF: {e}")
         # fallback
@@ -126,9 +1892,11 @@ def extract_pdf_thumbnails(input_path: str) -> list[str]:
         doc = fitz.open(input_path)
         for page in doc:
             # Generate a very low-res pixmap for snappy UI loading
-            pix = page.get_pixmap(dpi=36, colorspace=fitz.csRGB)
+            with span("thumbnails.render"):
+                pix = page.get_pixmap(dpi=36, colorspace=fitz.csRGB)
             # Get JPEG bytes via PyMuPDF native conversion
-            img_bytes = pix.tobytes("jpeg")
+            with span("thumbnails.jpeg_encode"):
+                img_bytes = pix.tobytes("jpeg")
             b64_str = base64.b64encode(img_bytes).decode('utf-8')
             thumbnails.append(f"data:image/jpeg;base64,{b64_str}")
         doc.close()
@@ -162,7 +1930,7 @@ def images_to_pdf(image_paths: list[str]) -> str:
     # Save the first image, appending subsequent images as extra PDF pages
     images[0].save(out_path, "PDF", save_all=True, append_images=images[1:])
     
-    return out_path
+    return linearize_pdf(out_path)
 
 def split_pdf(input_path: str, ranges: str) -> str:
     """
@@ -195,6 +1963,7 @@ def split_pdf(input_path: str, ranges: str) -> str:
             if new_doc.page_count > 0:
                 out_name = f"{input_path}_part_{i+1}.pdf"
                 new_doc.save(out_name)
+                linearize_pdf(out_name)
                 out_files.append((out_name, f"{base_name}_part_{i+1}.pdf"))
         except Exception as e:
             print(f"Error parsing split range '{part}': {e}")
@@ -216,9 +1985,41 @@ def split_pdf(input_path: str, ranges: str) -> str:
             
     return zip_path
 
-def pdf_to_word(input_path: str) -> str:
+
+# pdf2docx parses pages in a multiprocessing Pool. Forked parsing processes inherit the
+# root logger's handlers, so a _PageProgressHandler counts their pages into shared
+# memory and the converting process reports the count every PDF_TO_WORD_PROGRESS_INTERVAL.
+# With a non-fork start method the count stays 0 until the conversion ends.
+PDF_TO_WORD_PROGRESS_INTERVAL = 0.5
+
+
+class _PageProgressHandler(logging.Handler):
+    """
+    pdf2docx only reports per-page progress through logging ("(i/n) Page p").
+    Counts the pages of the parsing phase ([3/4]) in parsed, a multiprocessing.Value.
+    """
+    def __init__(self, parsed):
+        super().__init__(level=logging.INFO)
+        self.parsed = parsed
+        self.parsing = False
+
+    def emit(self, record):
+        msg = str(record.msg)
+        if "[3/4]" in msg:
+            self.parsing = True
+        elif "[4/4]" in msg:
+            self.parsing = False
+        elif self.parsing and msg.startswith("(%d/%d)") and record.args and record.args[0] > 1:
+            # Page i of this process's share is about to be parsed, so page i - 1 is done
+            # .value would take the (non-recursive) lock a second time
+            with self.parsed.get_lock():
+                self.parsed.get_obj().value += 1
+
+
+def pdf_to_word(input_path: str, progress=None) -> str:
     """
     Converts a PDF file to a Word document (.docx) using pdf2docx.
+    Optional progress(done, total) is called with the pages parsed so far.
     """
     out_path = input_path + ".docx"
     
@@ -235,9 +2036,38 @@ def pdf_to_word(input_path: str) -> str:
             "multi_processing": True,
             "cpu_count": 2  # Utilize multi-threading to speed up heavy conversions
         }
-        
-        cv.convert(out_path, **kwargs)
+
+        handler, watcher, stop = None, None, threading.Event()
+        if progress:
+            # Only the parsing processes take the lock: forking while it is held can't happen
+            parsed = multiprocessing.Value("i", 0, lock=multiprocessing.Lock())
+            handler = _PageProgressHandler(parsed)
+            # pdf2docx configures the root logger at INFO on import
+            logging.getLogger().addHandler(handler)
+            progress(0, total_pages)
+
+            def watch():
+                reported = 0
+                while not stop.wait(PDF_TO_WORD_PROGRESS_INTERVAL):
+                    done = min(parsed.get_obj().value, total_pages)
+                    if done != reported:
+                        reported = done
+                        progress(done, total_pages)
+
+            watcher = threading.Thread(target=watch, daemon=True, name="pdf2docx-progress")
+            watcher.start()
+
+        try:
+            with span("pdf_to_word.convert"):
+                cv.convert(out_path, **kwargs)
+        finally:
+            if handler:
+                stop.set()
+                watcher.join()
+                logging.getLogger().removeHandler(handler)
         cv.close()
+        if progress:
+            progress(total_pages, total_pages)
     except Exception as e:
         print(f"Error converting PDF to Word: {e}")
         raise
@@ -259,7 +2089,8 @@ def office_to_pdf(input_path: str) -> str:
     try:
         # 1. Attempt LibreOffice headless (Standard in Cloud / Linux)
         args = ["soffice", "--headless", "--convert-to", "pdf", "--outdir", out_dir, input_path]
-        subprocess.run(args, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        with span("office_to_pdf.soffice"):
+            subprocess.run(args, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
         
         expected_lo_out = os.path.join(out_dir, os.path.splitext(os.path.basename(input_path))[0] + ".pdf")
         if expected_lo_out != out_path and os.path.exists(expected_lo_out):
@@ -274,7 +2105,7 @@ def office_to_pdf(input_path: str) -> str:
             print(f"Error converting Office to PDF: {e}")
             raise ValueError(f"Could not convert Office to PDF. Ensure LibreOffice ('soffice') is installed on the server, or MS Word on Windows. Error: {e}")
         
-    return out_path
+    return linearize_pdf(out_path)
 
 def unlock_pdf(input_path: str, password: str = "") -> str:
     """
@@ -292,7 +2123,7 @@ def unlock_pdf(input_path: str, password: str = "") -> str:
     finally:
         doc.close()
         
-    return out_path
+    return linearize_pdf(out_path)
 
 
 def repair_pdf(input_path: str) -> str:
@@ -309,4 +2140,4 @@ def repair_pdf(input_path: str) -> str:
         print(f"Error repairing PDF: {e}")
         raise ValueError(f"Could not repair PDF. The file may be unreadably corrupted. ({e})")
         
-    return out_path
+    return linearize_pdf(out_path)
@@ -0,0 +1,281 @@
+import os
+import time
+import asyncio
+from collections import deque
+
+# Relay Backpressure: every local /ws/drop socket gets a bounded outbound queue drained
+# by its own writer task. Publishing into a full queue WAITS instead of timing out and
+# dropping the frame, so a slow receiver slows the sender's receive loop (and, through
+# TCP, the sender itself) while every chunk still arrives in order.
+# - RELAY_QUEUE_MAX_MB bounds the bytes buffered per socket (default 8 MB)
+# - crossing the limit sends {"type": "relay-credit", "paused": true} to the sender,
+#   draining below RELAY_QUEUE_LOW_FRACTION of it sends "paused": false
+# - a socket that cannot accept a single frame for RELAY_STALL_TIMEOUT seconds is
+#   closed (1011) rather than silently losing data
+#
+# Only the in-process broker can make the publisher wait. With ROOM_BROKER=redis or
+# loopback, frames arrive on the worker's one broker read loop, which serves every room
+# and must never block, so deliveries use put_nowait. The backpressure moves to the
+# producing socket instead: its worker sees the relay-credit signal on the way to the
+# client and stops reading that socket (RelayCredit) until the peer's queue drains, so
+# clients need not handle relay-credit themselves. The queue overshoots its budget by
+# what was in flight while the signal crossed the broker; a queue that still reaches
+# RELAY_QUEUE_HARD_MB (a publisher that bypasses the gate) closes its socket (1011)
+# instead of buffering without bound.
+
+RELAY_QUEUE_MAX_BYTES = int(float(os.getenv("RELAY_QUEUE_MAX_MB", "8")) * 1024 * 1024)
+RELAY_QUEUE_LOW_FRACTION = float(os.getenv("RELAY_QUEUE_LOW_FRACTION", "0.25"))
+RELAY_STALL_TIMEOUT = float(os.getenv("RELAY_STALL_TIMEOUT", "30"))
+RELAY_QUEUE_HARD_BYTES = int(float(os.getenv("RELAY_QUEUE_HARD_MB", "32")) * 1024 * 1024)
+RATE_WINDOW = 5.0
+
+
+def frame_size(kind: str, payload) -> int:
+    if kind == "bytes":
+        return len(payload)
+    if kind == "text":
+        return len(payload.encode("utf-8"))
+    return 256  # small JSON control messages
+
+
+class RoomStats:
+    """
+    Bytes relayed into a room's local sockets, with a sliding-window bytes/sec rate.
+    """
+    def __init__(self):
+        self.frames = 0
+        self.bytes = 0
+        self.window = deque()  # (timestamp, nbytes)
+
+    def record(self, nbytes: int):
+        now = time.monotonic()
+        self.frames += 1
+        self.bytes += nbytes
+        self.window.append((now, nbytes))
+        while self.window and now - self.window[0][0] > RATE_WINDOW:
+            self.window.popleft()
+
+    def bytes_per_sec(self) -> float:
+        now = time.monotonic()
+        while self.window and now - self.window[0][0] > RATE_WINDOW:
+            self.window.popleft()
+        if not self.window:
+            return 0.0
+        return sum(n for _, n in self.window) / RATE_WINDOW
+
+
+class RelayCredit:
+    """
+    Pause state last reported by the peer's outbound queue for the frames one socket
+    produces. The socket's receive loop calls wait() before relaying each frame.
+    """
+    def __init__(self):
+        self.paused_count = 0
+        self._open = asyncio.Event()
+        self._open.set()
+
+    def update(self, paused: bool):
+        if paused and self._open.is_set():
+            self.paused_count += 1
+            self._open.clear()
+        elif not paused:
+            self._open.set()
+
+    async def wait(self, timeout: float = RELAY_STALL_TIMEOUT) -> bool:
+        """
+        Waits while the peer is paused. Returns False if it did not resume within
+        timeout (the peer's own stall timeout closes it by then) and opens the gate.
+        """
+        if self._open.is_set():
+            return True
+        try:
+            await asyncio.wait_for(self._open.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            self._open.set()
+            return False
+
+
+class CreditSignal:
+    """
+    Publishes one socket's queue pressure to the peer producing its frames, one
+    publish at a time. A state reported while a publish is in flight replaces any
+    unsent one, so at most one task exists and the peer always ends on the latest.
+    """
+    def __init__(self, publish):
+        self.publish = publish
+        self.latest = None
+        self._task = None
+
+    def update(self, message: dict):
+        self.latest = message
+        if self._task is None:
+            self._task = asyncio.create_task(self._publish_loop())
+
+    async def _publish_loop(self):
+        try:
+            while self.latest is not None:
+                message, self.latest = self.latest, None
+                await self.publish(message)
+        finally:
+            self._task = None
+
+    def stop(self):
+        self.latest = None
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+
+class OutboundQueue:
+    """
+    Bounded FIFO of frames for one websocket plus the writer task that drains it.
+    on_pressure(paused, queued_bytes) is called when the queue fills up or drains.
+    """
+    def __init__(self, websocket, room_stats: RoomStats, on_pressure=None,
+                 max_bytes: int = RELAY_QUEUE_MAX_BYTES, hard_bytes: int = RELAY_QUEUE_HARD_BYTES):
+        self.websocket = websocket
+        self.room_stats = room_stats
+        self.on_pressure = on_pressure
+        self.max_bytes = max_bytes
+        self.hard_bytes = max(hard_bytes, max_bytes)
+        self.low_bytes = int(max_bytes * RELAY_QUEUE_LOW_FRACTION)
+        self.frames = deque()
+        self.queued_bytes = 0
+        self.peak_bytes = 0
+        self.sent_frames = 0
+        self.sent_bytes = 0
+        self.stalls = 0
+        self.overflows = 0
+        self.paused = False
+        self.closed = False
+        self._not_empty = asyncio.Event()
+        self._has_room = asyncio.Event()
+        self._has_room.set()
+        self._writer = None
+
+    def start(self):
+        if self._writer is None:
+            self._writer = asyncio.create_task(self._write_loop())
+
+    async def put(self, kind: str, payload) -> bool:
+        """
+        Queues a frame, waiting while the queue is over its byte budget.
+        Returns False if the socket is gone and the frame was not queued.
+        """
+        size = frame_size(kind, payload)
+        # A frame larger than the whole budget is still accepted once the queue is empty
+        while not self.closed and self.queued_bytes and self.queued_bytes + size > self.max_bytes:
+            if not self.paused:
+                self.paused = True
+                self._signal(True)
+            self._has_room.clear()
+            await self._has_room.wait()
+        if self.closed:
+            return False
+        self._append(kind, payload, size)
+        return True
+
+    def put_nowait(self, kind: str, payload) -> bool:
+        """
+        Queues a frame without waiting, for deliveries from a shared broker read loop.
+        Past max_bytes the sender is paused; past hard_bytes the socket is closed.
+        Returns False if the frame was not queued.
+        """
+        if self.closed:
+            return False
+        size = frame_size(kind, payload)
+        if self.queued_bytes and self.queued_bytes + size > self.hard_bytes:
+            # Nothing queued is worth sending after a gap: drop it and close the socket
+            self.overflows += 1
+            print(f"Relay queue passed {self.hard_bytes} bytes (sender ignored relay-credit), closing socket")
+            self.stop()
+            asyncio.create_task(self._close_socket())
+            return False
+        self._append(kind, payload, size)
+        if not self.paused and self.queued_bytes > self.max_bytes:
+            self.paused = True
+            self._signal(True)
+        return True
+
+    def _append(self, kind: str, payload, size: int):
+        self.frames.append((kind, payload, size))
+        self.queued_bytes += size
+        self.peak_bytes = max(self.peak_bytes, self.queued_bytes)
+        self._not_empty.set()
+
+    def _signal(self, paused: bool):
+        if self.on_pressure is not None:
+            try:
+                self.on_pressure(paused, self.queued_bytes)
+            except Exception as e:
+                print(f"Relay pressure callback error: {e}")
+
+    async def _send(self, kind: str, payload):
+        if kind == "text":
+            await self.websocket.send_text(payload)
+        elif kind == "bytes":
+            await self.websocket.send_bytes(payload)
+        else:
+            await self.websocket.send_json(payload)
+
+    async def _write_loop(self):
+        try:
+            while True:
+                if not self.frames:
+                    self._not_empty.clear()
+                    await self._not_empty.wait()
+                    continue
+                kind, payload, size = self.frames[0]
+                try:
+                    await asyncio.wait_for(self._send(kind, payload), timeout=RELAY_STALL_TIMEOUT)
+                except asyncio.TimeoutError:
+                    self.stalls += 1
+                    print(f"Relay stalled for {RELAY_STALL_TIMEOUT}s, closing socket ({len(self.frames)} frames pending)")
+                    await self._close_socket()
+                    break
+                except Exception as e:
+                    print(f"Relay Error ({kind}): {e}")
+                    break
+                self.frames.popleft()
+                self.queued_bytes -= size
+                self.sent_frames += 1
+                self.sent_bytes += size
+                self.room_stats.record(size)
+                self._has_room.set()
+                if self.paused and self.queued_bytes <= self.low_bytes:
+                    self.paused = False
+                    self._signal(False)
+        except asyncio.CancelledError:
+            pass
+        finally:
+            self._close()
+
+    async def _close_socket(self):
+        try: await self.websocket.close(code=1011)
+        except Exception: pass
+
+    def _close(self):
+        self.closed = True
+        self.frames.clear()
+        self.queued_bytes = 0
+        self._has_room.set()
+
+    def stop(self):
+        self._close()
+        if self._writer is not None:
+            self._writer.cancel()
+            self._writer = None
+
+    def stats(self) -> dict:
+        return {
+            "queue_frames": len(self.frames),
+            "queue_bytes": self.queued_bytes,
+            "peak_queue_bytes": self.peak_bytes,
+            "max_queue_bytes": self.max_bytes,
+            "sent_frames": self.sent_frames,
+            "sent_bytes": self.sent_bytes,
+            "paused": self.paused,
+            "stalls": self.stalls,
+            "overflows": self.overflows,
+        }
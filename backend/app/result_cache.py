@@ -0,0 +1,204 @@
+import os
+import glob
+import json
+import shutil
+import hashlib
+import tempfile
+import threading
+from collections import OrderedDict
+
+# Content-Addressed Result Cache: users re-upload the same file with the same slider
+# constantly. Results are keyed on SHA-256(input bytes) + operation + normalized params
+# and stored on disk, so a repeat request is served from the stored output without
+# touching PyMuPDF. Size-bounded with LRU eviction (RESULT_CACHE_MAX_MB).
+
+# Part of every key, so entries written by older code are never served after a deploy.
+# Bump an op's version whenever its agent's output changes for the same params;
+# RESULT_CACHE_VERSION drops the whole cache at once.
+RESULT_CACHE_VERSION = os.getenv("RESULT_CACHE_VERSION", "1")
+OP_VERSIONS = {
+    "compress-pdf": 1,
+    "compress-pdf-estimate": 4,
+    # Reports of compress-pdf results, stored under the same params as the file
+    "compress-pdf-report": 1,
+    "compress-image": 1,
+    "organize-pdf": 1,
+    "extract-thumbnails": 1,
+    "image-to-pdf": 1,
+    "split-pdf": 1,
+    "pdf-to-word": 1,
+    "office-to-pdf": 1,
+    "repair-pdf": 1,
+    "ocr-pdf": 1,
+}
+
+RESULT_CACHE_DIR = os.getenv("RESULT_CACHE_DIR", os.path.join(tempfile.gettempdir(), "pdfninja-result-cache"))
+RESULT_CACHE_MAX_BYTES = int(os.getenv("RESULT_CACHE_MAX_MB", "512")) * 1024 * 1024
+
+HASH_CHUNK = 1024 * 1024
+
+
+def hash_file(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def normalize_ranges(ranges: str) -> str:
+    # "1-3, 5 ,7-9" and "1-3,5,7-9" produce the same split
+    return ",".join(part.replace(" ", "") for part in ranges.split(",") if part.strip())
+
+
+def normalize_order(order: str) -> str:
+    if not order.strip():
+        return ""
+    try:
+        return ",".join(str(int(x)) for x in order.split(","))
+    except ValueError:
+        # organize_pdf falls back to the original file; key on the raw string
+        return order.strip()
+
+
+class ResultCache:
+    def __init__(self, cache_dir: str = RESULT_CACHE_DIR, max_bytes: int = RESULT_CACHE_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        # key -> (path, size), oldest first
+        self.index: OrderedDict[str, tuple[str, int]] = OrderedDict()
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._load_index()
+
+    def _load_index(self):
+        # Rebuild LRU order from mtimes so the cache survives restarts
+        entries = []
+        for path in glob.glob(os.path.join(self.cache_dir, "*")):
+            name = os.path.basename(path)
+            if name.startswith(".") or not os.path.isfile(path):
+                continue
+            st = os.stat(path)
+            entries.append((st.st_mtime, name.split(".", 1)[0], path, st.st_size))
+        for _, key, path, size in sorted(entries):
+            self.index[key] = (path, size)
+            self.total_bytes += size
+
+    @staticmethod
+    def make_key(op: str, input_hash: str, params: dict = None) -> str:
+        version = f"{RESULT_CACHE_VERSION}.{OP_VERSIONS.get(op, 0)}"
+        payload = json.dumps({"op": op, "version": version, "input": input_hash, "params": params or {}}, sort_keys=True)
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def _lookup(self, key: str):
+        with self._lock:
+            entry = self.index.get(key)
+            if entry is None:
+                # Another uvicorn worker may have stored it
+                found = glob.glob(os.path.join(self.cache_dir, key + ".*"))
+                if found:
+                    entry = (found[0], os.path.getsize(found[0]))
+                    self.index[key] = entry
+                    self.total_bytes += entry[1]
+            if entry is None or not os.path.exists(entry[0]):
+                if entry is not None:
+                    self._drop(key)
+                self.misses += 1
+                return None
+            self.index.move_to_end(key)
+            self.hits += 1
+        try: os.utime(entry[0])
+        except OSError: pass
+        return entry[0]
+
+    def get_file(self, op: str, input_hash: str, params: dict = None):
+        """
+        Returns the cached output path for this input/op/params, or None.
+        Blocking (globs and touches the file): call from a threadpool.
+        """
+        return self._lookup(self.make_key(op, input_hash, params))
+
+    def get_json(self, op: str, input_hash: str, params: dict = None):
+        path = self._lookup(self.make_key(op, input_hash, params))
+        if path is None:
+            return None
+        try:
+            with open(path, "r") as f:
+                return json.load(f)
+        except Exception as e:
+            print(f"Result cache read error ({op}): {e}")
+            return None
+
+    def _store(self, key: str, ext: str, write):
+        final_path = os.path.join(self.cache_dir, key + ext)
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, prefix=".incoming-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                write(f)
+            os.replace(tmp_path, final_path)
+        except Exception:
+            try: os.remove(tmp_path)
+            except OSError: pass
+            raise
+        size = os.path.getsize(final_path)
+        with self._lock:
+            old = self.index.pop(key, None)
+            if old is not None:
+                self.total_bytes -= old[1]
+            self.index[key] = (final_path, size)
+            self.total_bytes += size
+            self._evict()
+        return final_path
+
+    def put_file(self, op: str, input_hash: str, params: dict, src_path: str) -> str:
+        """
+        Copies a finished output into the cache. Blocking: call from a threadpool.
+        """
+        ext = os.path.splitext(src_path)[1]
+        key = self.make_key(op, input_hash, params)
+        try:
+            with open(src_path, "rb") as src:
+                return self._store(key, ext, lambda dst: shutil.copyfileobj(src, dst, HASH_CHUNK))
+        except Exception as e:
+            print(f"Result cache write error ({op}): {e}")
+            return src_path
+
+    def put_json(self, op: str, input_hash: str, params: dict, data) -> None:
+        key = self.make_key(op, input_hash, params)
+        try:
+            self._store(key, ".json", lambda dst: dst.write(json.dumps(data).encode()))
+        except Exception as e:
+            print(f"Result cache write error ({op}): {e}")
+
+    def _drop(self, key: str):
+        path, size = self.index.pop(key)
+        self.total_bytes -= size
+        try: os.remove(path)
+        except OSError: pass
+
+    def _evict(self):
+        # Caller holds the lock. Never evict the entry that was just written.
+        while self.total_bytes > self.max_bytes and len(self.index) > 1:
+            oldest = next(iter(self.index))
+            self._drop(oldest)
+            self.evictions += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self.index),
+                "bytes": self.total_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+result_cache = ResultCache()
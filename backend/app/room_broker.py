@@ -0,0 +1,354 @@
+import os
+import json
+import struct
+import asyncio
+from urllib.parse import urlparse
+
+# Room Broker: ConnectionManager no longer assumes both peers of a /ws/drop room live in
+# the same process. Every frame is published to the peer's channel (drop:{room}:{client})
+# and whichever worker holds that socket delivers it. This lifts the --workers 1 pin.
+#
+#   ROOM_BROKER=memory    (default) in-process, single worker, zero overhead
+#   ROOM_BROKER=redis     Redis pub/sub, ROOM_BROKER_URL=redis://host:6379/0 (needs `redis`)
+#   ROOM_BROKER=loopback  bundled TCP hub, ROOM_BROKER_URL=tcp://127.0.0.1:7379
+#                         run the hub with: python -m app.room_broker --port 7379
+#
+# Frames travel as bytes: one tag byte + payload.
+#   T = text frame, B = binary frame, J = JSON control message from send_message()
+
+TAG_TEXT, TAG_BYTES, TAG_JSON = b"T", b"B", b"J"
+
+
+def encode_frame(kind: str, payload) -> bytes:
+    if kind == "text":
+        return TAG_TEXT + payload.encode("utf-8")
+    if kind == "bytes":
+        return TAG_BYTES + bytes(payload)
+    return TAG_JSON + json.dumps(payload).encode("utf-8")
+
+
+def decode_frame(data: bytes):
+    tag, body = data[:1], data[1:]
+    if tag == TAG_TEXT:
+        return "text", body.decode("utf-8")
+    if tag == TAG_BYTES:
+        return "bytes", body
+    return "json", json.loads(body)
+
+
+def channel_for(room_id: str, client_type: str) -> str:
+    return f"drop:{room_id}:{client_type}"
+
+
+class InProcessBroker:
+    """
+    Delivers directly to sockets registered in this process.
+    """
+    name = "memory"
+    # deliver() is awaited by the publisher itself, so it may wait for queue space
+    blocking_delivery = True
+
+    def __init__(self):
+        self.members = {}
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        self.members.clear()
+
+    async def join(self, room_id: str, client_type: str, deliver):
+        self.members[(room_id, client_type)] = deliver
+
+    async def leave(self, room_id: str, client_type: str, deliver=None):
+        current = self.members.get((room_id, client_type))
+        if current is not None and (deliver is None or current == deliver):
+            del self.members[(room_id, client_type)]
+
+    async def publish(self, room_id: str, to_client: str, kind: str, payload) -> int:
+        deliver = self.members.get((room_id, to_client))
+        if deliver is None:
+            return 0
+        await deliver(kind, payload)
+        return 1
+
+
+class PubSubBroker:
+    """
+    Routes frames through any transport with publish(channel, bytes) -> receiver count
+    and subscribe(channel, handler) / unsubscribe(channel).
+    """
+    name = "pubsub"
+    # deliver() runs on the transport's read loop, shared by every room on the worker
+    # (and by the loopback hub's acks): it must return without waiting
+    blocking_delivery = False
+
+    def __init__(self, transport):
+        self.transport = transport
+        self.members = {}
+
+    async def start(self):
+        await self.transport.connect()
+
+    async def stop(self):
+        await self.transport.close()
+        self.members.clear()
+
+    async def join(self, room_id: str, client_type: str, deliver):
+        channel = channel_for(room_id, client_type)
+        self.members[channel] = deliver
+
+        async def on_message(data: bytes):
+            handler = self.members.get(channel)
+            if handler is not None:
+                kind, payload = decode_frame(data)
+                await handler(kind, payload)
+
+        await self.transport.subscribe(channel, on_message)
+
+    async def leave(self, room_id: str, client_type: str, deliver=None):
+        channel = channel_for(room_id, client_type)
+        current = self.members.get(channel)
+        if current is not None and (deliver is None or current == deliver):
+            del self.members[channel]
+            await self.transport.unsubscribe(channel)
+
+    async def publish(self, room_id: str, to_client: str, kind: str, payload) -> int:
+        return await self.transport.publish(channel_for(room_id, to_client), encode_frame(kind, payload))
+
+
+# -----------------------------------------------------------------------
+# Transports
+# -----------------------------------------------------------------------
+
+# The reader polls with get_message: pubsub.listen() returns as soon as the last channel
+# is unsubscribed and raises on a dropped connection, and either would leave the worker
+# deaf to every later room. redis-py re-subscribes on reconnect, so after a read error
+# the loop waits REDIS_RETRY_S and carries on.
+REDIS_READ_TIMEOUT_S = 1.0
+REDIS_RETRY_S = float(os.getenv("ROOM_BROKER_RETRY_S", "1.0"))
+
+
+class RedisTransport:
+    def __init__(self, url: str):
+        try:
+            import redis.asyncio as redis
+        except ImportError:
+            raise RuntimeError("ROOM_BROKER=redis requires the 'redis' package (pip install redis)")
+        self.client = redis.from_url(url)
+        self.pubsub = self.client.pubsub()
+        self.handlers = {}
+        self._reader = None
+
+    async def connect(self):
+        await self.client.ping()
+
+    async def close(self):
+        if self._reader is not None:
+            self._reader.cancel()
+        await self.pubsub.close()
+        await self.client.close()
+
+    async def _read_loop(self):
+        while True:
+            try:
+                message = await self.pubsub.get_message(ignore_subscribe_messages=True, timeout=REDIS_READ_TIMEOUT_S)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Redis broker read error, retrying in {REDIS_RETRY_S}s: {e}")
+                await asyncio.sleep(REDIS_RETRY_S)
+                continue
+            if message is None or message.get("type") != "message":
+                continue
+            channel = message["channel"]
+            if isinstance(channel, bytes):
+                channel = channel.decode()
+            handler = self.handlers.get(channel)
+            if handler is not None:
+                try:
+                    await handler(message["data"])
+                except Exception as e:
+                    print(f"Broker delivery error on {channel}: {e}")
+
+    async def subscribe(self, channel: str, handler):
+        self.handlers[channel] = handler
+        await self.pubsub.subscribe(channel)
+        if self._reader is None or self._reader.done():
+            self._reader = asyncio.create_task(self._read_loop())
+
+    async def unsubscribe(self, channel: str):
+        self.handlers.pop(channel, None)
+        await self.pubsub.unsubscribe(channel)
+
+    async def publish(self, channel: str, data: bytes) -> int:
+        return await self.client.publish(channel, data)
+
+
+# Loopback wire format: 4-byte big-endian length, then op byte, 2-byte channel length,
+# channel, payload. Ops: S subscribe, U unsubscribe, P publish, M message pushed by the
+# hub to subscribers. S/U/P are acknowledged in order with R + 4-byte receiver count, so
+# a join is visible to every other worker before the socket is accepted.
+
+def _pack(op: bytes, channel: str = "", payload: bytes = b"") -> bytes:
+    ch = channel.encode()
+    body = op + struct.pack(">H", len(ch)) + ch + payload
+    return struct.pack(">I", len(body)) + body
+
+
+async def _read_packet(reader: asyncio.StreamReader):
+    (length,) = struct.unpack(">I", await reader.readexactly(4))
+    body = await reader.readexactly(length)
+    (ch_len,) = struct.unpack(">H", body[1:3])
+    return body[:1], body[3:3 + ch_len].decode(), body[3 + ch_len:]
+
+
+class LoopbackHub:
+    """
+    Minimal pub/sub hub over TCP: a local stand-in for Redis so several uvicorn workers
+    (or a test) can share rooms without external infrastructure.
+    """
+    def __init__(self, host: str = "127.0.0.1", port: int = 7379):
+        self.host = host
+        self.port = port
+        self.subscribers: dict[str, set] = {}
+        self.connections = set()
+        self.server = None
+
+    async def start(self):
+        self.server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        if self.server is not None:
+            self.server.close()
+            for writer in list(self.connections):
+                writer.close()
+            await self.server.wait_closed()
+
+    async def _handle(self, reader, writer):
+        subscribed = set()
+        self.connections.add(writer)
+        try:
+            while True:
+                op, channel, payload = await _read_packet(reader)
+                if op == b"S":
+                    self.subscribers.setdefault(channel, set()).add(writer)
+                    subscribed.add(channel)
+                    writer.write(_pack(b"R", "", struct.pack(">I", 0)))
+                    await writer.drain()
+                elif op == b"U":
+                    self.subscribers.get(channel, set()).discard(writer)
+                    subscribed.discard(channel)
+                    writer.write(_pack(b"R", "", struct.pack(">I", 0)))
+                    await writer.drain()
+                elif op == b"P":
+                    targets = list(self.subscribers.get(channel, ()))
+                    for target in targets:
+                        target.write(_pack(b"M", channel, payload))
+                    writer.write(_pack(b"R", "", struct.pack(">I", len(targets))))
+                    for target in targets:
+                        await target.drain()
+                    await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError, asyncio.CancelledError):
+            # CancelledError: hub shutting down, just drop the connection
+            pass
+        finally:
+            for channel in subscribed:
+                self.subscribers.get(channel, set()).discard(writer)
+            self.connections.discard(writer)
+            writer.close()
+
+
+class LoopbackTransport:
+    def __init__(self, url: str):
+        parsed = urlparse(url)
+        self.host = parsed.hostname or "127.0.0.1"
+        self.port = parsed.port or 7379
+        self.handlers = {}
+        self.pending = []
+        self.reader = None
+        self.writer = None
+        self._read_task = None
+        self._write_lock = asyncio.Lock()
+
+    async def connect(self):
+        self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        self._read_task = asyncio.create_task(self._read_loop())
+
+    async def close(self):
+        if self._read_task is not None:
+            self._read_task.cancel()
+        if self.writer is not None:
+            self.writer.close()
+        for future in self.pending:
+            if not future.done():
+                future.set_exception(ConnectionError("loopback broker closed"))
+        self.pending.clear()
+
+    async def _read_loop(self):
+        try:
+            while True:
+                op, channel, payload = await _read_packet(self.reader)
+                if op == b"R":
+                    # Hub acknowledges S/U/P in order on each connection
+                    self.pending.pop(0).set_result(struct.unpack(">I", payload)[0])
+                elif op == b"M":
+                    handler = self.handlers.get(channel)
+                    if handler is not None:
+                        try:
+                            await handler(payload)
+                        except Exception as e:
+                            print(f"Broker delivery error on {channel}: {e}")
+        except (asyncio.IncompleteReadError, ConnectionError) as e:
+            print(f"Loopback broker connection lost: {e}")
+            for future in self.pending:
+                if not future.done():
+                    future.set_exception(ConnectionError("loopback broker connection lost"))
+
+    async def _request(self, packet: bytes) -> int:
+        future = asyncio.get_running_loop().create_future()
+        async with self._write_lock:
+            self.pending.append(future)
+            self.writer.write(packet)
+            await self.writer.drain()
+        return await future
+
+    async def subscribe(self, channel: str, handler):
+        self.handlers[channel] = handler
+        await self._request(_pack(b"S", channel))
+
+    async def unsubscribe(self, channel: str):
+        self.handlers.pop(channel, None)
+        await self._request(_pack(b"U", channel))
+
+    async def publish(self, channel: str, data: bytes) -> int:
+        return await self._request(_pack(b"P", channel, data))
+
+
+def create_broker():
+    kind = os.getenv("ROOM_BROKER", "memory").lower()
+    url = os.getenv("ROOM_BROKER_URL", "")
+    if kind == "redis":
+        return PubSubBroker(RedisTransport(url or "redis://localhost:6379/0"))
+    if kind == "loopback":
+        return PubSubBroker(LoopbackTransport(url or "tcp://127.0.0.1:7379"))
+    if kind != "memory":
+        print(f"Unknown ROOM_BROKER={kind!r}, using in-process rooms")
+    return InProcessBroker()
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Loopback room broker hub for multi-worker /ws/drop")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=7379)
+    args = parser.parse_args()
+
+    async def serve():
+        hub = LoopbackHub(args.host, args.port)
+        await hub.start()
+        print(f"Loopback room broker listening on {hub.host}:{hub.port}")
+        await asyncio.Event().wait()
+
+    asyncio.run(serve())
@@ -0,0 +1,86 @@
+import time
+import contextvars
+from contextlib import contextmanager
+
+# Stage Tracing: agents wrap each stage in `with span("ocr.tesseract"):`. Spans land in
+# the Trace of the current request (a contextvar), so they cost one perf_counter pair
+# and a dict update when tracing is active and nothing measurable when it isn't.
+# Stages that repeat per page/XREF are aggregated: {stage: [total_seconds, count]}.
+#
+# Agents running in the process pool are wrapped by run_traced(), which ships the child's
+# stages back with the result; the engine merges them into the caller's trace. The
+# finished trace is fed into the metrics aggregator and, on request, returned as a
+# Server-Timing header (send X-Debug-Timing: 1, or set TRACE_RESPONSE_HEADER=1).
+
+_current_trace = contextvars.ContextVar("pdfninja_trace", default=None)
+
+
+class Trace:
+    def __init__(self):
+        self.stages: dict[str, list] = {}
+
+    def add(self, name: str, seconds: float, count: int = 1):
+        entry = self.stages.get(name)
+        if entry is None:
+            self.stages[name] = [seconds, count]
+        else:
+            entry[0] += seconds
+            entry[1] += count
+
+    def merge(self, stages: dict):
+        for name, (seconds, count) in stages.items():
+            self.add(name, seconds, count)
+
+    def to_list(self) -> list[dict]:
+        return [
+            {"stage": name, "ms": round(seconds * 1000, 2), "count": count}
+            for name, (seconds, count) in self.stages.items()
+        ]
+
+    def server_timing(self) -> str:
+        # Server-Timing metric names must be tokens; dots and underscores are fine
+        return ", ".join(
+            f'{name};dur={seconds * 1000:.1f};desc="x{count}"'
+            for name, (seconds, count) in self.stages.items()
+        )
+
+
+def current_trace():
+    return _current_trace.get()
+
+
+def start_trace():
+    """
+    Activates a fresh Trace for the current context. Returns (trace, token) for end_trace.
+    """
+    trace = Trace()
+    return trace, _current_trace.set(trace)
+
+
+def end_trace(token):
+    _current_trace.reset(token)
+
+
+@contextmanager
+def span(name: str):
+    trace = _current_trace.get()
+    if trace is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.add(name, time.perf_counter() - start)
+
+
+def run_traced(fn, args, kwargs):
+    """
+    Pool-side wrapper: runs fn under its own Trace and returns (result, stages).
+    Top-level so it pickles into ProcessPoolExecutor workers.
+    """
+    trace, token = start_trace()
+    try:
+        return fn(*args, **kwargs), trace.stages
+    finally:
+        end_trace(token)
@@ -0,0 +1,186 @@
+import os
+import json
+import time
+import queue
+import sqlite3
+import asyncio
+import threading
+from concurrent.futures import Future
+from datetime import datetime, timedelta
+
+# Usage Store: replaces the usage_log.json rewrite-per-request with SQLite in WAL mode.
+# - (day, key) is the primary key, so lookups are indexed and increments are atomic
+# - A single writer thread group-commits every increment queued while the previous
+#   transaction was running, so a burst of requests costs one fsync, not one each
+# - BEGIN IMMEDIATE + busy_timeout make it safe to share across uvicorn workers
+# - Days older than USAGE_RETENTION_DAYS are pruned instead of kept forever
+
+USAGE_RETENTION_DAYS = int(os.getenv("USAGE_RETENTION_DAYS", "30"))
+WRITE_BATCH_MAX = 256
+PRUNE_INTERVAL = 3600
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS usage (
+    day   TEXT    NOT NULL,
+    key   TEXT    NOT NULL,
+    count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (day, key)
+) WITHOUT ROWID
+"""
+
+
+def today_str() -> str:
+    return datetime.now().strftime("%Y-%m-%d")
+
+
+class UsageStore:
+    def __init__(self, db_path: str, retention_days: int = USAGE_RETENTION_DAYS):
+        self.db_path = db_path
+        self.retention_days = retention_days
+        self.batches = 0
+        self.writes = 0
+        self._local = threading.local()
+        self._queue = queue.Queue()
+        self._last_prune = 0.0
+
+        conn = self._connect()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(SCHEMA)
+        conn.commit()
+        conn.close()
+
+        self._writer = threading.Thread(target=self._write_loop, daemon=True, name="usage-writer")
+        self._writer.start()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None, check_same_thread=False)
+        conn.execute("PRAGMA busy_timeout=30000")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _reader(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._connect()
+            self._local.conn = conn
+        return conn
+
+    # --- Reads (indexed point lookups, never blocked by the writer under WAL) ---
+
+    def get_count(self, key: str, day: str = None) -> int:
+        row = self._reader().execute(
+            "SELECT count FROM usage WHERE day = ? AND key = ?", (day or today_str(), key)
+        ).fetchone()
+        return row[0] if row else 0
+
+    # --- Writes (queued to the group-commit writer thread) ---
+
+    def submit_increment(self, key: str, limit: int, day: str = None) -> Future:
+        """
+        Queues an atomic "increment unless count >= limit".
+        The future resolves to (allowed, count_after).
+        """
+        future = Future()
+        self._queue.put((day or today_str(), key, limit, future))
+        return future
+
+    async def check_and_increment(self, key: str, limit: int, day: str = None):
+        return await asyncio.wrap_future(self.submit_increment(key, limit, day))
+
+    def _apply(self, conn, day: str, key: str, limit: int):
+        conn.execute(
+            "INSERT INTO usage (day, key, count) VALUES (?, ?, 0) ON CONFLICT(day, key) DO NOTHING",
+            (day, key),
+        )
+        cur = conn.execute(
+            "UPDATE usage SET count = count + 1 WHERE day = ? AND key = ? AND count < ?",
+            (day, key, limit),
+        )
+        count = conn.execute("SELECT count FROM usage WHERE day = ? AND key = ?", (day, key)).fetchone()[0]
+        return cur.rowcount == 1, count
+
+    def _write_loop(self):
+        conn = self._connect()
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < WRITE_BATCH_MAX:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            results = []
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                for day, key, limit, _ in batch:
+                    results.append(self._apply(conn, day, key, limit))
+                conn.execute("COMMIT")
+            except Exception as e:
+                try: conn.execute("ROLLBACK")
+                except Exception: pass
+                print(f"Usage store write error: {e}")
+                for *_, future in batch:
+                    future.set_exception(e)
+                continue
+
+            self.batches += 1
+            self.writes += len(batch)
+            for (*_, future), result in zip(batch, results):
+                future.set_result(result)
+
+            if time.time() - self._last_prune > PRUNE_INTERVAL:
+                self.prune(conn)
+
+    def prune(self, conn=None):
+        """
+        Deletes counters for days older than the retention window.
+        """
+        cutoff = (datetime.now() - timedelta(days=self.retention_days)).strftime("%Y-%m-%d")
+        own_conn = conn is None
+        conn = conn or self._connect()
+        try:
+            cur = conn.execute("DELETE FROM usage WHERE day < ?", (cutoff,))
+            if cur.rowcount:
+                print(f"🧹 Usage store: pruned {cur.rowcount} counters older than {cutoff}")
+        except Exception as e:
+            print(f"Usage store prune error: {e}")
+        finally:
+            if own_conn:
+                conn.close()
+        self._last_prune = time.time()
+
+    def import_json(self, json_path: str):
+        """
+        One-time migration from the legacy usage_log.json ({day: {key: count}}).
+        """
+        if not os.path.exists(json_path):
+            return
+        try:
+            with open(json_path, "r") as f:
+                legacy = json.load(f)
+        except Exception:
+            print(f"Error loading {json_path}")
+            return
+        rows = [
+            (day, key, int(count))
+            for day, counters in legacy.items()
+            for key, count in counters.items()
+        ]
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.executemany(
+                "INSERT INTO usage (day, key, count) VALUES (?, ?, ?) "
+                "ON CONFLICT(day, key) DO UPDATE SET count = MAX(count, excluded.count)",
+                rows,
+            )
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+        try:
+            os.replace(json_path, json_path + ".migrated")
+        except OSError:
+            # Another worker migrated it first; the MAX() upsert keeps this idempotent
+            return
+        print(f"Usage store: migrated {len(rows)} counters from {os.path.basename(json_path)}")
+        self.prune()
@@ -0,0 +1,171 @@
+import os
+import time
+import shutil
+import asyncio
+import tempfile
+import threading
+from starlette.background import BackgroundTask
+from fastapi.concurrency import run_in_threadpool
+
+# Temp-File Lifecycle: every request gets its own workspace directory. The upload and
+# every derived file (_compressed.pdf, _part_N.pdf, _split.zip, .docx, _true_edit.pdf)
+# land inside it because agents name outputs after their input path. The directory is
+# removed by a background task once the FileResponse has finished streaming, and a
+# periodic sweeper removes orphans (crashed requests, other workers) so /tmp can't grow
+# until the Render disk fills.
+
+WORKSPACE_ROOT = os.getenv("WORKSPACE_ROOT", os.path.join(tempfile.gettempdir(), "pdfninja-work"))
+# Job workspaces are exempt while held (HOLD_FILE), their results are served out of them
+WORKSPACE_ORPHAN_AGE = int(os.getenv("WORKSPACE_ORPHAN_AGE", str(2 * 3600)))
+WORKSPACE_SWEEP_INTERVAL = int(os.getenv("WORKSPACE_SWEEP_INTERVAL", "300"))
+# Marker holding a workspace past the orphan age (async jobs). Every worker's sweeper
+# honours it, so one worker never collects a live job workspace owned by another.
+HOLD_FILE = ".hold-until"
+
+
+def _held(path: str, now: float) -> bool:
+    try:
+        with open(os.path.join(path, HOLD_FILE)) as f:
+            return float(f.read().strip()) > now
+    except (OSError, ValueError):
+        return False
+
+
+def _dir_bytes(path: str) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+class Workspace:
+    def __init__(self, path: str):
+        self.path = path
+        self.created_at = time.time()
+
+
+class WorkspaceManager:
+    def __init__(self, root: str = WORKSPACE_ROOT):
+        self.root = root
+        self.active: dict[str, Workspace] = {}
+        self.created = 0
+        self.released = 0
+        self.orphans_swept = 0
+        self.bytes_freed = 0
+        self._sweeper = None
+        self._lock = threading.Lock()
+        os.makedirs(self.root, exist_ok=True)
+
+    def create(self) -> Workspace:
+        workspace = Workspace(tempfile.mkdtemp(prefix="req-", dir=self.root))
+        with self._lock:
+            self.active[workspace.path] = workspace
+            self.created += 1
+        return workspace
+
+    def release(self, workspace: Workspace):
+        """
+        Deletes the workspace and everything in it. Blocking, idempotent.
+        """
+        with self._lock:
+            if self.active.pop(workspace.path, None) is None:
+                return
+            self.released += 1
+        freed = _dir_bytes(workspace.path)
+        shutil.rmtree(workspace.path, ignore_errors=True)
+        with self._lock:
+            self.bytes_freed += freed
+
+    def hold(self, workspace: Workspace, until: float):
+        """
+        Keeps the sweeper (of any worker) off the workspace until the given epoch time.
+        """
+        with open(os.path.join(workspace.path, HOLD_FILE), "w") as f:
+            f.write(repr(until))
+
+    def adopt(self, workspace: Workspace, path: str) -> str:
+        """
+        Hard-links (copies across filesystems) a file owned by someone else, e.g. the
+        result cache, into the workspace and returns the new path. Blocking.
+        """
+        dst = os.path.join(workspace.path, "adopted-" + os.path.basename(path))
+        try:
+            os.link(path, dst)
+        except OSError:
+            shutil.copyfile(path, dst)
+        return dst
+
+    def cleanup_task(self, workspace: Workspace) -> BackgroundTask:
+        # Starlette runs sync background tasks in the threadpool after the body is sent
+        return BackgroundTask(self.release, workspace)
+
+    async def discard(self, workspace: Workspace):
+        await run_in_threadpool(self.release, workspace)
+
+    def sweep_orphans(self):
+        now = time.time()
+        with self._lock:
+            active = set(self.active)
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            if path in active:
+                continue
+            try:
+                if now - os.path.getmtime(path) < WORKSPACE_ORPHAN_AGE:
+                    continue
+                if os.path.isdir(path) and _held(path, now):
+                    continue
+                freed = _dir_bytes(path) if os.path.isdir(path) else os.path.getsize(path)
+                if os.path.isdir(path):
+                    shutil.rmtree(path, ignore_errors=True)
+                else:
+                    os.remove(path)
+            except OSError:
+                continue
+            with self._lock:
+                self.orphans_swept += 1
+                self.bytes_freed += freed
+            print(f"🧹 Workspace sweep: removed orphan {name} ({freed} bytes)")
+
+    async def _sweep_forever(self):
+        while True:
+            await asyncio.sleep(WORKSPACE_SWEEP_INTERVAL)
+            try:
+                await run_in_threadpool(self.sweep_orphans)
+            except Exception as e:
+                print(f"Workspace sweep error: {e}")
+
+    def start(self):
+        if self._sweeper is None:
+            self._sweeper = asyncio.create_task(self._sweep_forever())
+
+    def stop(self):
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+            self._sweeper = None
+
+    def stats(self) -> dict:
+        usage = shutil.disk_usage(self.root)
+        with self._lock:
+            active = len(self.active)
+            counters = {
+                "created": self.created,
+                "released": self.released,
+                "orphans_swept": self.orphans_swept,
+                "bytes_freed": self.bytes_freed,
+            }
+        return {
+            "root": self.root,
+            "active": active,
+            "bytes": _dir_bytes(self.root),
+            "disk_total_bytes": usage.total,
+            "disk_free_bytes": usage.free,
+            **counters,
+        }
+
+
+workspaces = WorkspaceManager()
@@ -0,0 +1,153 @@
+import os
+import sys
+import time
+import shutil
+import tempfile
+import fitz
+import numpy as np
+from PIL import Image, ImageFilter
+
+# Adaptive colour vs the old slider rule (RGB above 50, everything gray at 50 and below)
+# on a mixed document: colour charts, a scanned page with a small red stamp, yellowed
+# text scans stored as RGB JPEGs, and line-art diagrams stored as RGB Flate. Prints size
+# and time per mode and checks that colour survives at quality 40, that the gray scans
+# lose their chroma channels at 80 and that the diagrams become 1-bit. Target-size mode
+# at 3% of the input (its smallest DPI rungs) must classify the same way.
+#   python test_adaptive_color.py [sets]
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+from app import pdf_agent
+from app.pdf_agent import run_iterative_pdf_compression, compress_pdf_to_target
+
+
+def jpeg(pixels, quality=92):
+    h, w, _ = pixels.shape
+    return fitz.Pixmap(fitz.csRGB, w, h, pixels.tobytes(), False).tobytes("jpeg", jpg_quality=quality)
+
+
+def colour_chart(rng):
+    h, w = 1000, 1400
+    pixels = np.full((h, w, 3), 250, np.float32)
+    colours = [(220, 40, 40), (40, 150, 60), (40, 80, 200), (240, 180, 30), (150, 60, 170)]
+    for i, colour in enumerate(colours):
+        top = int(900 - rng.uniform(200, 800))
+        pixels[top:900, 100 + i * 250:280 + i * 250] = colour
+    pixels[900:904, 60:1340] = 20
+    return np.clip(pixels + rng.normal(0, 3, pixels.shape), 0, 255).astype(np.uint8)
+
+
+def text_scan(rng, h=2200, w=1700, paper=(236, 226, 196)):
+    # Dark strokes on tinted paper with optical blur and sensor noise, like a yellowed book page
+    pixels = np.empty((h, w, 3), np.float32)
+    pixels[:] = paper
+    for row in range(200, h - 200, 60):
+        for x in range(150, w - 150, 40):
+            if rng.random() < 0.8:
+                pixels[row:row + 28, x:x + int(rng.uniform(6, 30))] = (40, 36, 30)
+    pixels = np.asarray(Image.fromarray(pixels.astype(np.uint8)).filter(ImageFilter.GaussianBlur(1.5)), np.float32)
+    return np.clip(pixels + rng.normal(0, 6, pixels.shape), 0, 255).astype(np.uint8)
+
+
+def stamped_scan(rng):
+    pixels = text_scan(rng)
+    # A red "APPROVED" stamp covering about 0.5% of the page
+    pixels[300:440, 1200:1340] = (200, 30, 30)
+    return pixels
+
+
+def line_art(rng):
+    h, w = 1600, 1600
+    pixels = np.full((h, w, 3), 255, np.uint8)
+    for _ in range(60):
+        if rng.random() < 0.5:
+            y, x0, x1 = rng.integers(0, h - 3), *sorted(rng.integers(0, w, 2))
+            pixels[y:y + 3, x0:x1] = 0
+        else:
+            x, y0, y1 = rng.integers(0, w - 3), *sorted(rng.integers(0, h, 2))
+            pixels[y0:y1, x:x + 3] = 0
+    return pixels
+
+
+def build(path, sets):
+    rng = np.random.default_rng(11)
+    doc = fitz.open()
+    kinds = []
+    for _ in range(sets):
+        for kind, pixels in (("chart", colour_chart(rng)), ("stamp", stamped_scan(rng)),
+                             ("scan", text_scan(rng)), ("lineart", line_art(rng))):
+            page = doc.new_page(width=612, height=792)
+            if kind == "lineart":
+                h, w, _ = pixels.shape
+                page.insert_image(page.rect, pixmap=fitz.Pixmap(fitz.csRGB, w, h, pixels.tobytes(), False))
+            else:
+                page.insert_image(page.rect, stream=jpeg(pixels))
+            kinds.append(kind)
+    doc.save(path, deflate=True)
+    doc.close()
+    return kinds
+
+
+def stored_images(path):
+    # Per page: (components, bits per component) of its image
+    with fitz.open(path) as doc:
+        out = []
+        for page in doc:
+            xref = page.get_images()[0][0]
+            cs = doc.xref_get_key(xref, "ColorSpace")[1]
+            bpc = int(doc.xref_get_key(xref, "BitsPerComponent")[1])
+            out.append((1 if "Gray" in cs else 3, bpc))
+        return out
+
+
+def compress(src, work_dir, name, quality):
+    path = os.path.join(work_dir, name)
+    shutil.copyfile(src, path)
+    t0 = time.perf_counter()
+    out = run_iterative_pdf_compression(path, quality, workers=1)
+    return out, time.perf_counter() - t0
+
+
+if __name__ == "__main__":
+    sets = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+    work_dir = tempfile.mkdtemp(prefix="adaptive-bench-")
+    classify, is_color = pdf_agent._classify_pixmap, pdf_agent._jpeg_is_color
+    try:
+        src = os.path.join(work_dir, "mixed.pdf")
+        kinds = build(src, sets)
+        print(f"Input: {len(kinds)} pages, {os.path.getsize(src) / 1024 / 1024:.1f} MB")
+        ok = True
+        for quality in (40, 80):
+            # The old rule: colour above 50, gray at 50 and below, never 1 bit
+            forced = "gray" if quality <= 50 else "color"
+            pdf_agent._classify_pixmap, pdf_agent._jpeg_is_color = (lambda pix: forced), (lambda raw: True)
+            old, old_t = compress(src, work_dir, f"old-q{quality}.pdf", quality)
+            pdf_agent._classify_pixmap, pdf_agent._jpeg_is_color = classify, is_color
+            new, new_t = compress(src, work_dir, f"adaptive-q{quality}.pdf", quality)
+            old_kb, new_kb = os.path.getsize(old) / 1024, os.path.getsize(new) / 1024
+            print(f"quality={quality}: slider rule {old_kb:7.0f} KB in {old_t:5.2f}s | adaptive {new_kb:7.0f} KB in {new_t:5.2f}s")
+            stored = stored_images(new)
+            for kind in ("chart", "stamp", "scan", "lineart"):
+                found = sorted({s for k, s in zip(kinds, stored) if k == kind})
+                print(f"   {kind:8s} stored as {', '.join(f'{n} ch x {bpc} bit' for n, bpc in found)}")
+            expected = {"chart": (3, 8), "stamp": (3, 8), "scan": (1, 8), "lineart": (1, 1)}
+            ok &= all(expected[k] == s for k, s in zip(kinds, stored))
+            if quality > 50:
+                ok &= new_kb < old_kb
+
+        target_kb = os.path.getsize(src) // 1024 * 3 // 100
+        path = os.path.join(work_dir, "target.pdf")
+        shutil.copyfile(src, path)
+        t0 = time.perf_counter()
+        out = compress_pdf_to_target(path, target_kb)
+        out_kb = os.path.getsize(out) / 1024
+        print(f"target={target_kb} KB: {out_kb:7.0f} KB in {time.perf_counter() - t0:5.2f}s")
+        stored = stored_images(out)
+        for kind in ("chart", "stamp", "scan", "lineart"):
+            found = sorted({s for k, s in zip(kinds, stored) if k == kind})
+            print(f"   {kind:8s} stored as {', '.join(f'{n} ch x {bpc} bit' for n, bpc in found)}")
+        ok &= out_kb <= target_kb and all(expected[k] == s for k, s in zip(kinds, stored))
+        print("PASS" if ok else "FAIL")
+        sys.exit(0 if ok else 1)
+    finally:
+        pdf_agent._classify_pixmap, pdf_agent._jpeg_is_color = classify, is_color
+        shutil.rmtree(work_dir, ignore_errors=True)
@@ -0,0 +1,108 @@
+import os
+import sys
+import time
+import shutil
+import tempfile
+import fitz
+import numpy as np
+
+# Bilevel scan mode vs the JPEG tiers on a synthetic scanned book: text pages rendered
+# at 300 DPI with paper grain, uneven lighting and JPEG artefacts, plus one photo page
+# that must stay JPEG. Checks the text pages became 1-bit and still match the clean
+# render, and prints sizes and timings.
+#   python test_bilevel_compress.py [pages]
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+from app.pdf_agent import run_iterative_pdf_compression, compress_pdf_bilevel, _compression_tier, BILEVEL_DPI
+
+TEXT = (
+    "A train 240 m long passes a pole in 12 seconds. How long will it take to pass a "
+    "platform 360 m long? Speed = 240 / 12 = 20 m/s, so the time taken is (240 + 360) / 20 "
+    "= 30 seconds. The ratio of the ages of two brothers is 3 : 5 and the sum is 48. "
+)
+
+
+def clean_pages(pages):
+    doc = fitz.open()
+    for i in range(pages):
+        page = doc.new_page(width=612, height=792)
+        page.insert_text((72, 60), f"Chapter {i + 1}: Time and Distance", fontsize=16)
+        page.insert_textbox(fitz.Rect(72, 80, 540, 740), TEXT * 14, fontsize=10.5)
+    return doc
+
+
+def build_scanned_book(path, pages):
+    rng = np.random.default_rng(7)
+    clean = clean_pages(pages)
+    doc = fitz.open()
+    for i, src in enumerate(clean):
+        pix = src.get_pixmap(dpi=300, colorspace=fitz.csGRAY)
+        gray = np.frombuffer(pix.samples, np.uint8).reshape(pix.height, pix.width).astype(np.float32)
+        # Yellowed paper that darkens towards the spine, ink that is not quite black
+        light = np.linspace(0.82, 0.97, pix.width, dtype=np.float32)[None, :]
+        scan = (28 + gray * (1 - 28 / 255)) * light + rng.normal(0, 6, gray.shape)
+        scan = fitz.Pixmap(fitz.csGRAY, pix.width, pix.height, np.clip(scan, 0, 255).astype(np.uint8).tobytes(), False)
+        page = doc.new_page(width=612, height=792)
+        page.insert_image(page.rect, stream=scan.tobytes("jpeg", jpg_quality=85))
+        if i == pages // 2:
+            # A photo plate: smooth colour gradients, must not be thresholded
+            h, w = 900, 700
+            yy, xx = np.mgrid[0:h, 0:w].astype(np.float32)
+            rgb = np.stack([xx / w * 255, yy / h * 255, (xx + yy) / (w + h) * 255], axis=-1)
+            photo = fitz.Pixmap(fitz.csRGB, w, h, np.clip(rgb + rng.normal(0, 10, rgb.shape), 0, 255).astype(np.uint8).tobytes(), False)
+            page = doc.new_page(width=612, height=792)
+            page.insert_image(page.rect, stream=photo.tobytes("jpeg", jpg_quality=90))
+    doc.save(path)
+    doc.close()
+    return clean
+
+
+def timed(fn, src, work_dir, name, *args):
+    path = os.path.join(work_dir, name)
+    shutil.copyfile(src, path)
+    t0 = time.perf_counter()
+    out = fn(path, *args)
+    return out, time.perf_counter() - t0
+
+
+def check_pages(out_path, clean):
+    doc = fitz.open(out_path)
+    filters, agreement = {}, []
+    text_pages = iter(clean)
+    for page in doc:
+        xref = page.get_images(full=True)[0][0]
+        kind = doc.xref_get_key(xref, "Filter")[1]
+        filters[kind] = filters.get(kind, 0) + 1
+        if kind in ("/CCITTFaxDecode", "/FlateDecode"):
+            # Rendered 1-bit page vs the original text, both thresholded at mid-grey
+            got = page.get_pixmap(dpi=BILEVEL_DPI, colorspace=fitz.csGRAY)
+            want = next(text_pages).get_pixmap(dpi=BILEVEL_DPI, colorspace=fitz.csGRAY)
+            a = np.frombuffer(got.samples, np.uint8) > 128
+            b = np.frombuffer(want.samples, np.uint8) > 128
+            if a.size == b.size:
+                agreement.append((a == b).mean())
+    doc.close()
+    return filters, min(agreement) if agreement else 0.0
+
+
+if __name__ == "__main__":
+    pages = int(sys.argv[1]) if len(sys.argv) > 1 else 12
+    work_dir = tempfile.mkdtemp(prefix="bilevel-bench-")
+    try:
+        src = os.path.join(work_dir, "book.pdf")
+        clean = build_scanned_book(src, pages)
+        print(f"Input: {pages} scanned text pages + 1 photo, {os.path.getsize(src) / 1024:.0f} KB")
+        for quality in (40, 60, 70):
+            out, t = timed(run_iterative_pdf_compression, src, work_dir, f"jpeg_{quality}.pdf", quality)
+            print(f"JPEG tier  quality={quality} ({_compression_tier(quality)[0]} DPI): "
+                  f"{os.path.getsize(out) / 1024:7.0f} KB in {t:.2f}s")
+        out, t = timed(compress_pdf_bilevel, src, work_dir, "bilevel.pdf", 40)
+        filters, agreement = check_pages(out, clean)
+        print(f"Bilevel 1-bit ({BILEVEL_DPI} DPI): {os.path.getsize(out) / 1024:7.0f} KB in {t:.2f}s "
+              f"({os.path.getsize(out) / 1024 / (pages + 1):.0f} KB/page) filters={filters}")
+        print(f"Worst text page agreement with the clean render: {agreement:.1%}")
+        ok = filters.get("/CCITTFaxDecode", 0) + filters.get("/FlateDecode", 0) == pages and agreement > 0.97
+        print("PASS" if ok else "FAIL")
+        sys.exit(0 if ok else 1)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
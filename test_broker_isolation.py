@@ -0,0 +1,184 @@
+import os
+import sys
+import time
+import asyncio
+from starlette.websockets import WebSocketState
+
+# One slow receiver must not hold up other rooms on the same worker. Two "workers"
+# (ConnectionManager + loopback broker each) share a LoopbackHub; worker 1 hosts a
+# receiver that stops reading and a healthy one in another room. A sender on worker 0
+# floods the slow room without honouring relay-credit, then pings the healthy room.
+# Checks the ping arrives promptly, every publish is acknowledged, the flooding sender
+# was told to pause, and the slow socket is closed 1011 at the hard cap instead of the
+# worker buffering without bound. Then a sender that also ignores relay-credit (like the
+# browser client) goes through the real /ws/drop handler to a receiver on the other
+# worker that reads slowly: the handler must hold the sender back itself, so every
+# chunk arrives in order and the receiver is never closed.
+#   python test_broker_isolation.py
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+os.environ.setdefault("RELAY_QUEUE_MAX_MB", "1")
+os.environ.setdefault("RELAY_QUEUE_HARD_MB", "4")
+os.environ.setdefault("RELAY_STALL_TIMEOUT", "60")
+from app import main as app_main
+from app.main import ConnectionManager
+from app.room_broker import LoopbackHub, LoopbackTransport, PubSubBroker
+
+CHUNK = 256 * 1024
+CHUNKS = 48  # 12 MB, three times the hard cap
+
+
+class FakeSocket:
+    def __init__(self, stalled=False, delay=0.0, incoming=()):
+        self.stalled = stalled
+        self.delay = delay
+        self.incoming = list(incoming)
+        self.client_state = WebSocketState.CONNECTING
+        self.frames = asyncio.Queue()
+        self.close_code = None
+
+    async def accept(self):
+        self.client_state = WebSocketState.CONNECTED
+
+    async def _send(self, kind, payload):
+        if self.stalled:
+            # A phone on a dead link: the write never completes
+            await asyncio.Event().wait()
+        # A receiver on a slow link
+        await asyncio.sleep(self.delay)
+        await self.frames.put((kind, payload))
+
+    async def receive(self):
+        # What the client sends, then a disconnect
+        await asyncio.sleep(0)
+        if self.incoming:
+            return self.incoming.pop(0)
+        return {"type": "websocket.disconnect"}
+
+    async def send_bytes(self, data):
+        await self._send("bytes", data)
+
+    async def send_text(self, data):
+        await self._send("text", data)
+
+    async def send_json(self, data):
+        await self._send("json", data)
+
+    async def close(self, code=1000):
+        self.close_code = code
+        self.client_state = WebSocketState.DISCONNECTED
+
+
+def credit_signals(socket):
+    credits = []
+    while not socket.frames.empty():
+        kind, payload = socket.frames.get_nowait()
+        if kind == "json" and payload.get("type") == "relay-credit":
+            credits.append(payload["paused"])
+    return credits
+
+
+async def start_workers(hub):
+    workers = []
+    for _ in range(2):
+        manager = ConnectionManager()
+        manager.broker = PubSubBroker(LoopbackTransport(f"tcp://127.0.0.1:{hub.port}"))
+        await manager.broker.start()
+        workers.append(manager)
+    return workers
+
+
+async def stop_workers(workers):
+    for manager in workers:
+        # As the /ws/drop handler would: stops each outbox and its pending relay-credit publish
+        for (room_id, client_type), (websocket, _, _) in list(manager.deliveries.items()):
+            await manager.disconnect(websocket, room_id, client_type)
+        await manager.broker.stop()
+
+
+async def flood(hub):
+    workers = await start_workers(hub)
+    sender, healthy = workers[0], workers[1]
+    slow_sender, slow_rx, fast_rx = FakeSocket(), FakeSocket(stalled=True), FakeSocket()
+    try:
+        await sender.connect(slow_sender, "slow", "sender")
+        await healthy.connect(slow_rx, "slow", "receiver")
+        await healthy.connect(fast_rx, "fast", "receiver")
+
+        t0 = time.perf_counter()
+        for i in range(CHUNKS):
+            await asyncio.wait_for(sender.broker.publish("slow", "receiver", "bytes", bytes([i % 256]) * CHUNK), 5)
+        flood_s = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        await asyncio.wait_for(sender.broker.publish("fast", "receiver", "json", {"type": "ping"}), 5)
+        ping = await asyncio.wait_for(fast_rx.frames.get(), 5)
+        ping_s = time.perf_counter() - t0
+        await asyncio.sleep(0.2)
+
+        outbox = healthy.deliveries[("slow", "receiver")][2].stats()
+        credits = credit_signals(slow_sender)
+        print(f"flood of {CHUNKS * CHUNK // 1024 // 1024} MB published in {flood_s:.2f}s, "
+              f"ping to the other room took {ping_s * 1000:.0f} ms")
+        print(f"slow receiver: peak {outbox['peak_queue_bytes'] / 1024 / 1024:.1f} MB queued, "
+              f"overflows={outbox['overflows']}, closed with {slow_rx.close_code}")
+        print(f"relay-credit to the flooding sender: {credits}")
+        ok = ping == ("json", {"type": "ping"}) and ping_s < 1.0
+        ok &= True in credits
+        ok &= slow_rx.close_code == 1011 and outbox["overflows"] == 1
+        ok &= outbox["peak_queue_bytes"] <= int(os.environ["RELAY_QUEUE_HARD_MB"]) * 1024 * 1024
+    except asyncio.TimeoutError:
+        print("broker read loop blocked: publish or delivery timed out")
+        ok = False
+    finally:
+        await stop_workers(workers)
+    return ok
+
+
+async def gated_sender(hub):
+    workers = await start_workers(hub)
+    sender, receiver = workers[0], workers[1]
+    chunks = [i.to_bytes(4, "big") + bytes(CHUNK - 4) for i in range(CHUNKS)]
+    tx = FakeSocket(incoming=[{"type": "websocket.receive", "bytes": chunk} for chunk in chunks])
+    rx = FakeSocket(delay=0.01)
+    try:
+        await receiver.connect(rx, "gated", "receiver")
+        # The /ws/drop handler on the sender's worker
+        app_main.manager = sender
+        t0 = time.perf_counter()
+        await asyncio.wait_for(app_main.drop_websocket(tx, "gated", "sender"), 60)
+        got = []
+        while len(got) < CHUNKS:
+            kind, payload = await asyncio.wait_for(rx.frames.get(), 5)
+            if kind == "bytes":
+                got.append(payload)
+        elapsed = time.perf_counter() - t0
+        outbox = receiver.deliveries[("gated", "receiver")][2].stats()
+        credits = credit_signals(tx)
+        print(f"gated sender: {len(got)}/{CHUNKS} chunks in order={got == chunks} in {elapsed:.2f}s, "
+              f"receiver peak {outbox['peak_queue_bytes'] / 1024 / 1024:.1f} MB queued, "
+              f"overflows={outbox['overflows']}, closed with {rx.close_code}, relay-credit {credits}")
+        ok = got == chunks and rx.close_code is None and outbox["overflows"] == 0
+        ok &= True in credits
+        ok &= outbox["peak_queue_bytes"] <= int(os.environ["RELAY_QUEUE_HARD_MB"]) * 1024 * 1024
+    except asyncio.TimeoutError:
+        print("gated sender: transfer did not complete")
+        ok = False
+    finally:
+        await stop_workers(workers)
+    return ok
+
+
+async def main():
+    hub = LoopbackHub(port=0)
+    await hub.start()
+    try:
+        ok = await flood(hub)
+        ok &= await gated_sender(hub)
+    finally:
+        await hub.stop()
+    print("PASS" if ok else "FAIL")
+    return ok
+
+
+if __name__ == "__main__":
+    sys.exit(0 if asyncio.run(main()) else 1)
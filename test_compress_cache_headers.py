@@ -0,0 +1,118 @@
+import os
+import sys
+import json
+import time
+import shutil
+import socket
+import tempfile
+import subprocess
+import fitz
+import numpy as np
+import requests
+
+# Compression report headers on result-cache hits: posts the same PDF twice per mode
+# (deadline_ms, strategy=auto, variants) to a fresh worker with an empty cache. The
+# second answer comes from the cache and must carry the same X-Compression-Coverage /
+# X-Compression-Images / X-Deadline-Hit or X-Compression-Report headers as the first;
+# sync hits are served from a workspace copy, so releasing the workspace leaves the
+# cache entry in place; the job API must report the same on a hit, and still serve the
+# result after the cache entry it came from has been evicted.
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "backend"))
+PORT = 8104
+BASE = f"http://127.0.0.1:{PORT}"
+HEADERS = ("X-Compression-Coverage", "X-Compression-Images", "X-Deadline-Hit", "X-Compression-Report")
+MODES = [
+    ("deadline", {"quality": "60", "deadline_ms": "60000"}),
+    ("auto", {"quality": "60", "strategy": "auto"}),
+    ("variants", {"variants": "low,high"}),
+]
+
+
+def wait_for_port(port, timeout=60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"worker on {port} did not start")
+
+
+def build(path):
+    rng = np.random.default_rng(20)
+    doc = fitz.open()
+    for i in range(2):
+        page = doc.new_page(width=612, height=792)
+        page.insert_text((72, 60), f"Page {i + 1}", fontsize=14)
+        pixels = np.clip(np.linspace(40, 210, 1200)[None, :, None] + rng.normal(0, 15, (900, 1200, 3)), 0, 255).astype(np.uint8)
+        page.insert_image(fitz.Rect(72, 90, 540, 440), stream=fitz.Pixmap(fitz.csRGB, 1200, 900, pixels.tobytes(), False).tobytes("jpeg", jpg_quality=92))
+    doc.save(path)
+    doc.close()
+
+
+def post(path, form, device):
+    # One device per request: the free daily limit is per IP + device
+    with open(path, "rb") as f:
+        response = requests.post(f"{BASE}/api/compress-pdf", files={"file": ("report.pdf", f, "application/pdf")},
+                                 data=dict(form, deviceId=device), timeout=300)
+    response.raise_for_status()
+    return {h: response.headers.get(h) for h in HEADERS if response.headers.get(h) is not None}
+
+
+def run_job(path, form):
+    with open(path, "rb") as f:
+        job = requests.post(f"{BASE}/api/jobs/compress-pdf", files={"file": ("report.pdf", f, "application/pdf")},
+                            data=dict(form, deviceId="cache-headers"), timeout=60).json()
+    for _ in range(600):
+        info = requests.get(f"{BASE}{job['status_url']}", timeout=10).json()
+        if info["status"] in ("done", "failed"):
+            return job, info
+        time.sleep(0.2)
+    return job, {}
+
+
+if __name__ == "__main__":
+    work_dir = tempfile.mkdtemp(prefix="cache-headers-")
+    src = os.path.join(work_dir, "report.pdf")
+    build(src)
+    env = dict(os.environ, EXECUTOR_BACKEND="thread", RESULT_CACHE_DIR=os.path.join(work_dir, "cache"),
+               USAGE_DB_PATH=os.path.join(work_dir, "usage.db"))
+    worker = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(PORT), "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    ok = True
+    try:
+        wait_for_port(PORT)
+        for name, form in MODES:
+            first, hit = post(src, form, f"{name}-miss"), post(src, form, f"{name}-hit")
+            same = bool(first) and first == hit
+            print(f"{name:8s} miss {json.dumps(first)[:120]}")
+            print(f"{'':8s} hit  {'same headers' if same else json.dumps(hit)[:120]}")
+            ok &= same
+        # Sync hits were served from workspace links: the cache still holds every entry
+        cached = [n for n in os.listdir(env["RESULT_CACHE_DIR"]) if not n.startswith(".")]
+        intact = all(os.path.getsize(os.path.join(env["RESULT_CACHE_DIR"], n)) > 0 for n in cached)
+        print(f"cache after sync hits: {len(cached)} entries, intact={intact}")
+        ok &= len(cached) >= len(MODES) and intact
+        # Job API: a hit on the deadline result still reports full coverage
+        job, info = run_job(src, MODES[0][1])
+        report = info.get("report")
+        print(f"job hit report: {report}")
+        ok &= bool(report) and report.get("coverage") == 1.0 and not report.get("deadline_hit")
+        # Evict every cache entry: the job's result must not depend on them
+        shutil.rmtree(env["RESULT_CACHE_DIR"])
+        result = requests.get(f"{BASE}{job['result_url']}", timeout=30)
+        readable = False
+        if result.status_code == 200:
+            with fitz.open(stream=result.content, filetype="pdf") as doc:
+                readable = doc.page_count == 2
+        print(f"job hit result after cache eviction: HTTP {result.status_code}, readable={readable}")
+        ok &= readable
+    finally:
+        worker.terminate()
+        worker.wait()
+    print("PASS" if ok else "FAIL")
+    sys.exit(0 if ok else 1)
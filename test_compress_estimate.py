@@ -0,0 +1,99 @@
+import os
+import sys
+import time
+import shutil
+import tempfile
+import fitz
+import numpy as np
+from PIL import Image, ImageFilter
+
+# Compression preview vs the real compressor: builds a report-style PDF (full-page and
+# figure-sized photos, a repeated logo, text pages, an outline) and the structure-heavy
+# file from test_structural_slimming.py (thumbnails, unused resources, attachments, fonts:
+# mostly non-image bytes), asks estimate_pdf_compression for every slider tier, then runs
+# run_iterative_pdf_compression at each tier's upper slider and prints predicted vs actual
+# bytes. Checks every tier lands within TOLERANCE of the real output and that 41-50 and
+# 51-60 are separate tiers. Last, a long text-only file (one content stream per line,
+# ~10 MB for 1000 pages) has to be previewed within MAX_TEXT_ESTIMATE_S.
+#   python test_compress_estimate.py [pages] [text_pages]
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+from app.pdf_agent import estimate_pdf_compression, run_iterative_pdf_compression
+import test_structural_slimming
+
+TOLERANCE = 0.35
+MAX_TEXT_ESTIMATE_S = 1.0
+
+
+def photo(rng, w, h):
+    # Smooth colour regions with fine texture: detail at every scale, like a real photo
+    tint = np.array([1.0, 0.75, 0.5], np.float32)[rng.permutation(3)]
+    coarse = Image.fromarray(rng.integers(30, 225, (h // 64 + 2, w // 64 + 2, 3), dtype=np.uint8)).resize((w, h), Image.BICUBIC)
+    texture = Image.fromarray(rng.normal(128, 40, (h, w)).clip(0, 255).astype(np.uint8)).filter(ImageFilter.GaussianBlur(1.2))
+    pixels = np.asarray(coarse, np.float32) * tint + (np.asarray(texture, np.float32)[:, :, None] - 128) * 0.6
+    return fitz.Pixmap(fitz.csRGB, w, h, np.clip(pixels, 0, 255).astype(np.uint8).tobytes(), False).tobytes("jpeg", jpg_quality=92)
+
+
+def build(path, pages):
+    rng = np.random.default_rng(14)
+    doc = fitz.open()
+    logo = photo(rng, 800, 400)
+    toc = []
+    for i in range(pages):
+        page = doc.new_page(width=612, height=792)
+        page.insert_image(fitz.Rect(480, 20, 580, 70), stream=logo)
+        toc.append([1, f"Section {i + 1}", i + 1])
+        if i % 3 == 0:
+            # Full-bleed photo at 300 DPI
+            page.insert_image(page.rect, stream=photo(rng, 2550, 3300))
+        elif i % 3 == 1:
+            # Two figures of a 2400 px photo drawn 3 inches wide
+            page.insert_image(fitz.Rect(72, 100, 288, 262), stream=photo(rng, 2400, 1800))
+            page.insert_image(fitz.Rect(324, 100, 540, 262), stream=photo(rng, 2400, 1800))
+            page.insert_text((72, 300), "Figure captions and body text " * 4, fontsize=9)
+        else:
+            for line in range(40):
+                page.insert_text((72, 100 + line * 16), f"Paragraph {line}: " + "lorem ipsum dolor " * 5, fontsize=9)
+    doc.set_toc(toc)
+    doc.save(path, deflate=True)
+    doc.close()
+
+
+if __name__ == "__main__":
+    pages = int(sys.argv[1]) if len(sys.argv) > 1 else 9
+    text_pages = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    work_dir = tempfile.mkdtemp(prefix="estimate-bench-")
+    try:
+        ok = True
+        for name, make in (("report", build), ("structure", test_structural_slimming.build)):
+            src = os.path.join(work_dir, f"{name}.pdf")
+            make(src, pages)
+            estimate = estimate_pdf_compression(src)
+            print(f"{name}: {pages} pages, {estimate['input_bytes'] / 1024:.0f} KB, "
+                  f"{estimate['unique_images']} unique images, {estimate['sampled_images']} sampled "
+                  f"in {estimate['estimate_ms']:.0f} ms")
+            ok &= [tier["slider"] for tier in estimate["tiers"]][2:4] == [[41, 50], [51, 60]]
+            for tier in estimate["tiers"]:
+                low, high = tier["slider"]
+                path = os.path.join(work_dir, f"{name}-q{high}.pdf")
+                shutil.copyfile(src, path)
+                t0 = time.perf_counter()
+                actual = os.path.getsize(run_iterative_pdf_compression(path, high, workers=1))
+                seconds = time.perf_counter() - t0
+                error = tier["predicted_bytes"] / actual - 1
+                print(f"   slider {low:3d}-{high:3d}: predicted {tier['predicted_bytes'] / 1024:7.0f} KB "
+                      f"{tier['predicted_seconds']:5.2f}s | actual {actual / 1024:7.0f} KB {seconds:5.2f}s | error {error:+.0%}")
+                ok &= abs(error) <= TOLERANCE
+
+        src = os.path.join(work_dir, "text.pdf")
+        test_structural_slimming.build_text(src, text_pages)
+        t0 = time.perf_counter()
+        estimate = estimate_pdf_compression(src)
+        seconds = time.perf_counter() - t0
+        print(f"text: {text_pages} pages, {estimate['input_bytes'] / 1024:.0f} KB, estimated in {seconds:.2f}s "
+              f"(limit {MAX_TEXT_ESTIMATE_S:.1f}s)")
+        ok &= seconds < MAX_TEXT_ESTIMATE_S
+        print("PASS" if ok else "FAIL")
+        sys.exit(0 if ok else 1)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
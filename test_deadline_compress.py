@@ -0,0 +1,91 @@
+import os
+import sys
+import time
+import shutil
+import tempfile
+import fitz
+import numpy as np
+
+# Deadline-bounded compression: the scanned book from test_parallel_compress.py,
+# compressed once without a deadline and then under shrinking deadlines. Each bounded
+# run must finish near its deadline, return a readable PDF with every page, and say
+# how much of the image data it got to. Coverage is by stored image bytes, so with the
+# biggest savings handled first it grows faster than the image count. A near-zero
+# deadline checks that slimming, dedup and the placement scan stop at it too. Every
+# bounded result must be no larger than its input, including a book of line drawings
+# whose page content slimming rewrites before the deadline cuts the run short.
+#   python test_deadline_compress.py [pages] [quality]
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+from app.pdf_agent import run_iterative_pdf_compression, compress_pdf_within_deadline
+from test_parallel_compress import build_scanned_pdf
+
+# One image encode may still be in flight at the deadline
+OVERSHOOT_S = 1.5
+DRAWING_PAGES = 120
+
+
+def build_drawings(path, pages):
+    rng = np.random.default_rng(5)
+    doc = fitz.open()
+    for i in range(pages):
+        page = doc.new_page(width=612, height=792)
+        shape = page.new_shape()
+        for _ in range(400):
+            x, y = rng.uniform(40, 560), rng.uniform(60, 740)
+            shape.draw_line((x, y), (x + rng.uniform(-30, 30), y + rng.uniform(-30, 30)))
+        shape.finish(color=(0.2, 0.3, 0.6), width=0.6)
+        shape.commit()
+        page.insert_text((72, 40), f"Sheet {i + 1}", fontsize=14)
+    doc.save(path, deflate=True)
+    doc.close()
+
+
+def timed(fn, src, work_dir, name, *args):
+    path = os.path.join(work_dir, name)
+    shutil.copyfile(src, path)
+    t0 = time.perf_counter()
+    out = fn(path, *args)
+    return out, time.perf_counter() - t0
+
+
+if __name__ == "__main__":
+    pages = int(sys.argv[1]) if len(sys.argv) > 1 else 24
+    quality = int(sys.argv[2]) if len(sys.argv) > 2 else 40
+    work_dir = tempfile.mkdtemp(prefix="deadline-bench-")
+    try:
+        src = os.path.join(work_dir, "book.pdf")
+        build_scanned_pdf(src, pages)
+        print(f"Input: {pages} pages, {os.path.getsize(src) / 1024 / 1024:.1f} MB")
+        out, full_t = timed(run_iterative_pdf_compression, src, work_dir, "full.pdf", quality)
+        print(f"No deadline: {os.path.getsize(out) / 1024:8.0f} KB in {full_t:.2f}s")
+        ok = True
+        for fraction in (0.75, 0.5, 0.25):
+            deadline_ms = int(full_t * fraction * 1000)
+            (out, report), t = timed(compress_pdf_within_deadline, src, work_dir, f"d{deadline_ms}.pdf", quality, deadline_ms)
+            with fitz.open(out) as doc:
+                readable = doc.page_count == pages
+            print(f"deadline {deadline_ms:6d} ms: {os.path.getsize(out) / 1024:8.0f} KB in {t:.2f}s | "
+                  f"images {report['images_optimized']}/{report['images_total']} | "
+                  f"coverage {report['coverage']:.0%} | {report['save_profile']} save")
+            ok &= readable and t <= deadline_ms / 1000 + OVERSHOOT_S
+            ok &= os.path.getsize(out) <= os.path.getsize(src)
+        (out, report), t = timed(compress_pdf_within_deadline, src, work_dir, "d1.pdf", quality, 1)
+        with fitz.open(out) as doc:
+            readable = doc.page_count == pages
+        print(f"deadline      1 ms: {os.path.getsize(out) / 1024:8.0f} KB in {t:.2f}s | "
+              f"images {report['images_optimized']}/{report['images_total']} | structure {len(report['structure'])} categories")
+        ok &= readable and report["deadline_hit"] and t <= OVERSHOOT_S
+        ok &= os.path.getsize(out) <= os.path.getsize(src)
+
+        vector = os.path.join(work_dir, "drawings.pdf")
+        build_drawings(vector, DRAWING_PAGES)
+        for deadline_ms in (1, 20, 50):
+            (out, report), t = timed(compress_pdf_within_deadline, vector, work_dir, f"v{deadline_ms}.pdf", quality, deadline_ms)
+            print(f"vector {deadline_ms:4d} ms: {os.path.getsize(vector) / 1024:6.0f} KB -> {os.path.getsize(out) / 1024:6.0f} KB | "
+                  f"deadline hit={report['deadline_hit']} | original kept={report.get('kept_original', False)}")
+            ok &= os.path.getsize(out) <= os.path.getsize(vector)
+        print("PASS" if ok else "FAIL")
+        sys.exit(0 if ok else 1)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
@@ -0,0 +1,79 @@
+import os
+import sys
+import time
+import shutil
+import tempfile
+import fitz
+import numpy as np
+
+# Effective-DPI downsampling: an A3 page with a full-bleed photo and a letter page with a
+# 2000 px logo drawn one inch wide (twice, once rotated). After compressing at quality 70
+# (150 DPI) each image should hold ~150 DPI at its largest placement: the spread keeps
+# ~1754 px (11.69 in) instead of being crushed to letter width, the logo ~150 px instead
+# of 2000. Images are matched by page, since garbage collection renumbers XREFs.
+#   python test_effective_dpi.py
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+from app.pdf_agent import run_iterative_pdf_compression, image_placements, _compression_tier
+
+A3 = fitz.paper_rect("a3")
+
+
+def noisy_jpeg(w, h, seed):
+    rng = np.random.default_rng(seed)
+    base = np.linspace(60, 220, w, dtype=np.float32)[None, :, None]
+    pixels = np.clip(base + rng.normal(0, 20, (h, w, 3)), 0, 255).astype(np.uint8)
+    return fitz.Pixmap(fitz.csRGB, w, h, pixels.tobytes(), False).tobytes("jpeg", jpg_quality=92)
+
+
+def build(path):
+    doc = fitz.open()
+    spread = doc.new_page(width=A3.width, height=A3.height)
+    spread.insert_image(spread.rect, stream=noisy_jpeg(3508, 4961, 1))  # A3 at 300 DPI
+    page = doc.new_page(width=612, height=792)
+    logo = noisy_jpeg(2000, 2000, 2)
+    page.insert_image(fitz.Rect(72, 72, 144, 144), stream=logo)
+    page.insert_image(fitz.Rect(200, 72, 272, 144), stream=logo, rotate=90)
+    doc.save(path)
+    doc.close()
+
+
+# Expected width in pixels per page at 150 DPI: A3 spread, 1 inch logo
+EXPECTED_WIDTH = [round(A3.width / 72 * 150), 150]
+
+
+def drawn_dpi(path):
+    # Per page: (width in px, DPI at the largest placement) of the page's image
+    doc = fitz.open(path)
+    placements = image_placements(doc)
+    rows = []
+    for page in doc:
+        xref = page.get_images()[0][0]
+        rows.append((int(doc.xref_get_key(xref, "Width")[1]), 1 / placements[xref]))
+    doc.close()
+    return rows
+
+
+if __name__ == "__main__":
+    work_dir = tempfile.mkdtemp(prefix="dpi-bench-")
+    try:
+        src = os.path.join(work_dir, "mixed.pdf")
+        build(src)
+        quality = 70
+        dpi = _compression_tier(quality)[0]
+        before = drawn_dpi(src)
+        path = os.path.join(work_dir, "work.pdf")
+        shutil.copyfile(src, path)
+        t0 = time.perf_counter()
+        out = run_iterative_pdf_compression(path, quality)
+        elapsed = time.perf_counter() - t0
+        after = drawn_dpi(out)
+        print(f"Input {os.path.getsize(src) / 1024:.0f} KB -> {os.path.getsize(out) / 1024:.0f} KB in {elapsed:.2f}s (target {dpi} DPI)")
+        ok = True
+        for page, ((w0, dpi0), (w1, dpi1), expected) in enumerate(zip(before, after, EXPECTED_WIDTH)):
+            print(f"  page {page + 1}: {w0} px at {dpi0:.0f} DPI -> {w1} px at {dpi1:.0f} DPI (expected ~{expected} px)")
+            ok &= abs(dpi1 - min(dpi0, dpi)) <= 2 and abs(w1 - expected) <= 2
+        print("PASS" if ok else "FAIL")
+        sys.exit(0 if ok else 1)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
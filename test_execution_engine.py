@@ -0,0 +1,84 @@
+import os
+import sys
+import time
+import asyncio
+
+# Execution engine with the process backend: two concurrent pdf agents must run in two
+# different worker processes (not the caller) at the same time, a busy ocr pool must not
+# hold up the pdf pool, progress from a worker reaches the parent's handlers, stage spans
+# recorded in a worker land in the caller's trace, and in-flight counters return to zero.
+# Sleeps stand in for agents so the checks hold on a single core.
+#   python test_execution_engine.py
+
+os.environ.setdefault("EXECUTOR_BACKEND", "process")
+os.environ["EXECUTOR_POOL_PDF"] = "2"
+os.environ["EXECUTOR_POOL_OCR"] = "1"
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+from app.executor import CPU_COUNT, ExecutionEngine, ProgressReporter, cpu_share
+from app.tracing import span, start_trace, end_trace
+
+AGENT_S = 0.5
+
+
+def fake_agent(seconds, job_id=None):
+    if job_id:
+        ProgressReporter(job_id)(3, 10)
+    with span("fake.stage"):
+        time.sleep(seconds)
+    return os.getpid(), cpu_share()
+
+
+async def main(engine):
+    ok = True
+    engine.start(["pdf", "ocr"])
+
+    # Two pdf agents at once: two workers, overlapping
+    t0 = time.perf_counter()
+    results = await asyncio.gather(*(engine.run("pdf", fake_agent, AGENT_S) for _ in range(2)))
+    elapsed = time.perf_counter() - t0
+    pids = {pid for pid, _ in results}
+    shares = {share for _, share in results}
+    print(f"pdf x2: {elapsed:.2f}s, pids {sorted(pids)} (parent {os.getpid()}), cpu_share {shares}")
+    ok &= len(pids) == 2 and os.getpid() not in pids and elapsed < 2 * AGENT_S
+    ok &= shares == {max(1, CPU_COUNT // 2)}
+
+    # A long ocr run does not delay pdf work
+    ocr = asyncio.ensure_future(engine.run("ocr", fake_agent, 4 * AGENT_S))
+    await asyncio.sleep(0.1)
+    t0 = time.perf_counter()
+    await engine.run("pdf", fake_agent, 0.05)
+    pdf_s = time.perf_counter() - t0
+    print(f"pdf while ocr busy: {pdf_s:.2f}s, ocr in flight {engine.stats()['ocr']['in_flight']}")
+    ok &= pdf_s < AGENT_S and engine.stats()["ocr"]["in_flight"] == 1
+    await ocr
+
+    # Progress and stage spans come back from the worker
+    seen = []
+    engine.add_progress_handler(lambda job_id, done, total: seen.append((job_id, done, total)))
+    trace, token = start_trace()
+    try:
+        await engine.run("pdf", fake_agent, 0.05, job_id="job-1")
+    finally:
+        end_trace(token)
+    for _ in range(50):
+        if seen:
+            break
+        await asyncio.sleep(0.02)
+    print(f"progress {seen}, stages {trace.to_list()}")
+    ok &= seen == [("job-1", 3, 10)] and trace.stages.get("fake.stage", [0, 0])[1] == 1
+
+    stats = engine.stats()
+    print(f"stats {stats}")
+    ok &= all(s["backend"] == "process" and s["in_flight"] == 0 for s in stats.values())
+    ok &= stats["pdf"]["size"] == 2 and stats["ocr"]["size"] == 1
+    return ok
+
+
+if __name__ == "__main__":
+    engine = ExecutionEngine()
+    try:
+        ok = asyncio.run(main(engine))
+    finally:
+        engine.shutdown()
+    print("PASS" if ok else "FAIL")
+    sys.exit(0 if ok else 1)
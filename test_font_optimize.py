@@ -0,0 +1,81 @@
+import os
+import sys
+import shutil
+import tempfile
+import fitz
+
+# Font optimisation on a "merged" PDF: four one-page documents each embed the whole of
+# MuPDF's built-in Droid Sans Fallback (3.5 MB) for a few lines of text and are joined
+# with insert_pdf, so the file carries four identical font programs. After
+# optimize_fonts and a garbage-collecting save the file must hold a single font
+# program, be a small fraction of the size, extract the same text and render every page
+# pixel for pixel as before. PDF_FONT_SUBSET=0 must merge without subsetting.
+#   python test_font_optimize.py [parts]
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+import app.pdf_agent as pdf_agent
+from app.pdf_agent import optimize_fonts, _font_programs
+
+TEXT = "Invoice {n}: 3 items, total 1,234.56 EUR. 发票已付款。"
+
+
+def build(path, parts):
+    font = fitz.Font("cjk").buffer
+    merged = fitz.open()
+    for n in range(parts):
+        part = fitz.open()
+        page = part.new_page(width=612, height=792)
+        page.insert_font(fontname="droid", fontbuffer=font)
+        for line in range(3):
+            page.insert_text((72, 72 + line * 24), TEXT.format(n=n * 3 + line + 1), fontname="droid", fontsize=12)
+        merged.insert_pdf(part)
+        part.close()
+    merged.save(path)
+    merged.close()
+
+
+def snapshot(doc):
+    return [page.get_text() for page in doc], [page.get_pixmap(dpi=96).samples for page in doc]
+
+
+def optimize(src, out):
+    doc = fitz.open(src)
+    rows = optimize_fonts(doc)
+    doc.save(out, garbage=3, deflate=True)
+    doc.close()
+    with fitz.open(out) as doc:
+        return rows, len(_font_programs(doc)), snapshot(doc)
+
+
+if __name__ == "__main__":
+    parts = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+    work_dir = tempfile.mkdtemp(prefix="font-optimize-")
+    try:
+        src = os.path.join(work_dir, "merged.pdf")
+        build(src, parts)
+        with fitz.open(src) as doc:
+            programs = len(_font_programs(doc))
+            text, pixels = snapshot(doc)
+
+        out = os.path.join(work_dir, "subset.pdf")
+        rows, after, (out_text, out_pixels) = optimize(src, out)
+        same_pixels = sum(a == b for a, b in zip(pixels, out_pixels))
+        print(f"subset: {programs} font programs -> {after}, {os.path.getsize(src) / 1024:.0f} KB -> "
+              f"{os.path.getsize(out) / 1024:.0f} KB, text identical={out_text == text}, "
+              f"{same_pixels}/{parts} pages render identically")
+        ok = programs == parts and after == 1 and rows and rows[0]["copies"] == parts
+        ok &= os.path.getsize(out) * 10 < os.path.getsize(src)
+        ok &= out_text == text and same_pixels == parts
+
+        pdf_agent.FONT_SUBSET = False
+        out = os.path.join(work_dir, "merged-only.pdf")
+        rows, after, (out_text, out_pixels) = optimize(src, out)
+        same_pixels = sum(a == b for a, b in zip(pixels, out_pixels))
+        print(f"merge only: {programs} font programs -> {after}, {os.path.getsize(out) / 1024:.0f} KB, "
+              f"text identical={out_text == text}, {same_pixels}/{parts} pages render identically")
+        ok &= after == 1 and os.path.getsize(out) * parts < os.path.getsize(src) * 1.1
+        ok &= out_text == text and same_pixels == parts
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    print("PASS" if ok else "FAIL")
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,80 @@
+import os
+import sys
+import shutil
+import tempfile
+import fitz
+import numpy as np
+
+# Image dedup on a "merged" PDF: ten one-page documents, each embedding the same logo
+# (JPEG), the same watermark (RGB with an alpha soft mask) and one photo of its own, are
+# joined with insert_pdf so every copy lands under its own XREF. After dedup_images and
+# a garbage-collecting save the file must hold one logo, one watermark and one soft mask
+# plus the ten photos, be smaller, and render every page pixel for pixel as before.
+#   python test_image_dedup.py [pages]
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+from app.pdf_agent import dedup_images, live_images
+
+
+def logo(rng):
+    pixels = rng.integers(0, 255, (300, 400, 3), dtype=np.uint8)
+    return fitz.Pixmap(fitz.csRGB, 400, 300, pixels.tobytes(), False).tobytes("jpeg", jpg_quality=90)
+
+
+def watermark(rng):
+    pixels = rng.integers(0, 255, (200, 200, 4), dtype=np.uint8)
+    return fitz.Pixmap(fitz.csRGB, 200, 200, pixels.tobytes(), True).tobytes("png")
+
+
+def build(path, pages):
+    rng = np.random.default_rng(13)
+    shared = logo(rng), watermark(rng)
+    merged = fitz.open()
+    for i in range(pages):
+        part = fitz.open()
+        page = part.new_page(width=612, height=792)
+        page.insert_text((72, 60), f"Chapter {i + 1}", fontsize=14)
+        page.insert_image(fitz.Rect(72, 80, 272, 230), stream=shared[0])
+        page.insert_image(fitz.Rect(300, 80, 500, 280), stream=shared[1])
+        page.insert_image(fitz.Rect(72, 320, 540, 700), stream=logo(rng))
+        merged.insert_pdf(part)
+        part.close()
+    merged.save(path)
+    merged.close()
+
+
+def render(doc):
+    return [page.get_pixmap(dpi=72).samples for page in doc]
+
+
+def image_count(doc):
+    return sum(1 for x in range(1, doc.xref_length()) if doc.xref_is_image(x))
+
+
+if __name__ == "__main__":
+    pages = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    work_dir = tempfile.mkdtemp(prefix="image-dedup-")
+    try:
+        src, out = os.path.join(work_dir, "merged.pdf"), os.path.join(work_dir, "dedup.pdf")
+        build(src, pages)
+        doc = fitz.open(src)
+        before = render(doc)
+        images = live_images(doc)
+        remaining = dedup_images(doc, images)
+        doc.save(out, garbage=3, deflate=True)
+        doc.close()
+        with fitz.open(out) as doc:
+            after = render(doc)
+            stored = image_count(doc)
+        # logo + watermark + its soft mask, once each, plus one photo per page
+        expected = 3 + pages
+        identical = sum(a == b for a, b in zip(before, after))
+        print(f"{len(images)} image XREFs -> {len(remaining)} after dedup, {stored} in the saved file (expected {expected})")
+        print(f"{os.path.getsize(src) / 1024:.0f} KB -> {os.path.getsize(out) / 1024:.0f} KB, "
+              f"{identical}/{pages} pages render identically")
+        ok = len(images) == 4 * pages and len(remaining) == expected and stored == expected
+        ok &= identical == pages and os.path.getsize(out) < os.path.getsize(src)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    print("PASS" if ok else "FAIL")
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,67 @@
+import os
+import io
+import sys
+import shutil
+import tempfile
+import fitz
+import numpy as np
+from PIL import Image
+
+# Already-efficient JPEGs: _jpeg_quality must read back the quality Pillow encoded at
+# from the quantisation tables alone; then a three-page document is compressed at the
+# medium slider (120 DPI, JPEG 50). A colour photo saved at q30 and drawn at the tier's
+# resolution must come out byte-identical (not decoded and re-encoded); the same photo
+# at q95, and a q30 one drawn at five times the tier's resolution, must be re-encoded.
+#   python test_jpeg_passthrough.py [slider]
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+from app.pdf_agent import run_iterative_pdf_compression, _jpeg_quality
+
+DRAWN = fitz.Rect(72, 72, 72 + 288, 72 + 216)  # 4 x 3 inches: 480 x 360 px at 120 DPI
+
+
+def photo(w, h, quality):
+    rng = np.random.default_rng(18)
+    x = np.linspace(0, 1, w, dtype=np.float32)[None, :]
+    y = np.linspace(0, 1, h, dtype=np.float32)[:, None]
+    rgb = np.stack([200 * x + 30 * y, 180 * (1 - x) + 40 * y, 120 + 100 * y * x], axis=-1)
+    pixels = np.clip(rgb + rng.normal(0, 10, (h, w, 3)), 0, 255).astype(np.uint8)
+    buf = io.BytesIO()
+    Image.fromarray(pixels).save(buf, "JPEG", quality=quality)
+    return buf.getvalue()
+
+
+def page_images(path):
+    with fitz.open(path) as doc:
+        return [doc.xref_stream_raw(page.get_images()[0][0]) for page in doc]
+
+
+if __name__ == "__main__":
+    slider = int(sys.argv[1]) if len(sys.argv) > 1 else 60
+    ok = True
+    for quality in (20, 30, 50, 75, 95):
+        with Image.open(io.BytesIO(photo(64, 64, quality))) as jpeg:
+            estimated = _jpeg_quality(jpeg.quantization)
+        print(f"q{quality}: estimated q{estimated}")
+        ok &= abs(estimated - quality) <= 1
+
+    work_dir = tempfile.mkdtemp(prefix="jpeg-passthrough-")
+    try:
+        cases = [("q30 at tier size", photo(480, 360, 30), True),
+                 ("q95 at tier size", photo(480, 360, 95), False),
+                 ("q30 at 5x tier size", photo(2400, 1800, 30), False)]
+        src = os.path.join(work_dir, "photos.pdf")
+        doc = fitz.open()
+        for _, stream, _ in cases:
+            doc.new_page(width=612, height=792).insert_image(DRAWN, stream=stream)
+        doc.save(src)
+        doc.close()
+        before = page_images(src)
+        after = page_images(run_iterative_pdf_compression(src, slider, workers=1))
+        for (name, _, kept), old, new in zip(cases, before, after):
+            print(f"{name:22s} {len(old) / 1024:7.1f} KB -> {len(new) / 1024:7.1f} KB identical={old == new}")
+            ok &= (old == new) == kept
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    print("PASS" if ok else "FAIL")
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,149 @@
+import io
+import os
+import re
+import sys
+import time
+import shutil
+import tempfile
+import threading
+import urllib.request
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+import fitz
+import numpy as np
+
+# Time to first page over a throttled link, compressor output with and without
+# linearization. A local HTTP server streams each file at RATE_KBPS after LATENCY_MS;
+# the client reads it front to back like a browser viewer on a plain download.
+# A linearized file is drawable once the first-page section (/E in its linearization
+# dictionary) has arrived; the check renders page 1 from exactly that prefix and
+# compares it with the full render. A regular file keeps its xref at the end, so page 1
+# needs the whole download. Range-request viewers that fetch the tail first are not
+# modelled. Both outputs, and those of a long text-only file (where linearizing would add
+# a third), must stay within the linearization growth bound of the regular file.
+#   python test_linearized_ttfp.py [pages] [rate_kbps] [text_pages]
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+from app import pdf_agent
+from app.pdf_agent import run_iterative_pdf_compression
+from test_structural_slimming import build_text
+
+LATENCY_MS = 150
+CHUNK = 16 * 1024
+_LINEARIZED = re.compile(rb"/Linearized\s+1.*?/E\s+(\d+)", re.S)
+
+
+def build(path, pages):
+    rng = np.random.default_rng(5)
+    doc = fitz.open()
+    for i in range(pages):
+        page = doc.new_page(width=612, height=792)
+        page.insert_text((72, 72), f"Catalogue page {i + 1}", fontsize=20)
+        page.insert_textbox(fitz.Rect(72, 100, 540, 300), "Spare parts and prices. " * 40, fontsize=10)
+        h, w = 900, 1200
+        base = np.linspace(40, 220, w, dtype=np.float32)[None, :, None]
+        pixels = np.clip(base + rng.normal(0, 25, (h, w, 3)), 0, 255).astype(np.uint8)
+        photo = fitz.Pixmap(fitz.csRGB, w, h, pixels.tobytes(), False).tobytes("jpeg", jpg_quality=90)
+        page.insert_image(fitz.Rect(72, 320, 540, 671), stream=photo)
+    doc.save(path)
+    doc.close()
+
+
+def serve(directory, rate_kbps):
+    class Throttled(SimpleHTTPRequestHandler):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, directory=directory, **kwargs)
+
+        def log_message(self, *args):
+            pass
+
+        def copyfile(self, source, outputfile):
+            time.sleep(LATENCY_MS / 1000)
+            while True:
+                chunk = source.read(CHUNK)
+                if not chunk:
+                    break
+                outputfile.write(chunk)
+                time.sleep(len(chunk) / (rate_kbps * 1024))
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Throttled)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def time_to_first_page(url):
+    # Seconds until page 1 is drawable, seconds for the whole file, page-1 offset
+    t0 = time.perf_counter()
+    received, first_page_at, needed = bytearray(), None, None
+    with urllib.request.urlopen(url) as response:
+        while True:
+            chunk = response.read(CHUNK)
+            if not chunk:
+                break
+            received += chunk
+            if needed is None and len(received) >= 1024:
+                match = _LINEARIZED.search(bytes(received[:1024]))
+                needed = int(match.group(1)) if match else -1
+            if first_page_at is None and needed and 0 < needed <= len(received):
+                first_page_at = time.perf_counter() - t0
+    total = time.perf_counter() - t0
+    return first_page_at or total, total, needed if needed and needed > 0 else len(received), bytes(received)
+
+
+def within_growth_bound(regular, linearized):
+    plain, linear = os.path.getsize(regular), os.path.getsize(linearized)
+    return linear <= plain + max(pdf_agent.LINEARIZE_MAX_GROWTH_BYTES, int(plain * pdf_agent.LINEARIZE_MAX_GROWTH))
+
+
+def compress_both(src, work_dir, prefix, quality):
+    outputs = {}
+    for linearize in (False, True):
+        pdf_agent.LINEARIZE = linearize
+        name = f"{prefix}linearized.pdf" if linearize else f"{prefix}regular.pdf"
+        path = os.path.join(work_dir, name)
+        shutil.copyfile(src, path)
+        t0 = time.perf_counter()
+        outputs[name] = run_iterative_pdf_compression(path, quality)
+        print(f"{name:20s} compressed in {time.perf_counter() - t0:.2f}s, {os.path.getsize(outputs[name]) / 1024:.0f} KB")
+    return outputs
+
+
+def first_page(data):
+    with fitz.open(stream=io.BytesIO(data), filetype="pdf") as doc:
+        return doc[0].get_pixmap(dpi=40).samples
+
+
+if __name__ == "__main__":
+    pages = int(sys.argv[1]) if len(sys.argv) > 1 else 30
+    rate_kbps = int(sys.argv[2]) if len(sys.argv) > 2 else 256
+    text_pages = int(sys.argv[3]) if len(sys.argv) > 3 else 1000
+    # Page 1 from a truncated file goes through MuPDF's repair, which is chatty
+    fitz.TOOLS.mupdf_display_errors(False)
+    work_dir = tempfile.mkdtemp(prefix="ttfp-bench-")
+    server = serve(work_dir, rate_kbps)
+    try:
+        src = os.path.join(work_dir, "catalogue.pdf")
+        build(src, pages)
+        outputs = compress_both(src, work_dir, "", 80)
+        text = os.path.join(work_dir, "text.pdf")
+        build_text(text, text_pages)
+        text_outputs = compress_both(text, work_dir, "text-", 50)
+        ok = within_growth_bound(*outputs.values()) and within_growth_bound(*text_outputs.values())
+        print(f"Linearized outputs within the growth bound of the regular ones: {ok}")
+
+        print(f"Throttled link: {rate_kbps} KB/s, {LATENCY_MS} ms latency")
+        results = {}
+        for name, path in outputs.items():
+            url = f"http://127.0.0.1:{server.server_address[1]}/{os.path.basename(path)}"
+            ttfp, total, needed, data = time_to_first_page(url)
+            results[name] = ttfp
+            complete = first_page(data[:needed]) == first_page(data)
+            print(f"{name:15s} first page after {needed / 1024:7.0f} KB: {ttfp:5.2f}s | full file {total:5.2f}s | "
+                  f"page 1 complete in prefix={complete}")
+            ok &= complete
+        print(f"Time to first page: {results['regular.pdf'] / results['linearized.pdf']:.1f}x faster linearized")
+        ok &= results["linearized.pdf"] < results["regular.pdf"]
+        print("PASS" if ok else "FAIL")
+        sys.exit(0 if ok else 1)
+    finally:
+        server.shutdown()
+        shutil.rmtree(work_dir, ignore_errors=True)
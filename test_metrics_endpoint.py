@@ -0,0 +1,85 @@
+import os
+import re
+import sys
+import shutil
+import tempfile
+import subprocess
+import requests
+from test_compress_cache_headers import wait_for_port
+
+# /metrics on a fresh worker: after a known mix of requests (five health checks, two
+# diagnostics lookups for different rooms, one unmatched path) the request counters
+# must match exactly, labelled by route template rather than concrete path, and every
+# latency histogram must be cumulative with +Inf equal to _count. Also checks the
+# exposition parses line by line and the scrape-time gauges are present.
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "backend"))
+PORT = 8108
+BASE = f"http://127.0.0.1:{PORT}"
+# Label values may hold braces (route templates), so match quoted strings whole
+SAMPLE = re.compile(r'^([a-zA-Z_:][a-zA-Z0-9_:]*)(\{(?:[^"}]|"(?:[^"\\]|\\.)*")*\})? (-?[0-9.e+-]+|\+Inf|NaN)$')
+GAUGES = ("pdfninja_pool_workers", "pdfninja_workspace_bytes", "pdfninja_result_cache_entries", "pdfninja_ws_rooms")
+
+
+def parse(text):
+    samples, bad = {}, []
+    for line in text.splitlines():
+        if not line or line.startswith("# HELP ") or line.startswith("# TYPE "):
+            continue
+        match = SAMPLE.match(line)
+        if match is None:
+            bad.append(line)
+            continue
+        samples[match.group(1) + (match.group(2) or "")] = float(match.group(3))
+    return samples, bad
+
+
+def histograms_ok(samples, name):
+    series = {}
+    for key, value in samples.items():
+        if key.startswith(name + "_bucket{"):
+            labels = re.sub(r',?le="[^"]*"', "", key[len(name + "_bucket"):])
+            series.setdefault(labels, []).append(value)
+    ok = bool(series)
+    for labels, buckets in series.items():
+        ok &= buckets == sorted(buckets) and buckets[-1] == samples.get(f"{name}_count{labels}")
+    return ok, len(series)
+
+
+if __name__ == "__main__":
+    work_dir = tempfile.mkdtemp(prefix="metrics-")
+    env = dict(os.environ, EXECUTOR_BACKEND="thread", RESULT_CACHE_DIR=os.path.join(work_dir, "cache"),
+               USAGE_DB_PATH=os.path.join(work_dir, "usage.db"), WORKSPACE_ROOT=os.path.join(work_dir, "work"))
+    worker = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(PORT), "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    ok = True
+    try:
+        wait_for_port(PORT)
+        for _ in range(5):
+            requests.get(f"{BASE}/api/health", timeout=10)
+        for room in ("room-alpha", "room-beta"):
+            requests.get(f"{BASE}/api/diagnostics/{room}", timeout=10)
+        requests.get(f"{BASE}/no-such-route", timeout=10)
+        text = requests.get(f"{BASE}/metrics", timeout=10).text
+        samples, bad = parse(text)
+
+        health = samples.get('pdfninja_http_requests_total{method="GET",route="/api/health",status="200"}')
+        rooms = samples.get('pdfninja_http_requests_total{method="GET",route="/api/diagnostics/{room_id}",status="200"}')
+        unmatched = samples.get('pdfninja_http_requests_total{method="GET",route="unmatched",status="404"}')
+        latency_ok, series = histograms_ok(samples, "pdfninja_http_request_duration_seconds")
+        health_latency = samples.get('pdfninja_http_request_duration_seconds_count{method="GET",route="/api/health"}')
+        gauges = [name for name in GAUGES if any(key.split("{")[0] == name for key in samples)]
+        print(f"{len(samples)} samples, {len(bad)} unparseable {bad[:3]}")
+        print(f"requests: health {health}, diagnostics {rooms}, unmatched {unmatched}, raw room ids in output "
+              f"{'room-alpha' in text}")
+        print(f"latency: {series} series cumulative={latency_ok}, health count {health_latency}; gauges {gauges}")
+        ok &= not bad and health == 5 and rooms == 2 and unmatched == 1 and "room-alpha" not in text
+        ok &= latency_ok and health_latency == 5 and len(gauges) == len(GAUGES)
+    finally:
+        worker.terminate()
+        worker.wait()
+        shutil.rmtree(work_dir, ignore_errors=True)
+    print("PASS" if ok else "FAIL")
+    sys.exit(0 if ok else 1)
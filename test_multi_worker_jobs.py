@@ -0,0 +1,89 @@
+import os
+import sys
+import time
+import socket
+import shutil
+import tempfile
+import subprocess
+import fitz
+import requests
+from test_compress_cache_headers import build
+
+# Async jobs with WEB_CONCURRENCY > 1: two workers share the job state and workspace
+# directories the way uvicorn workers share a container's /tmp. A compression job is
+# submitted to worker A and every poll and the download go to worker B, whose workspace
+# sweeper runs every second with a 3 s orphan age. Checks B reports the job's progress
+# and result, keeps its hands off A's live job workspace, and still says 404 for a job
+# nobody knows.
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "backend"))
+PORTS = (8106, 8107)
+ORPHAN_AGE_S = 3
+
+
+def wait_for_port(port, timeout=60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"worker on {port} did not start")
+
+
+if __name__ == "__main__":
+    work_dir = tempfile.mkdtemp(prefix="multi-worker-")
+    src = os.path.join(work_dir, "report.pdf")
+    build(src)
+    env = dict(os.environ, EXECUTOR_BACKEND="thread", WEB_CONCURRENCY="2",
+               RESULT_CACHE_DIR=os.path.join(work_dir, "cache"), USAGE_DB_PATH=os.path.join(work_dir, "usage.db"),
+               JOB_STATE_DIR=os.path.join(work_dir, "jobs"), WORKSPACE_ROOT=os.path.join(work_dir, "work"),
+               WORKSPACE_SWEEP_INTERVAL="1", WORKSPACE_ORPHAN_AGE=str(ORPHAN_AGE_S))
+    workers = [
+        subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "warning"],
+            cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        for port in PORTS
+    ]
+    ok = True
+    try:
+        for port in PORTS:
+            wait_for_port(port)
+        a, b = (f"http://127.0.0.1:{port}" for port in PORTS)
+        with open(src, "rb") as f:
+            job = requests.post(f"{a}/api/jobs/compress-pdf", files={"file": ("report.pdf", f, "application/pdf")},
+                                data={"quality": "60", "deviceId": "multi-worker"}, timeout=60).json()
+        statuses = []
+        for _ in range(600):
+            info = requests.get(f"{b}{job['status_url']}", timeout=10).json()
+            statuses.append(info.get("status"))
+            if info.get("status") in ("done", "failed"):
+                break
+            time.sleep(0.2)
+        print(f"job {job['job_id'][:8]} submitted to A, statuses seen on B: {sorted(set(statuses), key=statuses.index)}")
+        ok &= info.get("status") == "done"
+
+        # Outlive the orphan age a few times over while B keeps sweeping
+        time.sleep(ORPHAN_AGE_S * 2)
+        result = requests.get(f"{b}/api/jobs/{job['job_id']}/result", timeout=30)
+        readable = False
+        if result.status_code == 200:
+            with fitz.open(stream=result.content, filetype="pdf") as doc:
+                readable = doc.page_count == 2
+        print(f"result from B after {ORPHAN_AGE_S * 2}s of sweeping: HTTP {result.status_code}, "
+              f"{len(result.content)} bytes, readable={readable}")
+        ok &= readable
+
+        missing = requests.get(f"{b}/api/jobs/{'0' * 32}", timeout=10).status_code
+        traversal = requests.get(f"{b}/api/jobs/..%2Fusage", timeout=10).status_code
+        print(f"unknown job: HTTP {missing}, malformed id: HTTP {traversal}")
+        ok &= missing == 404 and traversal == 404
+    finally:
+        for worker in workers:
+            worker.terminate()
+            worker.wait()
+        shutil.rmtree(work_dir, ignore_errors=True)
+    print("PASS" if ok else "FAIL")
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,127 @@
+import os
+import sys
+import time
+import shutil
+import tempfile
+import fitz
+import numpy as np
+
+# Palette/Flate vs JPEG-only on a technical manual: wiring diagrams and UI screenshots
+# rendered from vector drawings (anti-aliased, so not strictly a few colours) and stored
+# as Flate RGB images, plus one photo per chapter. Prints size, time and the mean pixel
+# error against the original for both modes, and checks that photos stay JPEG while
+# flat images go /Indexed where that is smaller, for a file no bigger with no more error
+# than JPEG (or a visually lossless one at top sliders, where JPEG keeps the originals).
+#   python test_palette_compress.py [chapters] [quality]
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+from app import pdf_agent
+from app.pdf_agent import run_iterative_pdf_compression
+
+VISUALLY_LOSSLESS = 0.5  # mean absolute error per channel, 0-255
+COLOURS = [(0.8, 0.1, 0.1), (0.1, 0.5, 0.2), (0.1, 0.3, 0.8), (0.95, 0.7, 0.1), (0.3, 0.3, 0.3)]
+
+
+def diagram(rng):
+    # A wiring diagram drawn as vectors, then rasterized at 200 DPI like a scanned-in figure
+    src = fitz.open()
+    page = src.new_page(width=540, height=400)
+    for _ in range(12):
+        x, y = rng.uniform(20, 440), rng.uniform(20, 320)
+        page.draw_rect(fitz.Rect(x, y, x + 80, y + 50), color=(0, 0, 0), fill=COLOURS[rng.integers(len(COLOURS))], width=1.2)
+        page.insert_text((x + 8, y + 30), f"K{rng.integers(100)}", fontsize=11)
+    for _ in range(25):
+        page.draw_line((rng.uniform(0, 540), rng.uniform(0, 400)), (rng.uniform(0, 540), rng.uniform(0, 400)),
+                       color=COLOURS[rng.integers(len(COLOURS))], width=1.5)
+    return page.get_pixmap(dpi=200)
+
+
+def screenshot(rng):
+    src = fitz.open()
+    page = src.new_page(width=480, height=300)
+    page.draw_rect(page.rect, fill=(0.94, 0.94, 0.96), width=0)
+    page.draw_rect(fitz.Rect(0, 0, 480, 28), fill=(0.2, 0.4, 0.7), width=0)
+    page.insert_text((10, 19), "Settings - Controller", fontsize=12, color=(1, 1, 1))
+    for i in range(8):
+        page.insert_text((20, 55 + i * 28), f"Parameter {i + 1}: {rng.integers(1000)}", fontsize=10)
+        page.draw_rect(fitz.Rect(300, 42 + i * 28, 440, 60 + i * 28), color=(0.6, 0.6, 0.6), fill=(1, 1, 1), width=0.8)
+    return page.get_pixmap(dpi=150)
+
+
+def photo(rng):
+    h, w = 900, 1200
+    base = np.linspace(30, 220, w, dtype=np.float32)[None, :, None] * np.array([1.0, 0.8, 0.6], np.float32)
+    pixels = np.clip(base + rng.normal(0, 20, (h, w, 3)), 0, 255).astype(np.uint8)
+    return fitz.Pixmap(fitz.csRGB, w, h, pixels.tobytes(), False).tobytes("jpeg", jpg_quality=90)
+
+
+def build(path, chapters):
+    rng = np.random.default_rng(21)
+    doc = fitz.open()
+    kinds = []
+    for _ in range(chapters):
+        for kind in ("diagram", "diagram", "screenshot", "photo"):
+            page = doc.new_page(width=612, height=792)
+            page.insert_text((72, 60), "Maintenance manual", fontsize=14)
+            rect = fitz.Rect(72, 100, 540, 460)
+            if kind == "photo":
+                page.insert_image(rect, stream=photo(rng))
+            else:
+                page.insert_image(rect, pixmap=diagram(rng) if kind == "diagram" else screenshot(rng))
+            kinds.append(kind)
+    doc.save(path, deflate=True)
+    doc.close()
+    return kinds
+
+
+def renders(path):
+    with fitz.open(path) as doc:
+        return [np.frombuffer(page.get_pixmap(dpi=100).samples, np.uint8).astype(np.int16) for page in doc]
+
+
+def filters(path):
+    with fitz.open(path) as doc:
+        out = []
+        for page in doc:
+            xref = page.get_images()[0][0]
+            indexed = "Indexed" in doc.xref_get_key(xref, "ColorSpace")[1]
+            out.append("indexed" if indexed else doc.xref_get_key(xref, "Filter")[1])
+        return out
+
+
+def compress(src, work_dir, name, quality):
+    path = os.path.join(work_dir, name)
+    shutil.copyfile(src, path)
+    t0 = time.perf_counter()
+    out = run_iterative_pdf_compression(path, quality, workers=1)
+    return out, time.perf_counter() - t0
+
+
+if __name__ == "__main__":
+    chapters = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+    quality = int(sys.argv[2]) if len(sys.argv) > 2 else 70
+    work_dir = tempfile.mkdtemp(prefix="palette-bench-")
+    is_flat = pdf_agent._is_flat
+    try:
+        src = os.path.join(work_dir, "manual.pdf")
+        kinds = build(src, chapters)
+        print(f"Input: {len(kinds)} pages, {os.path.getsize(src) / 1024:.0f} KB, quality={quality}")
+        reference = renders(src)
+        results = {}
+        for mode in ("jpeg", "palette"):
+            pdf_agent._is_flat = is_flat if mode == "palette" else (lambda pix: False)
+            out, t = compress(src, work_dir, f"{mode}.pdf", quality)
+            errors = [np.abs(a - b).mean() for a, b in zip(reference, renders(out))]
+            flat_error = np.mean([e for e, k in zip(errors, kinds) if k != "photo"])
+            results[mode] = (os.path.getsize(out), flat_error, filters(out))
+            print(f"{mode:8s} {os.path.getsize(out) / 1024:7.0f} KB in {t:5.2f}s | mean pixel error on diagrams {flat_error:.2f}")
+        size, error, stored = results["palette"]
+        for kind in ("diagram", "screenshot", "photo"):
+            print(f"   {kind:10s} stored as {sorted({f for k, f in zip(kinds, stored) if k == kind})}")
+        ok = all(f != "indexed" for k, f in zip(kinds, stored) if k == "photo")
+        ok &= size <= results["jpeg"][0] and error <= max(results["jpeg"][1], VISUALLY_LOSSLESS)
+        print("PASS" if ok else "FAIL")
+        sys.exit(0 if ok else 1)
+    finally:
+        pdf_agent._is_flat = is_flat
+        shutil.rmtree(work_dir, ignore_errors=True)
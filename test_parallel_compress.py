@@ -0,0 +1,69 @@
+import os
+import re
+import sys
+import time
+import shutil
+import tempfile
+import fitz
+import numpy as np
+
+# Serial vs parallel XREF recompression in run_iterative_pdf_compression.
+# Builds a scanned-book style PDF (one full-page image per page), compresses it with
+# workers=1 and workers=N, checks the outputs are byte-identical and prints the speedup.
+# The trailer /ID is excluded: MuPDF randomises it on every save, serial runs included.
+#   python test_parallel_compress.py [pages] [workers]
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+from app.pdf_agent import run_iterative_pdf_compression
+
+
+def build_scanned_pdf(path, pages):
+    rng = np.random.default_rng(42)
+    doc = fitz.open()
+    for i in range(pages):
+        # Paper-grain noise over a gradient so every page is a distinct, poorly compressible scan
+        h, w = 2200, 1700
+        base = np.linspace(180, 250, w, dtype=np.float32)[None, :, None]
+        noise = rng.normal(0, 18, (h, w, 3)).astype(np.float32)
+        pixels = np.clip(base + noise, 0, 255).astype(np.uint8)
+        pix = fitz.Pixmap(fitz.csRGB, w, h, pixels.tobytes(), False)
+        page = doc.new_page(width=612, height=792)
+        page.insert_image(page.rect, stream=pix.tobytes("jpeg", jpg_quality=95))
+        page.insert_text((72, 72), f"Page {i + 1}", fontsize=14)
+    doc.save(path)
+    doc.close()
+
+
+def without_trailer_id(data):
+    # MuPDF writes /ID[<..><..>], qpdf (linearized output) /ID [<..> <..>]
+    return re.sub(rb"/ID\s*\[\s*<[0-9A-Fa-f]+>\s*<[0-9A-Fa-f]+>\s*\]", b"/ID[]", data)
+
+
+def timed_compress(src, work_dir, name, quality, workers):
+    path = os.path.join(work_dir, name)
+    shutil.copyfile(src, path)
+    t0 = time.perf_counter()
+    out = run_iterative_pdf_compression(path, quality, workers=workers)
+    return time.perf_counter() - t0, without_trailer_id(open(out, "rb").read())
+
+
+if __name__ == "__main__":
+    pages = int(sys.argv[1]) if len(sys.argv) > 1 else 48
+    workers = int(sys.argv[2]) if len(sys.argv) > 2 else (os.cpu_count() or 1)
+    work_dir = tempfile.mkdtemp(prefix="xref-bench-")
+    try:
+        src = os.path.join(work_dir, "book.pdf")
+        build_scanned_pdf(src, pages)
+        print(f"Input: {pages} pages, {os.path.getsize(src) / 1024 / 1024:.1f} MB, {os.cpu_count()} CPUs")
+        for quality in (40, 70):
+            serial_t, serial_out = timed_compress(src, work_dir, f"serial_{quality}.pdf", quality, 1)
+            par_t, par_out = timed_compress(src, work_dir, f"parallel_{quality}.pdf", quality, workers)
+            same = serial_out == par_out
+            print(f"quality={quality}: serial {serial_t:.2f}s | {workers} workers {par_t:.2f}s | "
+                  f"speedup {serial_t / par_t:.2f}x | output {len(par_out) / 1024:.0f} KB | identical={same}")
+            if not same:
+                print("FAIL")
+                sys.exit(1)
+        print("PASS")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
@@ -0,0 +1,78 @@
+import os
+import sys
+import time
+import shutil
+import tempfile
+import fitz
+from pdf2docx import Converter
+
+# pdf-to-word progress with pdf2docx multiprocessing left on: converts a text-heavy
+# document once without a progress callback (the sync endpoint) and once with one (the
+# job API). The job run must report page progress that rises through the parsing phase
+# and ends at the page count, go through pdf2docx's multiprocessing path like the plain
+# run, and not be meaningfully slower (timings are noisy on one core, hence the margin).
+#   python test_pdf_to_word_progress.py [pages]
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+from app.pdf_agent import pdf_to_word
+
+MAX_SLOWDOWN = 1.5
+
+
+def build(path, pages):
+    doc = fitz.open()
+    for i in range(pages):
+        page = doc.new_page(width=612, height=792)
+        page.insert_text((72, 60), f"Chapter {i + 1}", fontsize=16)
+        for line in range(40):
+            page.insert_text((72, 90 + line * 16), f"Line {line + 1} of page {i + 1}: the quick brown fox jumps.", fontsize=10)
+    doc.save(path)
+    doc.close()
+
+
+def convert(src, work_dir, name, progress=None):
+    path = os.path.join(work_dir, name)
+    shutil.copyfile(src, path)
+    t0 = time.perf_counter()
+    out = pdf_to_word(path, progress=progress)
+    return out, time.perf_counter() - t0
+
+
+def record_multiprocessing(calls):
+    original = Converter._convert_with_multi_processing
+
+    def wrapped(self, *args, **kwargs):
+        calls.append(self.filename_pdf)
+        return original(self, *args, **kwargs)
+
+    Converter._convert_with_multi_processing = wrapped
+
+
+if __name__ == "__main__":
+    pages = int(sys.argv[1]) if len(sys.argv) > 1 else 60
+    work_dir = tempfile.mkdtemp(prefix="pdf-to-word-")
+    cwd = os.getcwd()
+    try:
+        # pdf2docx's parsing processes write their page JSON to the working directory
+        os.chdir(work_dir)
+        src = os.path.join(work_dir, "book.pdf")
+        build(src, pages)
+        multi = []
+        record_multiprocessing(multi)
+        plain, plain_t = convert(src, work_dir, "plain.pdf")
+        calls = []
+        job, job_t = convert(src, work_dir, "job.pdf", lambda done, total: calls.append((done, total)))
+        done = [d for d, _ in calls]
+        intermediate = [d for d in done if 0 < d < pages]
+        print(f"{pages} pages: plain {plain_t:.2f}s, with progress {job_t:.2f}s ({job_t / plain_t:.2f}x)")
+        print(f"multiprocessing runs: {[os.path.basename(path) for path in multi]}")
+        print(f"progress calls {len(calls)}: {done[:6]}{' ...' if len(done) > 6 else ''} {done[-1] if done else None}")
+        ok = os.path.getsize(job) > 0 and os.path.getsize(plain) > 0
+        ok &= done == sorted(done) and done[-1] == pages and all(t == pages for _, t in calls)
+        ok &= len(intermediate) >= 2 and job_t <= plain_t * MAX_SLOWDOWN
+        ok &= [os.path.basename(path) for path in multi] == ["plain.pdf", "job.pdf"]
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(work_dir, ignore_errors=True)
+    print("PASS" if ok else "FAIL")
+    sys.exit(0 if ok else 1)
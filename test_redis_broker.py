@@ -0,0 +1,158 @@
+import os
+import sys
+import types
+import asyncio
+
+# RedisTransport through PubSubBroker, two "workers" (one transport each) sharing rooms.
+# Checks that a worker keeps receiving after its last room leaves and a new one joins,
+# and after a dropped connection. Runs against a real Redis when REDIS_URL is set and
+# the redis package is installed; otherwise against an in-memory fake that keeps the
+# redis-py pub/sub semantics that matter here: listen() ends once nothing is
+# subscribed, get_message() returns None on timeout, a broken connection raises.
+#   REDIS_URL=redis://localhost:6379/0 python test_redis_broker.py
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+
+
+class FakeServer:
+    def __init__(self):
+        self.pubsubs = []
+
+
+class FakePubSub:
+    def __init__(self, server):
+        self.server = server
+        self.channels = set()
+        self.queue = asyncio.Queue()
+        self.connected = False
+        server.pubsubs.append(self)
+
+    @property
+    def subscribed(self):
+        return bool(self.channels)
+
+    async def subscribe(self, *channels):
+        self.connected = True
+        for channel in channels:
+            self.channels.add(channel)
+            self.queue.put_nowait({"type": "subscribe", "channel": channel.encode(), "data": len(self.channels)})
+
+    async def unsubscribe(self, *channels):
+        for channel in channels:
+            self.channels.discard(channel)
+            self.queue.put_nowait({"type": "unsubscribe", "channel": channel.encode(), "data": len(self.channels)})
+
+    async def listen(self):
+        while self.subscribed:
+            yield await self.queue.get()
+
+    async def get_message(self, ignore_subscribe_messages=False, timeout=0.0):
+        if not self.connected:
+            raise RuntimeError("pubsub connection not set: did you forget to call subscribe()?")
+        try:
+            message = await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+        if isinstance(message, Exception):
+            raise message
+        if ignore_subscribe_messages and message["type"] != "message":
+            return None
+        return message
+
+    def drop_connection(self):
+        # Fails the read in progress, like a reset socket under redis-py
+        self.queue.put_nowait(ConnectionError("Connection reset by peer"))
+
+    async def close(self):
+        self.server.pubsubs.remove(self)
+
+
+class FakeRedis:
+    def __init__(self, server):
+        self.server = server
+
+    def pubsub(self):
+        return FakePubSub(self.server)
+
+    async def ping(self):
+        return True
+
+    async def publish(self, channel, data):
+        targets = [p for p in self.server.pubsubs if channel in p.channels]
+        for target in targets:
+            target.queue.put_nowait({"type": "message", "channel": channel.encode(), "data": data})
+        return len(targets)
+
+    async def close(self):
+        pass
+
+
+def install_fake_redis():
+    server = FakeServer()
+    package, module = types.ModuleType("redis"), types.ModuleType("redis.asyncio")
+    module.from_url = lambda url: FakeRedis(server)
+    package.asyncio = module
+    sys.modules["redis"], sys.modules["redis.asyncio"] = package, module
+
+
+async def expect(inbox, frame, timeout=5):
+    try:
+        return await asyncio.wait_for(inbox.get(), timeout) == frame
+    except asyncio.TimeoutError:
+        return False
+
+
+async def main(url):
+    from app import room_broker
+    from app.room_broker import PubSubBroker, RedisTransport
+    room_broker.REDIS_RETRY_S = 0.05
+    workers = [PubSubBroker(RedisTransport(url)) for _ in range(2)]
+    for broker in workers:
+        await broker.start()
+    inbox = asyncio.Queue()
+
+    async def deliver(kind, payload):
+        await inbox.put((kind, payload))
+
+    ok = True
+    try:
+        # Receiver on worker 1, sender publishes from worker 0
+        await workers[1].join("room-a", "receiver", deliver)
+        await workers[0].publish("room-a", "receiver", "text", "hello")
+        first = await expect(inbox, ("text", "hello"))
+        print(f"first room delivered={first}")
+
+        # The worker's last room leaves, then a new room joins on the same worker
+        await workers[1].leave("room-a", "receiver", deliver)
+        await asyncio.sleep(0.2)
+        await workers[1].join("room-b", "receiver", deliver)
+        await workers[0].publish("room-b", "receiver", "bytes", b"\x00chunk")
+        after_empty = await expect(inbox, ("bytes", b"\x00chunk"))
+        print(f"room joined after the last one left delivered={after_empty}")
+
+        # A dropped connection while reading
+        pubsub = workers[1].transport.pubsub
+        if hasattr(pubsub, "drop_connection"):
+            pubsub.drop_connection()
+            await asyncio.sleep(0.1)
+        await workers[0].publish("room-b", "receiver", "json", {"type": "ping"})
+        after_error = await expect(inbox, ("json", {"type": "ping"}))
+        print(f"frame after a read error delivered={after_error}")
+        ok = first and after_empty and after_error
+    finally:
+        for broker in workers:
+            await broker.stop()
+    print("PASS" if ok else "FAIL")
+    return ok
+
+
+if __name__ == "__main__":
+    url = os.getenv("REDIS_URL", "")
+    try:
+        import redis.asyncio  # noqa: F401
+    except ImportError:
+        url = ""
+    if not url:
+        print("No REDIS_URL or redis package: using the in-memory fake")
+        install_fake_redis()
+    sys.exit(0 if asyncio.run(main(url or "redis://fake")) else 1)
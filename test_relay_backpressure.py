@@ -0,0 +1,89 @@
+import os
+import sys
+import json
+import time
+import asyncio
+import subprocess
+import urllib.request
+import websockets
+
+# /ws/drop relay fallback under a slow receiver: the sender pushes 48 MB as fast as it
+# can while the receiver pauses between reads. Every chunk must arrive, in order, and the
+# sender should see relay-credit pause/resume signals instead of silent drops.
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "backend"))
+PORT = 8103
+CHUNK = 256 * 1024
+COUNT = 192
+
+
+async def wait_for_port(port, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            _, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.close()
+            return
+        except OSError:
+            await asyncio.sleep(0.2)
+    raise RuntimeError(f"worker on {port} did not start")
+
+
+async def main():
+    env = dict(os.environ, EXECUTOR_BACKEND="thread", RELAY_QUEUE_MAX_MB="4")
+    worker = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(PORT), "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        await wait_for_port(PORT)
+        room = "backpressure42"
+        base = f"ws://127.0.0.1:{PORT}/ws/drop/{room}"
+        async with websockets.connect(f"{base}/receiver", max_size=None) as receiver, \
+                   websockets.connect(f"{base}/sender", max_size=None) as sender:
+            signals = []
+
+            async def watch_sender():
+                async for msg in sender:
+                    if isinstance(msg, str) and "relay-credit" in msg:
+                        signals.append(json.loads(msg)["paused"])
+
+            watcher = asyncio.create_task(watch_sender())
+            chunks = [i.to_bytes(4, "big") + os.urandom(CHUNK - 4) for i in range(COUNT)]
+
+            async def produce():
+                for chunk in chunks:
+                    await sender.send(chunk)
+
+            async def consume():
+                got = []
+                while len(got) < COUNT:
+                    msg = await asyncio.wait_for(receiver.recv(), 30)
+                    if isinstance(msg, bytes):
+                        got.append(msg)
+                        if len(got) % 16 == 0:
+                            await asyncio.sleep(0.05)  # slow reader
+                return got
+
+            t0 = time.time()
+            _, received = await asyncio.gather(produce(), consume())
+            elapsed = time.time() - t0
+
+            with urllib.request.urlopen(f"http://127.0.0.1:{PORT}/api/relay/stats") as r:
+                stats = json.load(r)["rooms"].get(room, {})
+            watcher.cancel()
+
+        mb = COUNT * CHUNK / 1024 / 1024
+        ok = received == chunks
+        print(f"Relayed {COUNT} chunks ({mb:.0f} MB) in {elapsed:.2f}s = {mb / elapsed:.1f} MB/s, intact={ok}")
+        print(f"Credit signals seen by sender: {signals.count(True)} pause / {signals.count(False)} resume")
+        peak = stats.get("clients", {}).get("receiver", {}).get("peak_queue_bytes", 0)
+        print(f"Receiver peak queue: {peak / 1024 / 1024:.1f} MB, room rate {stats.get('bytes_per_sec', 0) / 1024 / 1024:.1f} MB/s")
+        print("PASS" if ok else "FAIL")
+    finally:
+        worker.terminate()
+        worker.wait()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,80 @@
+import os
+import sys
+import shutil
+import tempfile
+
+# Result cache on its own directory: keys change with the op version and with
+# RESULT_CACHE_VERSION, so entries written by older code are never served; params are
+# order-independent; stores never leave partial files behind; the least recently used
+# entry is evicted first once max_bytes is exceeded (a lookup refreshes an entry); and
+# a second ResultCache on the same directory (another uvicorn worker, or a restart)
+# serves what the first one stored.
+#   python test_result_cache.py
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+from app import result_cache as rc
+from app.result_cache import ResultCache, OP_VERSIONS
+
+ENTRY_BYTES = 1000
+
+
+def write(path, fill):
+    with open(path, "wb") as f:
+        f.write(fill * ENTRY_BYTES)
+    return path
+
+
+if __name__ == "__main__":
+    work_dir = tempfile.mkdtemp(prefix="result-cache-")
+    ok = True
+    try:
+        cache = ResultCache(os.path.join(work_dir, "cache"), max_bytes=3 * ENTRY_BYTES)
+        src = write(os.path.join(work_dir, "out.pdf"), b"a")
+
+        # Versioned keys
+        key = ResultCache.make_key("compress-pdf", "h", {"q": 50, "bilevel": False})
+        same = key == ResultCache.make_key("compress-pdf", "h", {"bilevel": False, "q": 50})
+        OP_VERSIONS["compress-pdf"] += 1
+        op_bumped = ResultCache.make_key("compress-pdf", "h", {"q": 50, "bilevel": False})
+        OP_VERSIONS["compress-pdf"] -= 1
+        rc.RESULT_CACHE_VERSION, saved = rc.RESULT_CACHE_VERSION + "x", rc.RESULT_CACHE_VERSION
+        all_bumped = ResultCache.make_key("compress-pdf", "h", {"q": 50, "bilevel": False})
+        rc.RESULT_CACHE_VERSION = saved
+        print(f"keys: param order ignored={same}, op bump changes key={op_bumped != key}, "
+              f"cache bump changes key={all_bumped != key}")
+        ok &= same and op_bumped != key and all_bumped != key
+
+        # Round trip, miss after a version bump, no temp files left
+        stored = cache.put_file("compress-pdf", "h", {"q": 50}, src)
+        hit = cache.get_file("compress-pdf", "h", {"q": 50})
+        OP_VERSIONS["compress-pdf"] += 1
+        stale = cache.get_file("compress-pdf", "h", {"q": 50})
+        OP_VERSIONS["compress-pdf"] -= 1
+        cache.put_json("compress-pdf-report", "h", {"q": 50}, {"coverage": 1.0})
+        report = cache.get_json("compress-pdf-report", "h", {"q": 50})
+        leftovers = [n for n in os.listdir(cache.cache_dir) if n.startswith(".incoming-")]
+        print(f"round trip: hit={hit == stored}, after op bump={stale}, json={report}, temp files={leftovers}")
+        ok &= hit == stored and open(hit, "rb").read() == b"a" * ENTRY_BYTES
+        ok &= stale is None and report == {"coverage": 1.0} and not leftovers
+
+        # LRU: touch the oldest, then overflow; the untouched one goes
+        cache = ResultCache(os.path.join(work_dir, "lru"), max_bytes=3 * ENTRY_BYTES)
+        for name in "abc":
+            cache.put_file("compress-pdf", name, {}, write(os.path.join(work_dir, f"{name}.pdf"), name.encode()))
+        cache.get_file("compress-pdf", "a", {})
+        cache.put_file("compress-pdf", "d", {}, write(os.path.join(work_dir, "d.pdf"), b"d"))
+        present = "".join(n for n in "abcd" if cache.get_file("compress-pdf", n, {}))
+        stats = cache.stats()
+        print(f"lru: present {present}, {stats['bytes']} of {stats['max_bytes']} bytes, evictions {stats['evictions']}")
+        ok &= present == "acd" and stats["evictions"] == 1 and stats["bytes"] <= stats["max_bytes"]
+        ok &= len(os.listdir(cache.cache_dir)) == 3
+
+        # Shared directory: a second instance finds the entries
+        other = ResultCache(cache.cache_dir, max_bytes=3 * ENTRY_BYTES)
+        shared = other.get_file("compress-pdf", "d", {})
+        print(f"second instance: {other.stats()['entries']} entries, hit={shared is not None}")
+        ok &= shared is not None and open(shared, "rb").read() == b"d" * ENTRY_BYTES
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    print("PASS" if ok else "FAIL")
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,77 @@
+import os
+import re
+import sys
+import time
+import shutil
+import tempfile
+import subprocess
+import requests
+from test_compress_cache_headers import build, wait_for_port
+
+# Stage spans through the process pool: a compression with X-Debug-Timing: 1 must come
+# back with a Server-Timing header naming the agent's stages (recorded in a pool worker
+# and merged into the request's trace), each no longer than the request itself; the same
+# request without the header gets none; and /metrics must count the stages of both
+# requests in pdfninja_stage_duration_seconds.
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "backend"))
+PORT = 8109
+BASE = f"http://127.0.0.1:{PORT}"
+STAGES = ("compress.decode", "compress.jpeg_encode", "compress.save")
+TIMING = re.compile(r'([\w.]+);dur=([0-9.]+);desc="x(\d+)"')
+
+
+def post(path, quality, device, debug):
+    headers = {"X-Debug-Timing": "1"} if debug else {}
+    with open(path, "rb") as f:
+        t0 = time.perf_counter()
+        response = requests.post(f"{BASE}/api/compress-pdf", files={"file": ("report.pdf", f, "application/pdf")},
+                                 data={"quality": str(quality), "deviceId": device}, headers=headers, timeout=300)
+    response.raise_for_status()
+    return response.headers.get("Server-Timing"), (time.perf_counter() - t0) * 1000
+
+
+if __name__ == "__main__":
+    work_dir = tempfile.mkdtemp(prefix="tracing-")
+    src = os.path.join(work_dir, "report.pdf")
+    build(src)
+    env = dict(os.environ, EXECUTOR_BACKEND="process", RESULT_CACHE_DIR=os.path.join(work_dir, "cache"),
+               USAGE_DB_PATH=os.path.join(work_dir, "usage.db"), WORKSPACE_ROOT=os.path.join(work_dir, "work"))
+    env.pop("TRACE_RESPONSE_HEADER", None)
+    worker = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(PORT), "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    ok = True
+    try:
+        wait_for_port(PORT, timeout=180)
+        timing, wall_ms = post(src, 60, "tracing-debug", debug=True)
+        stages = {name: (float(ms), int(count)) for name, ms, count in TIMING.findall(timing or "")}
+        for name, (ms, count) in stages.items():
+            print(f"   {name:24s} {ms:8.1f} ms x{count}")
+        print(f"request {wall_ms:.0f} ms, {len(stages)} stages")
+        ok &= all(name in stages for name in STAGES) and all(ms <= wall_ms for ms, _ in stages.values())
+
+        # Different slider: a cache hit would run no stages at all
+        plain, _ = post(src, 40, "tracing-plain", debug=False)
+        print(f"without X-Debug-Timing: Server-Timing {plain!r}")
+        ok &= plain is None
+
+        # The middleware records a trace once the response's background cleanup is done
+        for _ in range(50):
+            metrics = requests.get(f"{BASE}/metrics", timeout=10).text
+            counts = {}
+            for name in STAGES:
+                match = re.search(rf'pdfninja_stage_duration_seconds_count{{stage="{re.escape(name)}"}} (\d+)', metrics)
+                counts[name] = int(match.group(1)) if match else 0
+            if all(count == 2 for count in counts.values()):
+                break
+            time.sleep(0.1)
+        print(f"/metrics stage counts {counts}")
+        ok &= all(count == 2 for count in counts.values())
+    finally:
+        worker.terminate()
+        worker.wait()
+        shutil.rmtree(work_dir, ignore_errors=True)
+    print("PASS" if ok else "FAIL")
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,85 @@
+import os
+import sys
+import time
+import shutil
+import tempfile
+import fitz
+import numpy as np
+
+# Strategy race (strategy="auto"): a 3-page report, which the race samples whole, and a
+# 12-page one, which it samples at 4 pages. Prints the race report per document and
+# checks every registered strategy is reported, no more candidates ran at once than
+# the job's share of the cores and together they were allowed no more than that share
+# for their own fan-out, the winner is eligible (or the default fallback), and
+# that a whole-document race keeps the winner's output (outline included) instead of
+# compressing the file a second time. The races run as a pdf pool worker would, with
+# half the cores as the job's share.
+#   python test_strategy_race.py [quality]
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+from app.compress_strategies import STRATEGIES, DEFAULT_STRATEGY, compress_pdf_auto
+from app.executor import CPU_COUNT, cpu_share, set_cpu_share
+
+
+def photo(rng, w=1600, h=1200):
+    base = np.linspace(40, 210, w, dtype=np.float32)[None, :, None] * np.array([1.0, 0.8, 0.6], np.float32)
+    pixels = np.clip(base + rng.normal(0, 12, (h, w, 3)), 0, 255).astype(np.uint8)
+    return fitz.Pixmap(fitz.csRGB, w, h, pixels.tobytes(), False).tobytes("jpeg", jpg_quality=92)
+
+
+def build(path, pages):
+    rng = np.random.default_rng(19)
+    doc = fitz.open()
+    for i in range(pages):
+        page = doc.new_page(width=612, height=792)
+        page.insert_text((72, 60), f"Quarterly report, page {i + 1}", fontsize=14)
+        page.insert_image(fitz.Rect(72, 90, 540, 440), stream=photo(rng))
+        for line in range(12):
+            page.insert_text((72, 470 + line * 16), "Revenue grew in every region this quarter. " * 2, fontsize=9)
+    doc.set_toc([[1, f"Page {i + 1}", i + 1] for i in range(pages)])
+    doc.save(path, deflate=True)
+    doc.close()
+
+
+def check(report, out, pages, elapsed):
+    ok = sorted(row["strategy"] for row in report["candidates"]) == sorted(STRATEGIES)
+    ok &= report["concurrency"] <= cpu_share()
+    shares = [row["cpu_share"] for row in report["candidates"] if row["status"] == "ok"]
+    ok &= bool(shares) and max(shares) * report["concurrency"] <= cpu_share()
+    winner = next(row for row in report["candidates"] if row["strategy"] == report["winner"])
+    ok &= winner["eligible"] or report["winner"] == DEFAULT_STRATEGY
+    ok &= report["output_bytes"] == os.path.getsize(out)
+    with fitz.open(out) as doc:
+        ok &= len(doc) == pages
+        # Outline survives when kept from the race (the slider keeps it above 50)
+        if report["output_kept"]:
+            ok &= len(doc.get_toc()) == pages
+    for row in report["candidates"]:
+        print(f"   {row['strategy']:12s} {row['status']:8s} "
+              f"{row.get('projected_bytes', 0) / 1024:7.0f} KB ssim {row.get('ssim', '-')} eligible={row['eligible']}")
+    print(f"   candidate cpu_share {max(shares, default=0)} of {cpu_share()}")
+    print(f"   winner {report['winner']}, {report['concurrency']} at a time, race {report['race_seconds']:.2f}s, "
+          f"total {elapsed:.2f}s, output kept={report['output_kept']}")
+    return ok
+
+
+if __name__ == "__main__":
+    quality = int(sys.argv[1]) if len(sys.argv) > 1 else 70
+    set_cpu_share(CPU_COUNT // 2)
+    work_dir = tempfile.mkdtemp(prefix="race-bench-")
+    try:
+        ok = True
+        for pages, whole in ((3, True), (12, False)):
+            src = os.path.join(work_dir, f"report-{pages}.pdf")
+            build(src, pages)
+            t0 = time.perf_counter()
+            out, report = compress_pdf_auto(src, quality)
+            elapsed = time.perf_counter() - t0
+            print(f"{pages} pages, {os.path.getsize(src) / 1024:.0f} KB -> {report['output_bytes'] / 1024:.0f} KB "
+                  f"({report['sample_pages']}/{report['total_pages']} pages raced)")
+            ok &= check(report, out, pages, elapsed)
+            ok &= report["output_kept"] == whole and (report["sample_pages"] == pages) == whole
+        print("PASS" if ok else "FAIL")
+        sys.exit(0 if ok else 1)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
@@ -0,0 +1,137 @@
+import os
+import sys
+import time
+import shutil
+import tempfile
+import fitz
+import numpy as np
+from PIL import ImageCms
+
+# Structural slimming on a vector-heavy PDF with almost no image data: vector pages that
+# carry page thumbnails, an unused image resource, Illustrator-style /PieceInfo, XMP,
+# a JavaScript OpenAction, an embedded file and one ICC profile copy per image. Prints
+# the per-category report at quality 40 and 70 and checks that the pages still render
+# the same and that JavaScript and attachments survive above quality 50.
+# Then times slimming on a long text-only file with nothing to slim (every page names
+# only the fonts it uses): the content sanitizer must not run, and the pass must stay a
+# small share of the compression's wall time.
+#   python test_structural_slimming.py [pages] [text_pages]
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+from app.pdf_agent import run_iterative_pdf_compression, slim_structure
+
+MAX_TEXT_SLIM_SHARE = 0.4
+
+XMP = '<?xpacket begin="" id="W5M0MpCehiHzreSzNTczkc9d"?><x:xmpmeta xmlns:x="adobe:ns:meta/">{}</x:xmpmeta><?xpacket end="w"?>'
+
+
+def stream_object(doc, source, data):
+    xref = doc.get_new_xref()
+    doc.update_object(xref, source)
+    doc.update_stream(xref, data)
+    return xref
+
+
+def noise_jpeg(rng, w, h, quality=80):
+    pixels = rng.integers(0, 255, (h, w, 3), dtype=np.uint8)
+    return fitz.Pixmap(fitz.csRGB, w, h, pixels.tobytes(), False).tobytes("jpeg", jpg_quality=quality)
+
+
+def build(path, pages):
+    rng = np.random.default_rng(3)
+    icc = ImageCms.ImageCmsProfile(ImageCms.createProfile("sRGB")).tobytes()
+    doc = fitz.open()
+    for i in range(pages):
+        page = doc.new_page(width=612, height=792)
+        shape = page.new_shape()
+        for _ in range(300):
+            x, y = rng.uniform(40, 560), rng.uniform(60, 740)
+            shape.draw_line((x, y), (x + rng.uniform(-30, 30), y + rng.uniform(-30, 30)))
+        shape.finish(color=(0.2, 0.3, 0.6), width=0.6)
+        shape.commit()
+        page.insert_text((72, 40), f"Drawing sheet {i + 1}", fontsize=14)
+        # A small logo with its own copy of the sRGB profile
+        logo = noise_jpeg(rng, 48, 48, 40)
+        xref = page.insert_image(fitz.Rect(500, 20, 548, 68), stream=logo)
+        profile = stream_object(doc, "<</N 3>>", icc)
+        doc.xref_set_key(xref, "ColorSpace", f"[/ICCBased {profile} 0 R]")
+        thumb = stream_object(doc, "<</Type/XObject/Subtype/Image/Width 76/Height 99/ColorSpace/DeviceRGB/BitsPerComponent 8/Filter/DCTDecode>>", b"")
+        doc.update_stream(thumb, noise_jpeg(rng, 76, 99), compress=False)
+        doc.xref_set_key(page.xref, "Thumb", f"{thumb} 0 R")
+        private = stream_object(doc, "<<>>", rng.integers(0, 255, 60_000, dtype=np.uint8).tobytes())
+        doc.xref_set_key(page.xref, "PieceInfo", f"<</Illustrator<</Private {private} 0 R>>>>")
+        unused = stream_object(doc, "<</Type/XObject/Subtype/Image/Width 120/Height 120/ColorSpace/DeviceRGB/BitsPerComponent 8/Filter/DCTDecode>>", b"")
+        doc.update_stream(unused, noise_jpeg(rng, 120, 120), compress=False)
+        kind, value = doc.xref_get_key(page.xref, "Resources")
+        resources, key = (int(value.split()[0]), "XObject/Unused") if kind == "xref" else (page.xref, "Resources/XObject/Unused")
+        doc.xref_set_key(resources, key, f"{unused} 0 R")
+    doc.set_xml_metadata(XMP.format("<rdf:Description>" + "history " * 4000 + "</rdf:Description>"))
+    doc.xref_set_key(doc.pdf_catalog(), "OpenAction", "<</S/JavaScript/JS(app.alert\\('hello'\\);)>>")
+    doc.embfile_add("drawing-data.bin", rng.integers(0, 255, 150_000, dtype=np.uint8).tobytes())
+    doc.save(path, garbage=1)
+    doc.close()
+
+
+def build_text(path, pages):
+    # One content stream per line, like page.insert_text output from report generators
+    doc = fitz.open()
+    for i in range(pages):
+        page = doc.new_page(width=612, height=792)
+        for line in range(44):
+            page.insert_text((72, 60 + line * 16), f"Page {i} line {line}: " + "lorem ipsum dolor sit amet " * 3,
+                             fontsize=9, fontname=("helv", "tiro", "cour")[line % 3])
+    doc.save(path)
+    doc.close()
+
+
+def renders(path):
+    with fitz.open(path) as doc:
+        return [np.frombuffer(page.get_pixmap(dpi=50, colorspace=fitz.csGRAY).samples, np.uint8) for page in doc]
+
+
+if __name__ == "__main__":
+    pages = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    text_pages = int(sys.argv[2]) if len(sys.argv) > 2 else 400
+    work_dir = tempfile.mkdtemp(prefix="slim-bench-")
+    try:
+        src = os.path.join(work_dir, "drawings.pdf")
+        build(src, pages)
+        print(f"Input: {pages} vector pages, {os.path.getsize(src) / 1024:.0f} KB")
+        reference = renders(src)
+        ok = True
+        for quality in (40, 70):
+            path = os.path.join(work_dir, f"q{quality}.pdf")
+            shutil.copyfile(src, path)
+            report = {}
+            t0 = time.perf_counter()
+            out = run_iterative_pdf_compression(path, quality, report=report)
+            elapsed = time.perf_counter() - t0
+            print(f"quality={quality}: {os.path.getsize(out) / 1024:.0f} KB in {elapsed:.2f}s")
+            for row in report.get("structure", []):
+                print(f"   {row['category']:15s} {row['changes']:4d} changes {row['objects']:4d} objects "
+                      f"{row['bytes'] / 1024:8.1f} KB {row['ms']:8.1f} ms")
+            # Vector content is untouched; only the 48 px logo may be recompressed
+            worst = max(np.abs(a.astype(int) - b.astype(int)).mean() for a, b in zip(reference, renders(out)))
+            with fitz.open(out) as doc:
+                kept_js = "JavaScript" in doc.xref_object(doc.pdf_catalog())
+                kept_files = doc.embfile_count() > 0
+            print(f"   worst page mean pixel diff {worst:.2f}, JavaScript kept={kept_js}, attachments kept={kept_files}")
+            ok &= worst < 1.0 and kept_js == kept_files == (quality > 50)
+
+        text = os.path.join(work_dir, "text.pdf")
+        build_text(text, text_pages)
+        with fitz.open(text) as doc:
+            t0 = time.perf_counter()
+            rows = slim_structure(doc)
+            slim_s = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        out = run_iterative_pdf_compression(text, 50)
+        elapsed = time.perf_counter() - t0
+        share = slim_s / elapsed
+        print(f"text: {text_pages} pages, {os.path.getsize(text) / 1024:.0f} KB -> {os.path.getsize(out) / 1024:.0f} KB "
+              f"in {elapsed:.2f}s, slimming {slim_s:.2f}s ({share:.0%}), categories changed: {[r['category'] for r in rows]}")
+        ok &= not rows and share < MAX_TEXT_SLIM_SHARE
+        print("PASS" if ok else "FAIL")
+        sys.exit(0 if ok else 1)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
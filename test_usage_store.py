@@ -0,0 +1,79 @@
+import os
+import sys
+import json
+import time
+import shutil
+import sqlite3
+import asyncio
+import tempfile
+from datetime import datetime, timedelta
+
+# Usage store on a scratch database: a burst of concurrent increments against a daily
+# limit allows exactly `limit` of them and is group-committed in far fewer transactions
+# than increments; two stores on the same file (two uvicorn workers) still never let
+# the shared counter pass the limit; the database is in WAL mode; prune drops days past
+# the retention window only; and the legacy usage_log.json import keeps the larger of
+# the two counts and renames the file so it runs once.
+#   python test_usage_store.py [requests] [limit]
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+from app.usage_store import UsageStore, today_str
+
+
+def day(offset):
+    return (datetime.now() - timedelta(days=offset)).strftime("%Y-%m-%d")
+
+
+async def burst(stores, key, requests, limit):
+    results = await asyncio.gather(*(
+        stores[i % len(stores)].check_and_increment(key, limit) for i in range(requests)
+    ))
+    return sum(1 for allowed, _ in results if allowed)
+
+
+if __name__ == "__main__":
+    requests = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    limit = int(sys.argv[2]) if len(sys.argv) > 2 else 1500
+    work_dir = tempfile.mkdtemp(prefix="usage-store-")
+    ok = True
+    try:
+        db_path = os.path.join(work_dir, "usage.db")
+        store = UsageStore(db_path, retention_days=30)
+
+        t0 = time.perf_counter()
+        allowed = asyncio.run(burst([store], "ip-device", requests, limit))
+        elapsed = time.perf_counter() - t0
+        print(f"burst: {requests} requests in {elapsed:.2f}s, allowed {allowed}, count {store.get_count('ip-device')}, "
+              f"{store.writes} writes in {store.batches} transactions")
+        ok &= allowed == limit and store.get_count("ip-device") == limit
+        ok &= store.writes == requests and store.batches * 10 <= store.writes
+
+        # Two stores, one file: the limit holds across them
+        other = UsageStore(db_path, retention_days=30)
+        allowed = asyncio.run(burst([store, other], "shared", requests, limit))
+        counts = (store.get_count("shared"), other.get_count("shared"))
+        mode = sqlite3.connect(db_path).execute("PRAGMA journal_mode").fetchone()[0]
+        print(f"two stores: allowed {allowed}, counts {counts}, journal_mode {mode}")
+        ok &= allowed == limit and counts == (limit, limit) and mode == "wal"
+
+        # Retention
+        for offset in (0, 29, 31, 90):
+            store.submit_increment("old", 10, day(offset)).result()
+        store.prune()
+        kept = [offset for offset in (0, 29, 31, 90) if store.get_count("old", day(offset))]
+        print(f"prune: days kept {kept}")
+        ok &= kept == [0, 29]
+
+        # Legacy JSON import: larger count wins, file is renamed
+        legacy = os.path.join(work_dir, "usage_log.json")
+        with open(legacy, "w") as f:
+            json.dump({today_str(): {"ip-device": 3, "legacy-only": 7}, day(1): {"ip-device": 2}}, f)
+        store.import_json(legacy)
+        store.import_json(legacy)
+        imported = (store.get_count("ip-device"), store.get_count("legacy-only"), store.get_count("ip-device", day(1)))
+        print(f"import: {imported}, renamed={os.path.exists(legacy + '.migrated') and not os.path.exists(legacy)}")
+        ok &= imported == (limit, 7, 2) and os.path.exists(legacy + ".migrated") and not os.path.exists(legacy)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    print("PASS" if ok else "FAIL")
+    sys.exit(0 if ok else 1)
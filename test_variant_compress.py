@@ -0,0 +1,68 @@
+import os
+import sys
+import time
+import shutil
+import zipfile
+import tempfile
+import fitz
+
+# Multi-variant compression vs one run_iterative_pdf_compression per slider on the
+# scanned book from test_parallel_compress.py. Every variant in the ZIP must match the
+# separate run byte for byte (trailer /ID aside); prints both timings. A text-only
+# document with nothing left to shrink must get no variant larger than the upload.
+#   python test_variant_compress.py [pages] [sliders]
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+from app.pdf_agent import run_iterative_pdf_compression, compress_pdf_variants, parse_variants
+from test_parallel_compress import build_scanned_pdf, without_trailer_id
+
+
+def build_text(path, pages=3):
+    # Already deflated and without images: re-saving can only add bytes
+    doc = fitz.open()
+    for i in range(pages):
+        page = doc.new_page(width=612, height=792)
+        page.insert_text((72, 72), f"Memo page {i + 1}", fontsize=12)
+    doc.save(path, garbage=4, deflate=True)
+    doc.close()
+
+
+if __name__ == "__main__":
+    pages = int(sys.argv[1]) if len(sys.argv) > 1 else 12
+    sliders = parse_variants(sys.argv[2] if len(sys.argv) > 2 else "low,medium,high")
+    work_dir = tempfile.mkdtemp(prefix="variant-bench-")
+    try:
+        src = os.path.join(work_dir, "book.pdf")
+        build_scanned_pdf(src, pages)
+        print(f"Input: {pages} pages, {os.path.getsize(src) / 1024 / 1024:.1f} MB, sliders {sliders}")
+        path = os.path.join(work_dir, "variants.pdf")
+        shutil.copyfile(src, path)
+        t0 = time.perf_counter()
+        zip_path, report = compress_pdf_variants(path, sliders)
+        variants_t = time.perf_counter() - t0
+
+        ok, separate_t = True, 0.0
+        with zipfile.ZipFile(zip_path) as zipf:
+            for variant in report["variants"]:
+                path = os.path.join(work_dir, f"q{variant['quality']}.pdf")
+                shutil.copyfile(src, path)
+                t0 = time.perf_counter()
+                out = run_iterative_pdf_compression(path, variant["quality"], workers=1)
+                separate_t += time.perf_counter() - t0
+                same = without_trailer_id(open(out, "rb").read()) == without_trailer_id(zipf.read(variant["filename"]))
+                print(f"quality={variant['quality']}: {variant['bytes'] / 1024:8.0f} KB identical={same}")
+                ok &= same
+
+        text = os.path.join(work_dir, "memo.pdf")
+        build_text(text)
+        zip_path, report = compress_pdf_variants(text, sliders)
+        with zipfile.ZipFile(zip_path) as zipf:
+            for variant in report["variants"]:
+                size = len(zipf.read(variant["filename"]))
+                print(f"text q{variant['quality']}: {size} B of {report['input_bytes']} B kept_original={variant['kept_original']}")
+                ok &= size <= report["input_bytes"] == os.path.getsize(text)
+        print(f"One pass {variants_t:.2f}s | separate runs {separate_t:.2f}s | speedup {separate_t / variants_t:.2f}x")
+        print("PASS" if ok else "FAIL")
+        sys.exit(0 if ok else 1)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
@@ -0,0 +1,87 @@
+import os
+import sys
+import time
+import shutil
+import asyncio
+import tempfile
+
+# Workspace lifecycle on a scratch root: release (and the post-response cleanup task)
+# removes a workspace and is idempotent; the orphan sweeper removes stale directories
+# and loose files but leaves active workspaces, young ones and ones held by a live
+# .hold-until marker alone (an expired hold is swept like any orphan); and a file
+# adopted from the result cache survives the cache deleting its copy.
+#   python test_workspace_sweeper.py
+
+ORPHAN_AGE = 60
+os.environ["WORKSPACE_ORPHAN_AGE"] = str(ORPHAN_AGE)
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+from app.workspace import WorkspaceManager
+
+
+def age(path, seconds):
+    then = time.time() - seconds
+    os.utime(path, (then, then))
+
+
+def populate(workspace, name="upload.pdf"):
+    with open(os.path.join(workspace.path, name), "wb") as f:
+        f.write(b"%PDF" * 256)
+
+
+if __name__ == "__main__":
+    work_dir = tempfile.mkdtemp(prefix="workspace-")
+    ok = True
+    try:
+        manager = WorkspaceManager(os.path.join(work_dir, "root"))
+
+        # Release, twice; cleanup task as Starlette would run it
+        first = manager.create()
+        populate(first)
+        manager.release(first)
+        manager.release(first)
+        second = manager.create()
+        populate(second)
+        asyncio.run(manager.cleanup_task(second)())
+        print(f"release: gone={not os.path.exists(first.path) and not os.path.exists(second.path)}, "
+              f"released {manager.released}, bytes freed {manager.bytes_freed}")
+        ok &= not os.path.exists(first.path) and not os.path.exists(second.path)
+        ok &= manager.released == 2 and manager.bytes_freed == 2 * 1024
+
+        # Sweeper
+        active = manager.create()
+        held, expired, orphan, young = (manager.create() for _ in range(4))
+        for workspace in (held, expired, orphan, young):
+            populate(workspace)
+            manager.active.pop(workspace.path)  # another worker's, or a crashed request's
+        manager.hold(held, time.time() + 3600)
+        manager.hold(expired, time.time() - 1)
+        loose = os.path.join(manager.root, "tmpstray.pdf")
+        open(loose, "wb").close()
+        for path in (active.path, held.path, expired.path, orphan.path, loose):
+            age(path, 2 * ORPHAN_AGE)
+        manager.sweep_orphans()
+        expected = {"active": True, "held": True, "young": True, "expired": False, "orphan": False, "loose": False}
+        actual = {
+            "active": os.path.exists(active.path), "held": os.path.exists(held.path),
+            "young": os.path.exists(young.path), "expired": os.path.exists(expired.path),
+            "orphan": os.path.exists(orphan.path), "loose": os.path.exists(loose),
+        }
+        print(f"sweep: {actual}, orphans swept {manager.orphans_swept}")
+        ok &= actual == expected and manager.orphans_swept == 3
+
+        # Adopted files are owned by the workspace
+        cached = os.path.join(work_dir, "cached.pdf")
+        with open(cached, "wb") as f:
+            f.write(b"%PDF-cached")
+        adopted = manager.adopt(active, cached)
+        os.remove(cached)
+        with open(adopted, "rb") as f:
+            survives = f.read() == b"%PDF-cached"
+        print(f"adopt: {os.path.relpath(adopted, manager.root)} survives cache eviction={survives}")
+        ok &= survives and os.path.dirname(adopted) == active.path
+        manager.release(active)
+        ok &= not os.path.exists(adopted)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    print("PASS" if ok else "FAIL")
+    sys.exit(0 if ok else 1)